@@ -0,0 +1,129 @@
+"""
+Coalesce individual feeder advances into rotate_servo_batch frames.
+
+A placement job often pre-advances many feeders at once. Instead of one
+rotate_servo frame (and one bus turnaround) per feeder, AdvanceBatcher
+collects advance() calls issued within a short window and sends them as a
+single batch addressed to every feeder on the bus:
+
+    async with FeederBusClient.open("/dev/ttyACM0") as bus:
+        batcher = AdvanceBatcher(bus, batch_supported=True)
+        await asyncio.gather(*(batcher.advance(address, 500) for address in range(64)))
+
+The current firmware has no rotate_servo_batch handler: an unknown message id
+makes main.zig panic and reboot the feeder into its USB bootloader. Batch
+frames are therefore only sent when batch_supported is set for firmware that
+handles them; by default the collected moves go out as one rotate_servo per
+feeder.
+"""
+import asyncio
+
+import software.codec as codec
+from software.firmware_standin import BROADCAST_ADDRESS
+
+# Moves per batch so a frame (3 byte header + 3 bytes per move) fits in one
+# 64 byte USB packet, the size of the firmware's usb_rx_buff
+MAX_BATCH_MOVES = 20
+
+
+def encode_batches(moves, max_moves=MAX_BATCH_MOVES):
+    """
+    Split (hardware_address, angle) pairs into rotate_servo_batch messages.
+
+    Args:
+        moves (iterable of tuple): (hardware_address, angle) pairs.
+        max_moves (int): Maximum moves per frame.
+
+    Returns:
+        list: rotate_servo_batch messages.
+    """
+    moves = list(moves)
+    return [
+        codec.rotate_servo_batch(BROADCAST_ADDRESS, moves[i:i + max_moves])
+        for i in range(0, len(moves), max_moves)
+    ]
+
+
+class AdvanceBatcher:
+    """
+    Collect advance requests and send them as batch frames.
+
+    Args:
+        bus (FeederBusClient): Started bus client used to send the batches.
+        batch_window (float): Seconds to wait for more requests after the first
+            one of a batch arrives.
+        max_moves (int): Send the batch as soon as it holds this many moves.
+        batch_supported (bool): The firmware handles rotate_servo_batch. Leave
+            off for the current firmware, which reboots on unknown message ids.
+    """
+
+    def __init__(self, bus, batch_window=0.005, max_moves=MAX_BATCH_MOVES, batch_supported=False):
+        self.bus = bus
+        self.batch_supported = batch_supported
+        self.batch_window = batch_window
+        self.max_moves = max_moves
+        self.batches_sent = 0
+        self.moves_sent = 0
+
+        self._moves = {}  # hardware_address -> angle
+        self._futures = []
+        self._timer = None
+        self._sends = set()
+
+    async def advance(self, hardware_address, angle):
+        """
+        Queue a move and wait until the batch carrying it has been acked.
+
+        A second move for a feeder that is already in the open batch would be
+        merged away, so it closes the open batch and starts a new one.
+        """
+        if hardware_address in self._moves:
+            self._flush()
+
+        future = asyncio.get_running_loop().create_future()
+        self._moves[hardware_address] = angle
+        self._futures.append(future)
+
+        if len(self._moves) >= self.max_moves:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.batch_window, self._flush)
+        return await future
+
+    async def flush(self):
+        """Send the open batch now and wait for every batch still in flight."""
+        self._flush()
+        if self._sends:
+            await asyncio.gather(*self._sends, return_exceptions=True)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._moves:
+            return
+
+        moves, futures = list(self._moves.items()), self._futures
+        self._moves, self._futures = {}, []
+        task = asyncio.ensure_future(self._send(moves, futures))
+        self._sends.add(task)
+        task.add_done_callback(self._sends.discard)
+
+    async def _send(self, moves, futures):
+        try:
+            if self.batch_supported:
+                ack = await self.bus.request(codec.rotate_servo_batch(BROADCAST_ADDRESS, moves))
+            else:
+                acks = await asyncio.gather(*(self.bus.rotate_servo(address, angle) for address, angle in moves))
+                ack = acks[-1]
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches_sent += 1
+        self.moves_sent += len(moves)
+        for future in futures:
+            if not future.done():
+                future.set_result(ack)
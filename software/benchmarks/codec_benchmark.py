@@ -0,0 +1,85 @@
+"""
+Compare messages-per-second of the hand-written classes in messages.py with the
+precompiled codec in software/codec.py.
+
+Run from the repository root:
+
+    python -m software.benchmarks.codec_benchmark
+"""
+import time
+
+import software.codec as codec
+import software.tests.servo_position_linearity.messages as messages
+
+MESSAGE_COUNT = 200_000
+
+
+def measure(label, func, count=MESSAGE_COUNT):
+    """Run func(count) and print the resulting messages per second."""
+    start = time.perf_counter()
+    func(count)
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed
+    print(f"{label:<40} {rate:>12,.0f} msg/s")
+    return rate
+
+
+def handwritten_encode(count):
+    for i in range(count):
+        messages.rotate_servo(i & 0xFF, i & 0x3FF).serialize()
+
+
+def handwritten_decode(count):
+    data = messages.rotate_servo(0, 500, 10).serialize()
+    for _ in range(count):
+        messages.readMessage(data)
+
+
+def codec_encode(count):
+    for i in range(count):
+        codec.rotate_servo(i & 0xFF, i & 0x3FF).serialize()
+
+
+def codec_pack_into(count):
+    rotate = codec.rotate_servo.codec
+    pack_into = rotate.struct.pack_into
+    message_id = rotate.message_id
+    size = rotate.size
+    buff = bytearray(size * 1024)
+    offset = 0
+    for i in range(count):
+        pack_into(buff, offset, message_id, i & 0xFF, i & 0x3FF)
+        offset += size
+        if offset == len(buff):
+            offset = 0
+
+
+def codec_decode(count):
+    data = codec.rotate_servo(0, 500).serialize()
+    for _ in range(count):
+        codec.read_message(data)
+
+
+def codec_decode_into(count):
+    rotate = codec.rotate_servo.codec
+    data = codec.rotate_servo(0, 500).serialize()
+    message = codec.rotate_servo(0, 0)
+    for _ in range(count):
+        rotate.decode_into(message, data)
+
+
+def main():
+    print(f"{MESSAGE_COUNT:,} rotate_servo messages per run\n")
+    baseline_encode = measure("messages.py serialize()", handwritten_encode)
+    measure("codec serialize()", codec_encode)
+    fast_encode = measure("codec pack_into() reused buffer", codec_pack_into)
+    baseline_decode = measure("messages.py readMessage()", handwritten_decode)
+    measure("codec read_message()", codec_decode)
+    fast_decode = measure("codec decode_into() reused object", codec_decode_into)
+
+    print(f"\nEncode speedup: {fast_encode / baseline_encode:.1f}x")
+    print(f"Decode speedup: {fast_decode / baseline_decode:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Cost of Modbus CRC16 framing per frame, against the time a frame takes on the wire.
+
+Compares the bit-at-a-time reference (what the firmware does) with the
+table-driven crc16(), serialize(crc=True) and the framer's CRC check, plus
+validate_frames() over a burst of acks from every feeder. The last column is
+the share of one frame's transmission time at 115200 baud, i.e. how much CRC
+work adds to a bus saturated with 512 feeders' traffic.
+
+Run from the repository root:
+
+    python -m software.benchmarks.crc_benchmark
+"""
+import time
+
+import software.codec as codec
+from software.crc16 import append_crc, crc16, crc16_bitwise, validate_frames
+from software.framer import MessageFramer
+
+FRAME_COUNT = 100_000
+FEEDERS = 512
+BAUDRATE = 115200
+BITS_PER_BYTE = 10  # 8N1
+
+
+def measure(label, func, frames, frame_size):
+    """Run func() and print microseconds per frame and share of wire time."""
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    per_frame = elapsed / frames
+    wire_time = frame_size * BITS_PER_BYTE / BAUDRATE
+    print(f"{label:<40} {per_frame * 1e6:>8.3f} us/frame {per_frame / wire_time:>8.2%} of wire time")
+    return per_frame
+
+
+def main():
+    message = codec.rotate_servo(7, 500)
+    payload = message.serialize()
+    frame_size = len(payload) + 2
+    print(f"{FRAME_COUNT:,} rotate_servo frames, {frame_size} bytes with CRC, "
+          f"{frame_size * BITS_PER_BYTE / BAUDRATE * 1e6:.0f} us each at {BAUDRATE} baud\n")
+
+    measure("crc16_bitwise() (firmware algorithm)",
+            lambda: [crc16_bitwise(payload) for _ in range(FRAME_COUNT)], FRAME_COUNT, frame_size)
+    measure("crc16() table driven",
+            lambda: [crc16(payload) for _ in range(FRAME_COUNT)], FRAME_COUNT, frame_size)
+    measure("serialize()",
+            lambda: [message.serialize() for _ in range(FRAME_COUNT)], FRAME_COUNT, frame_size)
+    measure("serialize(crc=True)",
+            lambda: [message.serialize(crc=True) for _ in range(FRAME_COUNT)], FRAME_COUNT, frame_size)
+
+    # Acks from every feeder arriving in one read
+    stream = b"".join(append_crc(codec.rotate_servo(i % 256, i).serialize()) for i in range(FEEDERS))
+    bursts = FRAME_COUNT // FEEDERS
+    plain = b"".join(codec.rotate_servo(i % 256, i).serialize() for i in range(FEEDERS))
+
+    def frame(data, crc):
+        framer = MessageFramer(crc=crc)
+        for _ in range(bursts):
+            for _ in framer.feed(data):
+                pass
+
+    measure("MessageFramer", lambda: frame(plain, False), bursts * FEEDERS, frame_size)
+    measure("MessageFramer(crc=True)", lambda: frame(stream, True), bursts * FEEDERS, frame_size)
+    validate_frames(stream, frame_size)  # Import numpy outside the timing
+    measure(f"validate_frames() {FEEDERS} frame burst",
+            lambda: [validate_frames(stream, frame_size) for _ in range(bursts)], bursts * FEEDERS, frame_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""
+Benchmark suite for the host command path: encode, frame, send, ack.
+
+Covers the hand-written messages.py classes, the precompiled codec, framing of
+back-to-back replies, blocking write_message() round trips against a
+simulated feeder, and scaling curves for 1, 16, 128 and 512 feeders. The
+pipelined and batched cases need firmware that queues commands and handles
+rotate_servo_batch, so they run against SimulatedSerial(firmware_quirks=False);
+the blocking cases run against the current firmware's behaviour. Results
+are written as JSON in the same layout as pytest-benchmark so runs can be
+compared for regressions:
+
+    python -m software.benchmarks.host_command_path --output baseline.json
+    python -m software.benchmarks.host_command_path --compare baseline.json
+"""
+import argparse
+import datetime
+import json
+import platform
+import statistics
+import sys
+import time
+
+import software.codec as codec
+import software.tests.servo_position_linearity.messages as messages
+from software.batch_advance import encode_batches
+from software.feeder_simulator import SimulatedSerial
+from software.framer import MessageFramer
+from software.pipelined_sender import PipelinedSender
+
+FEEDER_COUNTS = (1, 16, 128, 512)
+FEEDERS_PER_LINK = 255
+# Link model used for the end-to-end benchmarks
+LINK_BAUDRATE = 115200
+ACK_LATENCY = 0.001
+
+
+def bench(results, name, group, func, rounds=5, ops=1, setup=None, **params):
+    """
+    Time func() over several rounds and append a pytest-benchmark style record.
+
+    Args:
+        results (list): Records are appended here.
+        name (str): Benchmark name.
+        group (str): Group used when printing and comparing.
+        func (callable): The code under test; one call is one round.
+        rounds (int): Number of timed rounds.
+        ops (int): Operations performed per round, used for ops/s.
+        setup (callable): Called before each round, outside the timing; its
+            result is passed to func.
+        **params: Extra parameters stored with the record.
+    """
+    call = func if setup is None else (lambda: func(setup()))
+    call()  # Warm up
+    timings = []
+    for _ in range(rounds):
+        argument = None if setup is None else setup()
+        start = time.perf_counter()
+        if setup is None:
+            func()
+        else:
+            func(argument)
+        timings.append(time.perf_counter() - start)
+
+    mean = statistics.fmean(timings)
+    stats = {
+        "min": min(timings),
+        "max": max(timings),
+        "mean": mean,
+        "median": statistics.median(timings),
+        "stddev": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        "rounds": rounds,
+        "ops": ops / mean,
+    }
+    results.append({"name": name, "group": group, "params": params, "stats": stats})
+    print(f"{group:<18} {name:<44} {stats['median'] * 1000:>10.3f} ms {stats['ops']:>14,.0f} ops/s")
+
+
+def loopback_serial(feeders=FEEDERS_PER_LINK, baudrate=0, response_latency=0.0, firmware_quirks=True):
+    """A simulated port with no link delay, to time the host stack alone."""
+    return SimulatedSerial(feeders=feeders, baudrate=baudrate, response_latency=response_latency,
+                           timeout=5, firmware_quirks=firmware_quirks)
+
+
+def bench_encode(results, count=50_000):
+    def handwritten():
+        for i in range(count):
+            messages.rotate_servo(i & 0xFF, 500).serialize()
+
+    def precompiled():
+        for i in range(count):
+            codec.rotate_servo(i & 0xFF, 500).serialize()
+
+    buff = bytearray(count * codec.rotate_servo.codec.size)
+
+    def pack_into():
+        rotate = codec.rotate_servo.codec
+        offset = 0
+        for i in range(count):
+            offset = rotate.pack_into(buff, offset, i & 0xFF, 500)
+
+    bench(results, "messages.rotate_servo.serialize", "encode", handwritten, ops=count)
+    bench(results, "codec.rotate_servo.serialize", "encode", precompiled, ops=count)
+    bench(results, "codec.pack_into", "encode", pack_into, ops=count)
+
+
+def bench_decode(results, count=50_000):
+    handwritten_data = messages.rotate_servo(0, 500, 10).serialize()
+    data = codec.rotate_servo(0, 500).serialize()
+
+    def handwritten():
+        for _ in range(count):
+            messages.rotate_servo.deserialize(handwritten_data)
+
+    def handwritten_dispatch():
+        for _ in range(count):
+            messages.readMessage(handwritten_data)
+
+    def precompiled_dispatch():
+        for _ in range(count):
+            codec.read_message(data)
+
+    bench(results, "messages.rotate_servo.deserialize", "decode", handwritten, ops=count)
+    bench(results, "messages.readMessage", "decode", handwritten_dispatch, ops=count)
+    bench(results, "codec.read_message", "decode", precompiled_dispatch, ops=count)
+
+
+def bench_framing(results, count=50_000):
+    stream = bytes(codec.encode_stream(codec.rotate_servo(i & 0xFF, 500) for i in range(count)))
+    chunks = [stream[i:i + 64] for i in range(0, len(stream), 64)]
+
+    def frame():
+        framer = MessageFramer()
+        for chunk in chunks:
+            for _ in framer.feed(chunk):
+                pass
+
+    bench(results, "MessageFramer.feed 64 byte chunks", "frame", frame, ops=count)
+
+
+def bench_round_trip(results, count=2_000):
+    from software.tests.servo_position_linearity.linearity_test_runner import write_message
+
+    ser = loopback_serial()
+
+    def blocking():
+        for i in range(count):
+            write_message(codec.rotate_servo(i % FEEDERS_PER_LINK, 500), ser)
+
+    def pipelined(ser):
+        with PipelinedSender(ser, window=32) as sender:
+            sender.send_many(codec.rotate_servo(i % FEEDERS_PER_LINK, 500) for i in range(count))
+            sender.flush()
+
+    bench(results, "write_message loopback", "round_trip", blocking, ops=count)
+    bench(results, "PipelinedSender loopback", "round_trip", pipelined, ops=count,
+          setup=lambda: loopback_serial(firmware_quirks=False))
+
+
+def links_for(feeders, firmware_quirks=True):
+    """Split feeder addresses over as many simulated links as the u8 address needs."""
+    links = []
+    for first in range(0, feeders, FEEDERS_PER_LINK):
+        count = min(FEEDERS_PER_LINK, feeders - first)
+        links.append((count, SimulatedSerial(feeders=count, baudrate=LINK_BAUDRATE, response_latency=ACK_LATENCY,
+                                             timeout=5, firmware_quirks=firmware_quirks)))
+    return links
+
+
+def bench_scaling(results):
+    from software.tests.servo_position_linearity.linearity_test_runner import write_message
+
+    for feeders in FEEDER_COUNTS:
+        # The links are built by setup, outside the timed rounds
+        def blocking(links):
+            for count, ser in links:
+                for address in range(count):
+                    write_message(codec.rotate_servo(address, 500), ser)
+
+        def pipelined(links):
+            for count, ser in links:
+                with PipelinedSender(ser, window=32) as sender:
+                    sender.send_many(codec.rotate_servo(address, 500) for address in range(count))
+                    sender.flush()
+
+        def batched(links):
+            for count, ser in links:
+                with PipelinedSender(ser, window=4) as sender:
+                    sender.send_many(encode_batches((address, 500) for address in range(count)))
+                    sender.flush()
+
+        rounds = 3 if feeders > 16 else 5
+        bench(results, f"blocking feeders={feeders}", "scaling", blocking,
+              rounds=rounds, ops=feeders, setup=lambda: links_for(feeders), feeders=feeders)
+        bench(results, f"pipelined feeders={feeders}", "scaling", pipelined,
+              rounds=rounds, ops=feeders, setup=lambda: links_for(feeders, firmware_quirks=False),
+              feeders=feeders)
+        bench(results, f"batched feeders={feeders}", "scaling", batched,
+              rounds=rounds, ops=feeders, setup=lambda: links_for(feeders, firmware_quirks=False),
+              feeders=feeders)
+
+
+def compare(results, baseline_file, threshold):
+    """
+    Compare median timings against a previous run.
+
+    Returns:
+        list: Names of benchmarks that got slower by more than threshold.
+    """
+    with open(baseline_file) as f:
+        baseline = {b["name"]: b for b in json.load(f)["benchmarks"]}
+
+    regressions = []
+    print(f"\nComparison against {baseline_file} (threshold {threshold:.0%}):")
+    for result in results:
+        old = baseline.get(result["name"])
+        if old is None:
+            continue
+        change = result["stats"]["median"] / old["stats"]["median"] - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(result["name"])
+            flag = "  REGRESSION"
+        print(f"{result['name']:<44} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--output", default="host_command_path_benchmark.json")
+    parser.add_argument("--compare", help="JSON file from a previous run")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Relative slowdown reported as a regression")
+    parser.add_argument("--skip-scaling", action="store_true")
+    args = parser.parse_args()
+
+    results = []
+    bench_encode(results)
+    bench_decode(results)
+    bench_framing(results)
+    bench_round_trip(results)
+    if not args.skip_scaling:
+        bench_scaling(results)
+
+    report = {
+        "machine_info": {
+            "python_version": platform.python_version(),
+            "python_implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "system": platform.system(),
+        },
+        "datetime": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "benchmarks": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved results to {args.output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
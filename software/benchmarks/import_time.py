@@ -0,0 +1,48 @@
+"""
+Measure cold-start import time of the test script modules.
+
+Each module is imported in a fresh interpreter several times and the median
+wall time is reported, so changes that pull torch/cv2/pandas/matplotlib back
+into import time show up immediately:
+
+    python -m software.benchmarks.import_time
+"""
+import statistics
+import subprocess
+import sys
+import time
+
+MODULES = (
+    "software.codec",
+    "software.tests.servo_position_linearity.analyze_linearity_data",
+    "software.tests.servo_position_linearity.linearity_test_runner",
+    "software.tests.servo_precision_positioning.test_feeder_position",
+)
+RUNS = 5
+
+
+def import_time(module, runs=RUNS):
+    """Return the median seconds to start Python and import module, or None if it fails."""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, "-c", f"import {module}"], capture_output=True)
+        timings.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            return None
+    return statistics.median(timings)
+
+
+def main():
+    baseline = import_time("sys")
+    print(f"{'interpreter startup':<66} {baseline * 1000:>8.0f} ms")
+    for module in MODULES:
+        seconds = import_time(module)
+        if seconds is None:
+            print(f"{module:<66} {'failed':>11}")
+        else:
+            print(f"{module:<66} {seconds * 1000:>8.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
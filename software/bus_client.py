@@ -0,0 +1,254 @@
+"""
+asyncio client for a feeder bus shared by many concurrent callers.
+
+One FeederBusClient owns the serial port. Writes go through a single writer
+task, a reader task splits the incoming stream with MessageFramer and hands
+each ack to the caller waiting on that hardware_address, so one coroutine per
+feeder (or per pick-and-place job) can await commands concurrently:
+
+    async with FeederBusClient.open("/dev/ttyACM0") as bus:
+        await asyncio.gather(*(bus.rotate_servo(address, 500) for address in range(8)))
+
+The firmware parses only the first message of each USB read and ignores
+commands that arrive while it is still busy with the previous one. So by
+default every command is written on its own and commands are issued one at a
+time per port; parallel_addresses=True only serializes per address, and
+coalesce_writes=True packs queued frames into one write, both for firmware
+that can queue and parse several frames.
+
+Given a CalibrationStore and the hardware ID of each address, advance() moves
+a feeder by a tape pitch. The per-feeder, per-pitch lookup tables are kept in
+a small LRU, so an advance is a table lookup rather than a recalculation.
+"""
+import asyncio
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+import software.codec as codec
+from software.framer import MessageFramer
+
+# How long a blocking ser.read() waits in the reader thread before re-checking for shutdown
+READ_POLL_INTERVAL = 0.02
+
+# Advance tables kept in memory, one per (hardware ID, pitch)
+ADVANCE_TABLE_CACHE_SIZE = 64
+
+
+class FeederBusClient:
+    """
+    Share one serial connection between many coroutines.
+
+    Args:
+        ser (serial.Serial): Open serial port. Its read timeout is lowered so the
+            reader can shut down promptly.
+        ack_timeout (float): Seconds to wait for a command to be acked.
+        calibrations (CalibrationStore): Feeder calibrations used by advance().
+        hardware_ids (dict): hardware_address -> hardware ID in the calibration store.
+        advance_cache_size (int): Number of advance tables kept in the LRU.
+        parallel_addresses (bool): Allow commands to different addresses to be in
+            flight at once instead of one command per port.
+        coalesce_writes (bool): Write everything queued in one ser.write instead
+            of one frame per write.
+    """
+
+    def __init__(self, ser, ack_timeout=2.0, calibrations=None, hardware_ids=None,
+                 advance_cache_size=ADVANCE_TABLE_CACHE_SIZE, parallel_addresses=False,
+                 coalesce_writes=False):
+        self.ser = ser
+        self.ack_timeout = ack_timeout
+        self.parallel_addresses = parallel_addresses
+        self.coalesce_writes = coalesce_writes
+        self.unmatched_acks = 0
+        self.calibrations = calibrations
+        self.hardware_ids = dict(hardware_ids or {})
+        self.advance_cache_size = advance_cache_size
+        self.advance_cache_hits = 0
+        self.advance_cache_misses = 0
+
+        self._angles = {}  # hardware_address -> last acked angle
+        self._advance_tables = collections.OrderedDict()
+
+        self._framer = MessageFramer()
+        self._write_queue = None
+        self._waiters = collections.defaultdict(collections.deque)  # (id, address) -> futures
+        self._address_locks = collections.defaultdict(asyncio.Lock)
+        self._tasks = []
+        self._io = None
+        self._running = False
+
+    @classmethod
+    def open(cls, port, baudrate=115200, **kwargs):
+        """Open a serial port with the settings used by the test scripts and wrap it."""
+        import serial
+
+        ser = serial.Serial(
+            port=port,
+            baudrate=baudrate,
+            parity=serial.PARITY_NONE,
+            stopbits=serial.STOPBITS_ONE,
+            bytesize=serial.EIGHTBITS,
+            timeout=READ_POLL_INTERVAL,
+        )
+        return cls(ser, **kwargs)
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def start(self):
+        """Start the writer and reader tasks."""
+        if self._running:
+            return
+        self.ser.timeout = READ_POLL_INTERVAL
+        self._running = True
+        self._write_queue = asyncio.Queue()
+        # Own threads for the blocking port calls, so close() can wait for them
+        self._io = ThreadPoolExecutor(max_workers=2, thread_name_prefix="feeder-bus-io")
+        self._tasks = [
+            asyncio.create_task(self._writer(), name="feeder-bus-writer"),
+            asyncio.create_task(self._reader(), name="feeder-bus-reader"),
+        ]
+
+    async def close(self, close_port=True):
+        """Stop the background tasks and fail any command still waiting for an ack."""
+        self._running = False
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._io is not None:
+            # A cancelled task leaves its ser.read()/ser.write() running; wait for it
+            # (at most READ_POLL_INTERVAL for a read) before the port is closed
+            await asyncio.get_running_loop().run_in_executor(None, self._io.shutdown)
+            self._io = None
+
+        for waiters in self._waiters.values():
+            for future in waiters:
+                if not future.done():
+                    future.set_exception(ConnectionError("Bus closed before ack"))
+        self._waiters.clear()
+        if close_port and self.ser.is_open:
+            self.ser.close()
+
+    async def request(self, message):
+        """
+        Send a command and wait for its ack.
+
+        Args:
+            message: A codec message, e.g. codec.rotate_servo(address, angle).
+
+        Returns:
+            Message: The decoded ack.
+        """
+        if not self._running:
+            raise RuntimeError("Bus client is not started")
+
+        key = (message.message_id, message.hardware_address)
+        lock_key = message.hardware_address if self.parallel_addresses else None
+        async with self._address_locks[lock_key]:
+            future = asyncio.get_running_loop().create_future()
+            self._waiters[key].append(future)
+            await self._write_queue.put(message.serialize())
+            try:
+                return await asyncio.wait_for(future, self.ack_timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"No ack for {message!r}") from None
+            finally:
+                waiters = self._waiters.get(key)
+                if waiters and future in waiters:
+                    waiters.remove(future)
+
+    async def rotate_servo(self, hardware_address, angle):
+        ack = await self.request(codec.rotate_servo(hardware_address, angle))
+        self._angles[hardware_address] = angle
+        return ack
+
+    async def advance(self, hardware_address, pitch_mm, from_angle=None):
+        """
+        Move the tape of a calibrated feeder by pitch_mm.
+
+        Args:
+            hardware_address (int): Feeder address on the bus.
+            pitch_mm (float): Distance to advance, e.g. 2, 4 or 8.
+            from_angle (int): Start angle; defaults to the last angle sent to this feeder.
+
+        Returns:
+            int: The angle the servo was moved to.
+        """
+        from software.calibration_store import NO_ADVANCE
+
+        if from_angle is None:
+            from_angle = self._angles.get(hardware_address)
+            if from_angle is None:
+                raise ValueError(f"Unknown angle for feeder {hardware_address}, pass from_angle")
+
+        table = self.advance_table(hardware_address, pitch_mm)
+        target = int(table[from_angle]) if 0 <= from_angle < len(table) else NO_ADVANCE
+        if target == NO_ADVANCE:
+            raise ValueError(f"Feeder {hardware_address} can't advance {pitch_mm} mm from angle {from_angle}")
+        await self.rotate_servo(hardware_address, target)
+        return target
+
+    def advance_table(self, hardware_address, pitch_mm):
+        """Start angle -> target angle table for a feeder and pitch, from the LRU when possible."""
+        if self.calibrations is None:
+            raise RuntimeError("Bus client has no calibration store")
+        key = (self.hardware_ids.get(hardware_address, hardware_address), pitch_mm)
+        table = self._advance_tables.get(key)
+        if table is not None:
+            self._advance_tables.move_to_end(key)
+            self.advance_cache_hits += 1
+            return table
+
+        self.advance_cache_misses += 1
+        table = self.calibrations.get(key[0]).advance_table(pitch_mm)
+        self._advance_tables[key] = table
+        if len(self._advance_tables) > self.advance_cache_size:
+            self._advance_tables.popitem(last=False)
+        return table
+
+    def invalidate_advance_tables(self, hardware_id=None):
+        """Drop cached tables after a feeder is recalibrated (all feeders when hardware_id is None)."""
+        for key in list(self._advance_tables):
+            if hardware_id is None or key[0] == hardware_id:
+                del self._advance_tables[key]
+
+    async def set_led_in_array(self, hardware_address, led_index, green, red, blue):
+        return await self.request(
+            codec.set_led_in_array(hardware_address, led_index, green, red, blue)
+        )
+
+    async def _writer(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            data = await self._write_queue.get()
+            if self.coalesce_writes:
+                # Coalesce everything already queued into a single write
+                while not self._write_queue.empty():
+                    data += self._write_queue.get_nowait()
+            await loop.run_in_executor(self._io, self.ser.write, data)
+
+    async def _reader(self):
+        loop = asyncio.get_running_loop()
+        while self._running:
+            data = await loop.run_in_executor(self._io, self._read_blocking)
+            if not data:
+                continue
+            for message_codec, frame in self._framer.feed(data):
+                self._dispatch(message_codec, frame)
+
+    def _read_blocking(self):
+        return self.ser.read(self.ser.in_waiting or 1)
+
+    def _dispatch(self, message_codec, frame):
+        # Header layout is message_id, hardware_address
+        waiters = self._waiters.get((frame[0], frame[1]))
+        while waiters:
+            future = waiters.popleft()
+            if not future.done():
+                future.set_result(message_codec.decode(frame))
+                return
+        self.unmatched_acks += 1
@@ -0,0 +1,338 @@
+"""
+Drive several feeder backplanes, one serial link each, from one host.
+
+A link carries at most 255 feeders and its throughput is bounded by its baud
+rate, so a long line is split over several ports. BusManager maps ranges of
+line-wide feeder numbers onto ports and gives each port its own worker: a
+thread that feeds a PipelinedSender, whose reader thread collects the acks.
+Serial reads and writes release the GIL, so the links progress in parallel
+and a slow or busy link doesn't hold up the others. The firmware ignores a
+command that arrives while the previous move is still running, so each port
+keeps one command in flight unless window says otherwise:
+
+    shards = [PortShard("/dev/ttyACM0", first_feeder=0, count=255),
+              PortShard("/dev/ttyACM1", first_feeder=255, count=255)]
+    with BusManager.open(shards) as bus:
+        pending = [bus.rotate_servo(feeder, 500) for feeder in range(510)]
+        bus.flush()
+        bus.print_metrics()
+
+send() accepts messages.py or codec messages whose hardware_address is the
+line-wide feeder number; the copy that goes on the wire carries the address
+local to its port. Try it without hardware:
+
+    python -m software.bus_manager --simulate 4 --feeders 1000
+    python -m software.bus_manager --simulate 4 --feeders 1000 --window 8 --queueing-firmware
+"""
+import argparse
+import copy
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import software.codec as codec
+from software.pipelined_sender import PipelinedSender
+
+_STOP = object()
+
+
+class PortShard:
+    """
+    A range of line-wide feeder numbers served by one serial port.
+
+    Args:
+        port: Device path, or an already open serial.Serial-like object.
+        first_feeder (int): Line-wide number of the first feeder on this port.
+        count (int): Number of feeders on this port (at most 255).
+        first_address (int): hardware_address of the first feeder on the backplane.
+        name (str): Label used in metrics; defaults to the device path.
+    """
+
+    def __init__(self, port, first_feeder, count, first_address=0, name=None):
+        if not 0 < count <= 255 - first_address:
+            raise ValueError("A port holds at most 255 feeders")
+        self.port = port
+        self.first_feeder = first_feeder
+        self.count = count
+        self.first_address = first_address
+        self._name = name
+
+    def __contains__(self, feeder):
+        return self.first_feeder <= feeder < self.first_feeder + self.count
+
+    def address(self, feeder):
+        return feeder - self.first_feeder + self.first_address
+
+    @property
+    def name(self):
+        if self._name is not None:
+            return self._name
+        return self.port if isinstance(self.port, str) else getattr(self.port, "port", None) or repr(self.port)
+
+    @classmethod
+    def parse(cls, spec):
+        """Parse "PORT:FIRST-LAST", e.g. "/dev/ttyACM1:255-509"."""
+        port, _, feeders = spec.rpartition(":")
+        first, _, last = feeders.partition("-")
+        if not port or not last:
+            raise ValueError(f"Expected PORT:FIRST-LAST, got {spec!r}")
+        return cls(port, int(first), int(last) - int(first) + 1)
+
+
+class PortWorker:
+    """Queue and worker thread in front of one port's PipelinedSender."""
+
+    def __init__(self, shard, ser, window, ack_timeout):
+        self.shard = shard
+        self.sender = PipelinedSender(ser, window=window, ack_timeout=ack_timeout)
+        self.queued = 0
+        self.started_at = None
+
+        self._queue = queue.Queue()
+        self._thread = None
+        # Submitted commands the sender hasn't written yet, including the one _run holds
+        self._unsent = 0
+        self._sent = threading.Condition()
+
+    @property
+    def queue_depth(self):
+        """Commands waiting for a window slot."""
+        return self._queue.qsize()
+
+    def wait_sent(self, timeout=None):
+        """Wait until every submitted command has been handed to the sender."""
+        with self._sent:
+            return self._sent.wait_for(lambda: self._unsent == 0, timeout)
+
+    def start(self):
+        self.sender.start()
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name=f"port-worker-{self.shard.name}", daemon=True)
+        self._thread.start()
+
+    def submit(self, message):
+        future = Future()
+        self.queued += 1
+        with self._sent:
+            self._unsent += 1
+        self._queue.put((message, future))
+        return future
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+        self.sender.close()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            message, future = item
+            try:
+                command = self.sender.send(message)
+            except Exception as e:
+                future.set_exception(e)
+                continue
+            finally:
+                with self._sent:
+                    self._unsent -= 1
+                    self._sent.notify_all()
+            command.future.add_done_callback(lambda done, future=future: _chain(done, future))
+
+    def metrics(self):
+        summary = self.sender.stats.summary()
+        elapsed = time.perf_counter() - self.started_at if self.started_at else 0.0
+        summary.update({
+            "port": self.shard.name,
+            "feeders": f"{self.shard.first_feeder}-{self.shard.first_feeder + self.shard.count - 1}",
+            "queue_depth": self.queue_depth,
+            "in_flight": self.sender.in_flight,
+            "acks_per_s": summary["acked"] / elapsed if elapsed else 0.0,
+        })
+        return summary
+
+
+def _chain(done, future):
+    error = done.exception()
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(done.result())
+
+
+class BusManager:
+    """
+    Route commands for line-wide feeder numbers to per-port workers.
+
+    Args:
+        shards (list of PortShard): Port layout; ports must be open serial objects
+            (use BusManager.open() to open device paths).
+        window (int): Commands in flight per port. Keep 1 for the current
+            firmware, which drops a command that arrives while it is busy.
+        ack_timeout (float): Seconds to wait for each ack.
+    """
+
+    def __init__(self, shards, window=1, ack_timeout=2.0):
+        ordered = sorted(shards, key=lambda shard: shard.first_feeder)
+        for previous, shard in zip(ordered, ordered[1:]):
+            if shard.first_feeder < previous.first_feeder + previous.count:
+                raise ValueError(f"Feeder ranges of {previous.name} and {shard.name} overlap")
+        self.workers = [PortWorker(shard, shard.port, window, ack_timeout) for shard in ordered]
+        # Feeder number -> worker, so routing is one dict lookup
+        self._routes = {}
+        for worker in self.workers:
+            for feeder in range(worker.shard.first_feeder, worker.shard.first_feeder + worker.shard.count):
+                self._routes[feeder] = worker
+        self._started = False
+
+    @classmethod
+    def open(cls, shards, baudrate=115200, **kwargs):
+        """Open the serial port of every shard given as a device path."""
+        import serial
+
+        for shard in shards:
+            if isinstance(shard.port, str):
+                shard.port = serial.Serial(
+                    port=shard.port,
+                    baudrate=baudrate,
+                    parity=serial.PARITY_NONE,
+                    stopbits=serial.STOPBITS_ONE,
+                    bytesize=serial.EIGHTBITS,
+                )
+        return cls(shards, **kwargs)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def start(self):
+        if not self._started:
+            for worker in self.workers:
+                worker.start()
+            self._started = True
+
+    def close(self, close_ports=True):
+        for worker in self.workers:
+            worker.close()
+            if close_ports and worker.shard.port.is_open:
+                worker.shard.port.close()
+        self._started = False
+
+    @property
+    def feeders(self):
+        """Every line-wide feeder number served, in order."""
+        return sorted(self._routes)
+
+    def route(self, feeder):
+        """Return (PortWorker, local hardware_address) for a line-wide feeder number."""
+        worker = self._routes.get(feeder)
+        if worker is None:
+            raise KeyError(f"Feeder {feeder} is not on any port")
+        return worker, worker.shard.address(feeder)
+
+    def send(self, message):
+        """
+        Queue a command for the feeder numbered message.hardware_address.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the decoded ack.
+        """
+        if not self._started:
+            raise RuntimeError("Bus manager is not started")
+        worker, address = self.route(message.hardware_address)
+        if address != message.hardware_address:
+            message = copy.copy(message)
+            message.hardware_address = address
+        return worker.submit(message)
+
+    def rotate_servo(self, feeder, angle):
+        return self.send(codec.rotate_servo(feeder, angle))
+
+    def set_led_in_array(self, feeder, led_index, green, red, blue):
+        return self.send(codec.set_led_in_array(feeder, led_index, green, red, blue))
+
+    def flush(self, timeout=None) -> bool:
+        """Wait until every port has sent and settled everything queued so far."""
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        for worker in self.workers:
+            remaining = None if deadline is None else max(0.0, deadline - time.perf_counter())
+            if not worker.wait_sent(remaining):
+                return False
+            remaining = None if deadline is None else max(0.0, deadline - time.perf_counter())
+            if not worker.sender.flush(remaining):
+                return False
+        return True
+
+    def metrics(self):
+        """Per-port counters, queue depth, in-flight commands, throughput and latency."""
+        return [worker.metrics() for worker in self.workers]
+
+    def print_metrics(self):
+        print(f"{'port':<16} {'feeders':<10} {'queued':>7} {'flight':>6} {'acked':>7} "
+              f"{'timeouts':>8} {'acks/s':>9} {'p50 ms':>7} {'p99 ms':>7}")
+        for m in self.metrics():
+            print(f"{str(m['port'])[:16]:<16} {m['feeders']:<10} {m['queue_depth']:>7} {m['in_flight']:>6} "
+                  f"{m['acked']:>7} {m['timeouts']:>8} {m['acks_per_s']:>9.0f} "
+                  f"{m.get('p50_ms', 0.0):>7.2f} {m.get('p99_ms', 0.0):>7.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive feeders spread over several serial ports")
+    parser.add_argument("--port", action="append", default=[], metavar="PORT:FIRST-LAST",
+                        help="Port and the line-wide feeder numbers on it; repeat for each port")
+    parser.add_argument("--simulate", type=int, default=0, metavar="PORTS",
+                        help="Use this many simulated ports instead of --port")
+    parser.add_argument("--feeders", type=int, default=510, help="Feeders spread over the simulated ports")
+    parser.add_argument("--window", type=int, default=1,
+                        help="Commands in flight per port; above 1 needs firmware that queues commands")
+    parser.add_argument("--queueing-firmware", action="store_true",
+                        help="Simulate firmware that queues commands instead of dropping them while busy")
+    parser.add_argument("--rounds", type=int, default=3, help="Moves sent to every feeder")
+    args = parser.parse_args()
+
+    if args.window < 1:
+        parser.error("--window must be at least 1")
+    if args.simulate and args.window > 1 and not args.queueing_firmware:
+        # The simulated firmware drops commands that arrive while it is busy, like main.zig
+        parser.error("--window above 1 drops commands on the current firmware; add --queueing-firmware")
+
+    if args.simulate:
+        from software.feeder_simulator import SimulatedSerial
+
+        per_port = -(-args.feeders // args.simulate)
+        shards = []
+        for first in range(0, args.feeders, per_port):
+            count = min(per_port, args.feeders - first)
+            ser = SimulatedSerial(count, response_latency=0.002, firmware_quirks=not args.queueing_firmware)
+            shards.append(PortShard(ser, first, count, name=f"simulated-{len(shards)}"))
+        bus = BusManager(shards, window=args.window)
+    elif args.port:
+        shards = [PortShard.parse(spec) for spec in args.port]
+        bus = BusManager.open(shards, window=args.window)
+    else:
+        parser.error("Give --port at least once, or --simulate")
+
+    feeders = bus.feeders
+    with bus:
+        start = time.perf_counter()
+        pending = []
+        for i in range(args.rounds):
+            pending += [bus.rotate_servo(feeder, 300 + 100 * (i % 2)) for feeder in feeders]
+            # A feeder's next move is only sent once every move of this round has been acked
+            bus.flush()
+        elapsed = time.perf_counter() - start
+        failed = sum(1 for future in pending if future.exception() is not None)
+        print(f"{len(pending)} moves over {len(bus.workers)} ports in {elapsed:.2f} s "
+              f"({len(pending) / elapsed:.0f} moves/s), {failed} failed\n")
+        bus.print_metrics()
+
+
+if __name__ == "__main__":
+    main()
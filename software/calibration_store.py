@@ -0,0 +1,349 @@
+"""
+Per-feeder calibration curves and feed-distance lookup tables.
+
+The linearity test measures where the tape sits for every servo angle. A
+FeederCalibration keeps that angle -> position curve for one feeder, keyed by
+the hardware ID stored in the feeder's EEPROM, and turns it into lookup
+tables for a given pitch: table[start_angle] is the angle that moves the tape
+pitch_mm further along, so an advance is one array lookup.
+
+Repeated samples are averaged per angle and the averages are made monotonic
+with an isotonic fit, since measurement noise between neighbouring angles
+can be larger than the step between them.
+
+CalibrationStore persists calibrations as JSON. The curve can also be packed
+into the EEPROM image layout below. Nothing writes that image to a feeder
+yet: there is no host message for EEPROM writes, so the eeprom command only
+prints the page writes and saves the image to a file. The layout is:
+
+    0x80  u8   magic (0xCA)
+    0x81  u8   layout version
+    0x82  u8   number of curve points (at most EEPROM_MAX_POINTS)
+    0x83  u8   checksum: sum of bytes 0x84..0xFF modulo 256
+    0x84  u32  steps per mm * 1000
+    0x88  u16  angle, u32 position in µm   (one pair per point)
+
+The lower half of the 256 byte 24C02 is left for the MPN/quantity metadata.
+
+    python -m software.calibration_store fit data.csv FEEDER-0001
+    python -m software.calibration_store show FEEDER-0001 --pitch 2 4 8
+    python -m software.calibration_store eeprom FEEDER-0001 --output feeder.bin
+"""
+import argparse
+import datetime
+import json
+import os
+import struct
+
+import numpy as np
+
+DEFAULT_STORE_PATH = "feeder_calibrations.json"
+
+# Common tape pitches, in mm
+STANDARD_PITCHES_MM = (2, 4, 8)
+
+# EEPROM layout, see the module docstring
+EEPROM_SIZE = 256
+EEPROM_PAGE_SIZE = 16
+EEPROM_CALIBRATION_OFFSET = 0x80
+EEPROM_MAGIC = 0xCA
+EEPROM_VERSION = 1
+_EEPROM_HEADER = struct.Struct("<BBBBI")
+_EEPROM_POINT = struct.Struct("<HI")
+EEPROM_MAX_POINTS = (EEPROM_SIZE - EEPROM_CALIBRATION_OFFSET - _EEPROM_HEADER.size) // _EEPROM_POINT.size
+
+# Marks a start angle that can't advance by the full pitch without leaving the curve
+NO_ADVANCE = -1
+
+
+class FeederCalibration:
+    """
+    Angle -> tape position curve of one feeder.
+
+    Args:
+        hardware_id (str): Feeder ID from its EEPROM.
+        angles (sequence of int): Servo angles (the linearity test's index).
+        positions_mm (sequence of float): Tape position at each angle; must be monotonic.
+        steps_per_mm (float): Overall fit, kept for reporting and the EEPROM.
+        advance_direction (int): -1 if the tape is advanced by decreasing the angle
+            (as in the linearity sweep), +1 otherwise.
+    """
+
+    def __init__(self, hardware_id, angles, positions_mm, steps_per_mm=None, advance_direction=-1, updated=None):
+        order = np.argsort(angles)
+        self.hardware_id = hardware_id
+        self.angles = np.asarray(angles, dtype=float)[order]
+        self.positions_mm = np.asarray(positions_mm, dtype=float)[order]
+        if len(self.angles) < 2:
+            raise ValueError("A calibration curve needs at least two points")
+        steps = np.diff(self.positions_mm)
+        if not (np.all(steps > 0) or np.all(steps < 0)):
+            raise ValueError(f"Calibration curve for {hardware_id} is not monotonic")
+        self.steps_per_mm = steps_per_mm
+        self.advance_direction = advance_direction
+        self.updated = updated or datetime.datetime.now().isoformat(timespec="seconds")
+
+    @classmethod
+    def from_samples(cls, hardware_id, indices, x_mm, **kwargs):
+        """
+        Build a curve from raw linearity samples, averaging repeats of each angle.
+
+        The per-angle means are fitted with isotonic regression in the direction
+        of the overall slope; angles pooled into one level become a single point
+        at their weighted mean angle, so the curve is strictly monotonic. The
+        overall steps per mm comes from a LinearCalibrator fit of the samples.
+        """
+        from software.tests.servo_position_linearity.linear_calibrator import LinearCalibrator
+
+        indices = np.asarray(indices)
+        x_mm = np.asarray(x_mm, dtype=float)
+        angles, inverse = np.unique(indices, return_inverse=True)
+        counts = np.bincount(inverse)
+        means = np.bincount(inverse, weights=x_mm) / counts
+
+        calibrator = LinearCalibrator()
+        calibrator.update_many(indices, x_mm)
+        kwargs.setdefault("steps_per_mm", abs(calibrator.steps_per_mm))
+        increasing = not calibrator.slope < 0
+        angles, means = _isotonic_points(angles, means, counts, increasing)
+        return cls(hardware_id, angles, means, **kwargs)
+
+    @property
+    def angle_range(self):
+        return int(np.ceil(self.angles[0])), int(np.floor(self.angles[-1]))
+
+    def position(self, angle):
+        """Tape position in mm at an angle (linear interpolation)."""
+        return np.interp(angle, self.angles, self.positions_mm)
+
+    def angle_for_position(self, position_mm):
+        """Angle that puts the tape at position_mm, NaN outside the curve."""
+        positions, angles = self.positions_mm, self.angles
+        if positions[0] > positions[-1]:
+            positions, angles = positions[::-1], angles[::-1]
+        return np.interp(position_mm, positions, angles, left=np.nan, right=np.nan)
+
+    def advance_table(self, pitch_mm):
+        """
+        Target angle for every integer start angle when advancing by pitch_mm.
+
+        Returns:
+            numpy.ndarray: int32 array indexed by start angle, NO_ADVANCE where the
+            pitch doesn't fit in the rest of the curve.
+        """
+        low, high = self.angle_range
+        start = np.arange(high + 1)
+        # Position change per unit angle in the direction the tape advances
+        towards_low = self.positions_mm[0] - self.positions_mm[-1]
+        sign = np.sign(towards_low) if self.advance_direction < 0 else -np.sign(towards_low)
+        target = self.angle_for_position(self.position(start) + sign * pitch_mm)
+        table = np.where(np.isnan(target), NO_ADVANCE, np.rint(np.nan_to_num(target)))
+        table[:low] = NO_ADVANCE
+        return table.astype(np.int32)
+
+    def steps_for_distance(self, distance_mm):
+        return None if self.steps_per_mm is None else distance_mm * self.steps_per_mm
+
+    def to_dict(self):
+        return {
+            "angles": self.angles.tolist(),
+            "positions_mm": self.positions_mm.tolist(),
+            "steps_per_mm": self.steps_per_mm,
+            "advance_direction": self.advance_direction,
+            "updated": self.updated,
+        }
+
+    @classmethod
+    def from_dict(cls, hardware_id, data):
+        return cls(hardware_id, data["angles"], data["positions_mm"], data.get("steps_per_mm"),
+                   data.get("advance_direction", -1), data.get("updated"))
+
+    def to_eeprom(self, max_points=EEPROM_MAX_POINTS):
+        """
+        Pack the curve into the calibration half of the EEPROM image.
+
+        Curves with more than max_points points are resampled at evenly spaced angles.
+
+        Returns:
+            bytes: EEPROM_SIZE - EEPROM_CALIBRATION_OFFSET bytes, 0xFF padded.
+        """
+        max_points = min(max_points, EEPROM_MAX_POINTS)
+        angles = self.angles
+        if len(angles) > max_points:
+            angles = np.rint(np.linspace(angles[0], angles[-1], max_points))
+        positions_um = np.rint(self.position(angles) * 1000)
+        if positions_um.min() < 0:
+            raise ValueError("EEPROM positions must be non-negative")
+
+        points = b"".join(_EEPROM_POINT.pack(int(round(a)), int(p)) for a, p in zip(angles, positions_um))
+        steps = round((self.steps_per_mm or 0) * 1000)
+        body = struct.pack("<I", steps) + points
+        body += b"\xff" * (EEPROM_SIZE - EEPROM_CALIBRATION_OFFSET - 4 - len(body))
+        checksum = sum(body) & 0xFF
+        return struct.pack("<BBBB", EEPROM_MAGIC, EEPROM_VERSION, len(angles), checksum) + body
+
+    @classmethod
+    def from_eeprom(cls, hardware_id, data):
+        """Inverse of to_eeprom()."""
+        magic, version, count, checksum, steps = _EEPROM_HEADER.unpack_from(data)
+        if magic != EEPROM_MAGIC:
+            raise ValueError("EEPROM holds no calibration")
+        if version != EEPROM_VERSION:
+            raise ValueError(f"Unsupported EEPROM calibration version {version}")
+        if sum(data[4:EEPROM_SIZE - EEPROM_CALIBRATION_OFFSET]) & 0xFF != checksum:
+            raise ValueError("EEPROM calibration checksum mismatch")
+        points = [_EEPROM_POINT.unpack_from(data, _EEPROM_HEADER.size + i * _EEPROM_POINT.size)
+                  for i in range(count)]
+        angles = [angle for angle, _ in points]
+        positions_mm = [um / 1000 for _, um in points]
+        return cls(hardware_id, angles, positions_mm, steps / 1000 or None)
+
+
+def _isotonic_points(angles, means, weights, increasing=True):
+    """
+    Pool adjacent violators: the weighted least-squares monotonic fit of means.
+
+    Returns:
+        tuple: (angles, positions) with one point per pooled block, at the
+        block's weighted mean angle.
+    """
+    sign = 1.0 if increasing else -1.0
+    # Each block: [weight, weighted angle sum, weighted position sum]
+    blocks = []
+    for angle, mean, weight in zip(angles, means, weights):
+        blocks.append([float(weight), weight * float(angle), weight * float(mean) * sign])
+        while len(blocks) > 1 and blocks[-2][2] / blocks[-2][0] >= blocks[-1][2] / blocks[-1][0]:
+            weight, angle_sum, position_sum = blocks.pop()
+            blocks[-1][0] += weight
+            blocks[-1][1] += angle_sum
+            blocks[-1][2] += position_sum
+    blocks = np.array(blocks)
+    return blocks[:, 1] / blocks[:, 0], sign * blocks[:, 2] / blocks[:, 0]
+
+
+def eeprom_pages(data, offset=EEPROM_CALIBRATION_OFFSET):
+    """
+    Split an image into (address, bytes) writes that respect the 16 byte page
+    boundary of EEPROM24C02.writePage().
+    """
+    pages = []
+    position = 0
+    while position < len(data):
+        address = offset + position
+        length = min(EEPROM_PAGE_SIZE - address % EEPROM_PAGE_SIZE, len(data) - position)
+        pages.append((address, data[position:position + length]))
+        position += length
+    return pages
+
+
+class CalibrationStore:
+    """
+    JSON file of FeederCalibration objects keyed by hardware ID.
+
+    Args:
+        path (str): Store file; created on the first save().
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        self._calibrations = {}
+        if os.path.exists(path):
+            with open(path) as file:
+                for hardware_id, data in json.load(file).items():
+                    self._calibrations[hardware_id] = FeederCalibration.from_dict(hardware_id, data)
+
+    def __contains__(self, hardware_id):
+        return hardware_id in self._calibrations
+
+    def __len__(self):
+        return len(self._calibrations)
+
+    def get(self, hardware_id):
+        try:
+            return self._calibrations[hardware_id]
+        except KeyError:
+            raise KeyError(f"No calibration for feeder {hardware_id}") from None
+
+    def put(self, calibration):
+        self._calibrations[calibration.hardware_id] = calibration
+
+    def hardware_ids(self):
+        return sorted(self._calibrations)
+
+    def save(self):
+        # Write to a temporary file first so a crash can't leave a truncated store
+        temporary = self.path + ".tmp"
+        with open(temporary, "w") as file:
+            json.dump({hardware_id: calibration.to_dict()
+                       for hardware_id, calibration in self._calibrations.items()}, file, indent=2)
+        os.replace(temporary, self.path)
+
+
+def _read_samples(filename):
+    """(index, x_mm) arrays from a linearity CSV file or measurement log."""
+    from software.tests.measurement_log import is_measurement_log, read_measurements
+
+    if is_measurement_log(filename):
+        records = read_measurements(filename)
+        return records["index"], records["x_position_mm"]
+    data = np.genfromtxt(filename, delimiter=",", names=True)
+    return data["index"], data["x_position_mm"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage per-feeder calibration curves")
+    parser.add_argument("--store", default=DEFAULT_STORE_PATH, help="Calibration store file")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    fit = commands.add_parser("fit", help="Store a curve from linearity test data")
+    fit.add_argument("data", help="Linearity CSV file or measurement log")
+    fit.add_argument("hardware_id")
+    fit.add_argument("--lower-index", type=int, default=250)
+    fit.add_argument("--upper-index", type=int, default=750)
+
+    show = commands.add_parser("show", help="Print a calibration and its advance angles")
+    show.add_argument("hardware_id")
+    show.add_argument("--pitch", type=float, nargs="+", default=list(STANDARD_PITCHES_MM))
+    show.add_argument("--start-angle", type=int, default=None)
+
+    eeprom_note = "Export a calibration as an EEPROM image (printed or saved; nothing writes it to a feeder yet)"
+    eeprom = commands.add_parser("eeprom", help=eeprom_note, description=eeprom_note)
+    eeprom.add_argument("hardware_id")
+    eeprom.add_argument("--output", help="Write the calibration bytes to this file")
+
+    args = parser.parse_args()
+    store = CalibrationStore(args.store)
+
+    if args.command == "fit":
+        indices, x_mm = _read_samples(args.data)
+        keep = (indices >= args.lower_index) & (indices <= args.upper_index)
+        calibration = FeederCalibration.from_samples(args.hardware_id, indices[keep], x_mm[keep])
+        store.put(calibration)
+        store.save()
+        print(f"Stored {len(calibration.angles)} points for {args.hardware_id}, "
+              f"{calibration.steps_per_mm:.3f} steps/mm")
+
+    elif args.command == "show":
+        calibration = store.get(args.hardware_id)
+        low, high = calibration.angle_range
+        start = high if args.start_angle is None else args.start_angle
+        if not low <= start <= high:
+            parser.error(f"--start-angle must be within the calibrated angles {low}-{high}")
+        print(f"{args.hardware_id}: angles {low}-{high}, {calibration.steps_per_mm} steps/mm, "
+              f"updated {calibration.updated}")
+        for pitch in args.pitch:
+            target = calibration.advance_table(pitch)[start]
+            print(f"  {pitch:g} mm from angle {start}: " + ("out of range" if target == NO_ADVANCE else f"-> {target}"))
+
+    elif args.command == "eeprom":
+        image = store.get(args.hardware_id).to_eeprom()
+        if args.output:
+            with open(args.output, "wb") as file:
+                file.write(image)
+            print(f"Wrote {len(image)} bytes for EEPROM offset 0x{EEPROM_CALIBRATION_OFFSET:02X} to {args.output}")
+        for address, page in eeprom_pages(image):
+            print(f"0x{address:02X}: {page.hex(' ')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,387 @@
+"""
+Message codec built from firmware/src/messages.json.
+
+Messages the firmware doesn't handle yet (rotate_servo_batch) live in
+software/host_messages.json, which shares the firmware schema's header but is
+never fed to the Zig generator.
+
+The schema is read once at import time. Every message gets a precompiled
+struct.Struct and a __slots__ class, so a command stream can be encoded into
+(and decoded out of) one reusable buffer without building format strings or
+dispatch tables per message.
+
+The generated classes mirror the hand-written ones in
+software/tests/servo_position_linearity/messages.py:
+
+    import software.codec as codec
+
+    data = codec.rotate_servo(0, 500).serialize()
+    message = codec.read_message(data)
+
+For allocation-free use, pack straight into a buffer:
+
+    buff = bytearray(4096)
+    offset = codec.rotate_servo.codec.pack_into(buff, 0, 0, 500)
+"""
+import json
+import os
+import struct
+
+from software.crc16 import CRC_SIZE, append_crc, crc16, strip_crc
+
+MESSAGES_JSON = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "firmware", "src", "messages.json"
+)
+HOST_MESSAGES_JSON = os.path.join(os.path.dirname(os.path.abspath(__file__)), "host_messages.json")
+
+# Zig field types used in messages.json -> struct format characters
+FIELD_FORMATS = {
+    "u8": "B",
+    "i8": "b",
+    "u16": "H",
+    "i16": "h",
+    "u32": "I",
+    "i32": "i",
+    "u64": "Q",
+    "i64": "q",
+    "f32": "f",
+    "f64": "d",
+    "bool": "?",
+}
+
+
+class Message:
+    """Base class for the generated fixed-size message classes."""
+
+    __slots__ = ("hardware_address",)
+
+    codec = None  # Set on every generated subclass
+
+    def __init__(self, hardware_address, *values):
+        self.hardware_address = hardware_address
+        for name, value in zip(self.codec.fields, values):
+            setattr(self, name, value)
+
+    @property
+    def message_id(self):
+        return self.codec.message_id
+
+    def nbytes(self) -> int:
+        """Size of the message on the wire."""
+        return self.codec.size
+
+    def values(self):
+        """Return the header and payload values in wire order (without the message id)."""
+        return tuple(getattr(self, name) for name in self.codec.attributes)
+
+    def serialize(self, crc=False) -> bytes:
+        """Pack the message, followed by its CRC16 when crc is set."""
+        data = self.codec.struct.pack(self.codec.message_id, *self.values())
+        return append_crc(data) if crc else data
+
+    def pack_into(self, buffer, offset=0) -> int:
+        """Pack the message into buffer at offset and return the offset after it."""
+        self.codec.struct.pack_into(buffer, offset, self.codec.message_id, *self.values())
+        return offset + self.codec.size
+
+    @classmethod
+    def deserialize(cls, data: bytes):
+        return cls.codec.decode(data)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.values() == other.values()
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.codec.attributes)
+        return f"{type(self).__name__}({fields})"
+
+
+class RepeatedMessage(Message):
+    """
+    Base class for messages that end in a counted list of entries.
+
+    The count field is not stored; it is derived from the length of the entry
+    list when the message is packed.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, hardware_address, *values):
+        self.hardware_address = hardware_address
+        for name, value in zip(self.codec.attributes[1:], values):
+            setattr(self, name, value)
+
+    def values(self):
+        return tuple(getattr(self, name) for name in self.codec.attributes)
+
+    def nbytes(self) -> int:
+        return self.codec.size + len(getattr(self, self.codec.repeated)) * self.codec.entry_struct.size
+
+    def serialize(self, crc=False) -> bytes:
+        buffer = bytearray(self.nbytes())
+        self.pack_into(buffer)
+        return append_crc(buffer) if crc else bytes(buffer)
+
+    def pack_into(self, buffer, offset=0) -> int:
+        message_codec = self.codec
+        entries = getattr(self, message_codec.repeated)
+        if len(entries) > message_codec.max_entries:
+            raise ValueError(f"{message_codec.name} holds at most {message_codec.max_entries} entries")
+
+        fixed = [
+            len(entries) if name == message_codec.count_field else getattr(self, name)
+            for name in message_codec.header_fields + message_codec.fields
+        ]
+        message_codec.struct.pack_into(buffer, offset, message_codec.message_id, *fixed)
+        offset += message_codec.size
+        pack_entry = message_codec.entry_struct.pack_into
+        entry_size = message_codec.entry_struct.size
+        for entry in entries:
+            pack_entry(buffer, offset, *entry)
+            offset += entry_size
+        return offset
+
+
+class MessageCodec:
+    """
+    Precompiled encoder/decoder for a single message type.
+
+    For messages with a "repeated" section, size is the size of the fixed part
+    and frame_size() gives the full length of a received frame.
+    """
+
+    __slots__ = ("name", "message_id", "description", "header_fields", "fields",
+                 "attributes", "struct", "size", "max_size", "message_class",
+                 "repeated", "count_field", "count_index", "entry_fields",
+                 "entry_struct", "max_entries")
+
+    def __init__(self, name, message_id, description, header_fields, fields,
+                 repeated=None, byte_order="<"):
+        self.name = name
+        self.message_id = message_id
+        self.description = description
+        self.header_fields = tuple(f["name"] for f in header_fields)
+        self.fields = tuple(f["name"] for f in fields)
+        self.attributes = self.header_fields + self.fields
+
+        fmt = byte_order + "B" + "".join(
+            FIELD_FORMATS[f["type"]] for f in list(header_fields) + list(fields)
+        )
+        self.struct = struct.Struct(fmt)
+        self.size = self.struct.size
+        self.max_size = self.size
+
+        self.repeated = None
+        self.count_field = None
+        self.count_index = None
+        self.entry_fields = ()
+        self.entry_struct = None
+        self.max_entries = 0
+
+        if repeated is not None:
+            self.repeated = repeated["name"]
+            self.count_field = repeated["count_field"]
+            # Index into the unpacked fixed values (message id first)
+            self.count_index = 1 + self.attributes.index(self.count_field)
+            self.entry_fields = tuple(f["name"] for f in repeated["fields"])
+            self.entry_struct = struct.Struct(
+                byte_order + "".join(FIELD_FORMATS[f["type"]] for f in repeated["fields"])
+            )
+            count_type = next(f["type"] for f in fields if f["name"] == self.count_field)
+            self.max_entries = 2 ** (8 * struct.calcsize(FIELD_FORMATS[count_type])) - 1
+            self.max_size = self.size + self.max_entries * self.entry_struct.size
+            self.attributes = tuple(a for a in self.attributes if a != self.count_field) + (self.repeated,)
+            namespace = {"__slots__": self.attributes[1:], "codec": self}
+            self.message_class = type(name, (RepeatedMessage,), namespace)
+            return
+
+        # The base class already provides a slot for the header address
+        slots = tuple(name for name in self.attributes if name not in Message.__slots__)
+        namespace = {"__slots__": slots, "codec": self}
+        namespace.update(_generate_methods(self))
+        self.message_class = type(name, (Message,), namespace)
+
+    def frame_size(self, buffer, offset=0):
+        """
+        Return the full length of the frame starting at offset.
+
+        Returns:
+            int: The frame length, or None if the buffer is too short to tell.
+        """
+        if self.entry_struct is None:
+            return self.size
+        if len(buffer) - offset < self.size:
+            return None
+        count = self.struct.unpack_from(buffer, offset)[self.count_index]
+        return self.size + count * self.entry_struct.size
+
+    def pack_into(self, buffer, offset, *values) -> int:
+        """
+        Pack raw values (header fields then payload fields) into buffer.
+
+        Only the fixed part is packed for messages with repeated entries.
+
+        Returns:
+            int: The offset just past the packed values.
+        """
+        self.struct.pack_into(buffer, offset, self.message_id, *values)
+        return offset + self.size
+
+    def unpack_from(self, buffer, offset=0) -> tuple:
+        """Unpack the raw values (without the message id) from buffer at offset."""
+        return self.struct.unpack_from(buffer, offset)[1:]
+
+    def unpack_entries(self, buffer, offset=0) -> list:
+        """Unpack the repeated entries of the frame starting at offset as tuples."""
+        count = self.struct.unpack_from(buffer, offset)[self.count_index]
+        start = offset + self.size
+        end = start + count * self.entry_struct.size
+        return list(self.entry_struct.iter_unpack(memoryview(buffer)[start:end]))
+
+    def decode(self, buffer, offset=0):
+        """Decode a new message instance from buffer at offset."""
+        values = self.struct.unpack_from(buffer, offset)
+        if self.entry_struct is None:
+            return self.message_class(*values[1:])
+        fixed = [v for i, v in enumerate(values) if i and i != self.count_index]
+        return self.message_class(*fixed, self.unpack_entries(buffer, offset))
+
+    def decode_into(self, message, buffer, offset=0):
+        """Overwrite an existing message instance with the values at offset."""
+        if self.entry_struct is not None:
+            decoded = self.decode(buffer, offset)
+            for name in self.attributes:
+                setattr(message, name, getattr(decoded, name))
+            return message
+        message._assign(*self.struct.unpack_from(buffer, offset))
+        return message
+
+
+def _generate_methods(message_codec):
+    """
+    Generate __init__/_assign/values/serialize/pack_into for a message class.
+
+    Spelling the field names out in generated source avoids the per-call
+    getattr/setattr loops of the generic base class implementations.
+    """
+    args = ", ".join(message_codec.attributes)
+    assignments = "".join(f"    self.{name} = {name}\n" for name in message_codec.attributes)
+    attributes = "".join(f"self.{name}, " for name in message_codec.attributes)
+    source = (
+        f"def __init__(self, {args}):\n{assignments}"
+        f"def _assign(self, _message_id, {args}):\n{assignments}"
+        f"def values(self):\n    return ({attributes})\n"
+        f"def serialize(self, crc=False):\n"
+        f"    data = _pack(_id, {attributes})\n"
+        f"    return _append_crc(data) if crc else data\n"
+        f"def pack_into(self, buffer, offset=0):\n"
+        f"    _pack_into(buffer, offset, _id, {attributes})\n"
+        f"    return offset + _size\n"
+    )
+    namespace = {
+        "_pack": message_codec.struct.pack,
+        "_pack_into": message_codec.struct.pack_into,
+        "_id": message_codec.message_id,
+        "_size": message_codec.size,
+        "_append_crc": append_crc,
+    }
+    exec(source, namespace)
+    return {name: namespace[name] for name in ("__init__", "_assign", "values", "serialize", "pack_into")}
+
+
+def load_schema(path=MESSAGES_JSON, extensions=(HOST_MESSAGES_JSON,)):
+    """
+    Build the codec table for a messages.json schema.
+
+    Args:
+        path (str): Path to the messages.json file.
+        extensions (tuple of str): Host-only schemas whose messages are added
+            with the header of path.
+
+    Returns:
+        dict: Message id -> MessageCodec.
+    """
+    with open(path) as f:
+        schema = json.load(f)
+
+    header = schema["header"]
+    if FIELD_FORMATS.get(header.get("message_id_type", "u8")) != "B":
+        raise ValueError("Only u8 message ids are supported")
+
+    messages = list(schema["messages"].values())
+    for extension in extensions:
+        with open(extension) as f:
+            messages.extend(json.load(f)["messages"].values())
+
+    codecs = {}
+    for message in messages:
+        if int(message["id"]) in codecs:
+            raise ValueError(f"Message id {message['id']} is defined twice")
+        message_codec = MessageCodec(
+            message["name"],
+            int(message["id"]),
+            message.get("description", ""),
+            header["fields"],
+            message["fields"],
+            message.get("repeated"),
+        )
+        codecs[message_codec.message_id] = message_codec
+    return codecs
+
+
+CODECS = load_schema()
+CODECS_BY_NAME = {c.name: c for c in CODECS.values()}
+MAX_MESSAGE_SIZE = max(c.max_size for c in CODECS.values())
+
+# Expose the generated classes as module attributes (codec.rotate_servo, ...)
+globals().update({c.name: c.message_class for c in CODECS.values()})
+
+
+def read_message(buff, offset=0, crc=False):
+    """
+    Decode the message starting at offset.
+
+    Args:
+        crc (bool): The message is followed by a CRC16, which is checked.
+
+    Returns:
+        Message: The decoded message, or None if the message id is unknown.
+
+    Raises:
+        CrcError: If crc is set and the CRC doesn't match.
+    """
+    message_codec = CODECS.get(buff[offset])
+    if message_codec is None:
+        return None
+    if crc:
+        end = offset + (message_codec.frame_size(buff, offset) or message_codec.size) + CRC_SIZE
+        strip_crc(memoryview(buff)[offset:end])
+    return message_codec.decode(buff, offset)
+
+
+def encode_stream(messages, buffer=None, crc=False):
+    """
+    Pack a sequence of messages back-to-back into a (reusable) buffer.
+
+    Args:
+        messages (iterable of Message): The messages to pack.
+        buffer (bytearray): Optional buffer to pack into; must be large enough.
+        crc (bool): Follow every message with its CRC16.
+
+    Returns:
+        memoryview: A view over the packed bytes.
+    """
+    trailer = CRC_SIZE if crc else 0
+    if buffer is None:
+        messages = list(messages)
+        buffer = bytearray(sum(m.nbytes() + trailer for m in messages))
+    offset = 0
+    for message in messages:
+        start = offset
+        offset = message.pack_into(buffer, offset)
+        if crc:
+            value = crc16(memoryview(buffer)[start:offset])
+            buffer[offset] = value >> 8
+            buffer[offset + 1] = value & 0xFF
+            offset += CRC_SIZE
+    return memoryview(buffer)[:offset]
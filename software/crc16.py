@@ -0,0 +1,115 @@
+"""
+Modbus CRC16 for host <-> feeder frames.
+
+Same checksum as generate_crc16() in firmware/lib/modbus/src/modbus.zig
+(reflected polynomial 0xA001, initial value 0xFFFF), computed a byte at a
+time from a precomputed 256 entry table instead of bit by bit. Like the
+firmware's append_crc_to_data(), the CRC is appended high byte first:
+
+    frame = append_crc(codec.rotate_servo(0, 500).serialize())
+    payload = strip_crc(frame)   # raises CrcError if the frame was corrupted
+
+validate_frames() checks many equally sized frames in one buffer at once
+(e.g. a burst of acks from every feeder on the bus) with numpy.
+"""
+CRC_INIT = 0xFFFF
+CRC_POLYNOMIAL = 0xA001
+CRC_SIZE = 2
+
+
+class CrcError(ValueError):
+    """Raised when a frame's CRC does not match its contents."""
+
+
+def _make_table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ CRC_POLYNOMIAL if crc & 1 else crc >> 1
+        table.append(crc)
+    return tuple(table)
+
+
+CRC_TABLE = _make_table()
+
+
+def crc16(data, crc=CRC_INIT):
+    """CRC16 of a bytes-like object; pass a previous result as crc to continue it."""
+    table = CRC_TABLE
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return crc
+
+
+def crc16_bitwise(data, crc=CRC_INIT):
+    """Bit-at-a-time reference implementation, as in the firmware."""
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ CRC_POLYNOMIAL if crc & 1 else crc >> 1
+    return crc
+
+
+def append_crc(data) -> bytes:
+    """Return data followed by its CRC, high byte first."""
+    return bytes(data) + crc16(data).to_bytes(CRC_SIZE, "big")
+
+
+def check_crc(frame) -> bool:
+    """True if the last two bytes of frame are the CRC of the rest."""
+    if len(frame) < CRC_SIZE:
+        return False
+    return crc16(frame[:-CRC_SIZE]) == (frame[-2] << 8 | frame[-1])
+
+
+def strip_crc(frame):
+    """Validate frame and return it without the CRC bytes."""
+    if not check_crc(frame):
+        raise CrcError(f"CRC mismatch in frame {bytes(frame).hex(' ')}")
+    return frame[:-CRC_SIZE]
+
+
+def validate_frames(buffer, frame_size, count=None, offset=0):
+    """
+    Check the CRC of back-to-back frames of frame_size bytes (CRC included).
+
+    The table lookups run column by column over every frame at once, so the
+    cost is frame_size numpy operations regardless of the number of frames.
+
+    Args:
+        buffer (bytes-like): Buffer holding the frames.
+        frame_size (int): Size of each frame including its CRC.
+        count (int): Number of frames; defaults to as many as fit in the buffer.
+        offset (int): Position of the first frame.
+
+    Returns:
+        numpy.ndarray: bool array, True for every frame with a valid CRC.
+    """
+    import numpy as np
+
+    if frame_size <= CRC_SIZE:
+        raise ValueError("Frames must be longer than the CRC")
+    if count is None:
+        count = (len(buffer) - offset) // frame_size
+    frames = np.frombuffer(buffer, dtype=np.uint8, count=count * frame_size, offset=offset)
+    frames = frames.reshape(count, frame_size)
+
+    table = _numpy_table()
+    crc = np.full(count, CRC_INIT, dtype=np.uint16)
+    for column in range(frame_size - CRC_SIZE):
+        crc = (crc >> 8) ^ table[(crc ^ frames[:, column]) & 0xFF]
+    received = (frames[:, -2].astype(np.uint16) << 8) | frames[:, -1]
+    return crc == received
+
+
+_table_array = None
+
+
+def _numpy_table():
+    global _table_array
+    if _table_array is None:
+        import numpy as np
+
+        _table_array = np.array(CRC_TABLE, dtype=np.uint16)
+    return _table_array
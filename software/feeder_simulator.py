@@ -0,0 +1,288 @@
+"""
+Simulated feeder bus for hardware-free throughput and latency testing.
+
+SimulatedSerial implements the parts of the serial.Serial interface the host
+tooling uses (write, read, in_waiting, timeout, open/close) on top of
+FeederStandIn, and models the link on the way:
+
+- both directions are limited to the configured baud rate (10 bits per byte),
+- each command is acked after response_latency (+ jitter) seconds,
+- commands can be dropped and ack bytes corrupted at configurable rates,
+- with firmware_quirks (the default) it behaves like main.zig: only the first
+  message of each write (USB read) is parsed, and a command that arrives
+  before the previous one has been acked is ignored. Pass
+  firmware_quirks=False to model firmware that queues commands.
+
+It can be handed to PipelinedSender/FeederBusClient directly, or served on a
+pseudo terminal so the existing scripts can open it like a real port:
+
+    python -m software.feeder_simulator --feeders 255 --latency 0.002
+    # Serving simulated feeders on /dev/pts/5
+
+The hardware_address field is a u8, so one link carries at most 255 feeders;
+a 512 feeder setup is simulated as two ports.
+"""
+import argparse
+import heapq
+import os
+import random
+import threading
+import time
+
+from software.firmware_standin import BROADCAST_ADDRESS, FeederStandIn
+
+DEFAULT_BAUDRATE = 115200
+BITS_PER_BYTE = 10  # start + 8 data + stop bits
+
+
+class SimulatedSerial:
+    """
+    In-process stand-in for serial.Serial connected to simulated feeders.
+
+    Args:
+        feeders (int): Number of feeders, at hardware addresses 0..feeders-1.
+        baudrate (int): Link speed used for the bandwidth model; 0 disables it.
+        response_latency (float): Seconds between a command arriving and its ack.
+        jitter (float): Extra uniformly distributed latency in seconds.
+        drop_rate (float): Probability a command is lost (no effect, no ack).
+        corrupt_rate (float): Probability an ack has one byte flipped.
+        timeout (float): Read timeout, as for serial.Serial.
+        seed (int): Seed for the drop/corrupt/jitter random generator.
+        firmware_quirks (bool): Parse one message per write and ignore commands
+            arriving while the previous one is still being handled, as the
+            current firmware does.
+    """
+
+    def __init__(self, feeders=1, baudrate=DEFAULT_BAUDRATE, response_latency=0.001,
+                 jitter=0.0, drop_rate=0.0, corrupt_rate=0.0, timeout=None, seed=None,
+                 firmware_quirks=True):
+        if not 0 < feeders <= BROADCAST_ADDRESS:
+            raise ValueError(f"A simulated link holds 1..{BROADCAST_ADDRESS} feeders")
+        self.device = FeederStandIn(range(feeders))
+        self.baudrate = baudrate
+        self.response_latency = response_latency
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self.corrupt_rate = corrupt_rate
+        self.timeout = timeout
+        self.firmware_quirks = firmware_quirks
+        self.is_open = True
+
+        self.bytes_written = 0
+        self.bytes_read = 0
+        self.dropped_commands = 0
+        self.corrupted_acks = 0
+        self.unparsed_frames = 0  # frames after the first in a write (firmware_quirks)
+        self.busy_drops = 0  # commands that arrived while busy (firmware_quirks)
+
+        self._random = random.Random(seed)
+        self._byte_time = BITS_PER_BYTE / baudrate if baudrate else 0.0
+        self._tx_free_at = 0.0  # host -> device line busy until
+        self._rx_free_at = 0.0  # device -> host line busy until
+        self._deliveries = []  # heap of (deliver_at, sequence, bytes)
+        self._sequence = 0
+        self._busy_until = 0.0  # the device ignores commands until its last ack is sent
+        self._rx_buffer = bytearray()
+        self._cond = threading.Condition()
+
+    @property
+    def feeders(self):
+        return len(self.device.addresses)
+
+    @property
+    def in_waiting(self) -> int:
+        with self._cond:
+            self._collect(time.perf_counter())
+            return len(self._rx_buffer)
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        with self._cond:
+            self.is_open = False
+            self._cond.notify_all()
+
+    def reset_input_buffer(self):
+        with self._cond:
+            self._rx_buffer.clear()
+
+    def flush(self):
+        pass
+
+    def write(self, data) -> int:
+        """Send bytes to the simulated feeders and schedule their acks."""
+        if not self.is_open:
+            raise OSError("Port is closed")
+        data = bytes(data)
+        with self._cond:
+            now = time.perf_counter()
+            start = max(now, self._tx_free_at)
+            self._tx_free_at = start + len(data) * self._byte_time
+            self.bytes_written += len(data)
+
+            # Messages complete as their last byte arrives; approximating every
+            # message in this write as arriving at the end is close enough.
+            arrived_at = self._tx_free_at
+            messages = self.device.feed(data)
+            if self.firmware_quirks:
+                # usb_cdc_read() hands main.zig one buffer and only its first message is parsed
+                self.unparsed_frames += max(0, len(messages) - 1)
+                messages = messages[:1]
+                if messages and arrived_at < self._busy_until:
+                    # "Trying to send a cmd before its ready again"
+                    self.busy_drops += 1
+                    messages = []
+            for message, frame in messages:
+                if self.drop_rate and self._random.random() < self.drop_rate:
+                    self.dropped_commands += 1
+                    continue
+                ack = self.device.handle(message, frame)
+                if ack is not None:
+                    self._schedule(arrived_at, ack)
+            self._cond.notify_all()
+        return len(data)
+
+    def read(self, size=1) -> bytes:
+        """Read up to size bytes, waiting at most timeout seconds (forever if None)."""
+        deadline = None if self.timeout is None else time.perf_counter() + self.timeout
+        with self._cond:
+            while True:
+                now = time.perf_counter()
+                self._collect(now)
+                if len(self._rx_buffer) >= size or not self.is_open:
+                    break
+                if deadline is not None and now >= deadline:
+                    break
+                wait = None if deadline is None else deadline - now
+                if self._deliveries:
+                    next_delivery = self._deliveries[0][0] - now
+                    wait = next_delivery if wait is None else min(wait, next_delivery)
+                self._cond.wait(wait)
+
+            data = bytes(self._rx_buffer[:size])
+            del self._rx_buffer[:size]
+            self.bytes_read += len(data)
+            return data
+
+    def _schedule(self, received_at, ack):
+        latency = self.response_latency
+        if self.jitter:
+            latency += self._random.uniform(0, self.jitter)
+        if self.corrupt_rate and self._random.random() < self.corrupt_rate:
+            ack = bytearray(ack)
+            ack[self._random.randrange(len(ack))] ^= 1 << self._random.randrange(8)
+            self.corrupted_acks += 1
+
+        start = max(received_at + latency, self._rx_free_at)
+        self._busy_until = start
+        self._rx_free_at = start + len(ack) * self._byte_time
+        self._sequence += 1
+        heapq.heappush(self._deliveries, (self._rx_free_at, self._sequence, bytes(ack)))
+
+    def _collect(self, now):
+        while self._deliveries and self._deliveries[0][0] <= now:
+            self._rx_buffer += heapq.heappop(self._deliveries)[2]
+
+
+class PtyFeederSimulator:
+    """
+    Serve a SimulatedSerial on a pseudo terminal.
+
+    Scripts open the returned port path with serial.Serial as if it were
+    /dev/ttyACM0. Only available on POSIX systems.
+    """
+
+    def __init__(self, simulated=None, **kwargs):
+        import pty
+        import tty
+
+        self.simulated = simulated or SimulatedSerial(**kwargs)
+        self.simulated.timeout = 0.01
+        self._master, self._slave = pty.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._running = False
+        self._threads = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def start(self):
+        self._running = True
+        self._threads = [
+            threading.Thread(target=self._pump_commands, daemon=True),
+            threading.Thread(target=self._pump_acks, daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def close(self):
+        self._running = False
+        self.simulated.close()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        os.close(self._slave)
+        os.close(self._master)
+
+    def _pump_commands(self):
+        import select
+
+        while self._running:
+            readable, _, _ = select.select([self._master], [], [], 0.05)
+            if readable:
+                try:
+                    data = os.read(self._master, 4096)
+                except OSError:
+                    return
+                self.simulated.write(data)
+
+    def _pump_acks(self):
+        while self._running:
+            data = self.simulated.read(self.simulated.in_waiting or 1)
+            if data:
+                try:
+                    os.write(self._master, data)
+                except OSError:
+                    return
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve simulated feeders on a pseudo terminal")
+    parser.add_argument("--feeders", type=int, default=1)
+    parser.add_argument("--baudrate", type=int, default=DEFAULT_BAUDRATE)
+    parser.add_argument("--latency", type=float, default=0.001, help="ack latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--corrupt-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--queueing-firmware", action="store_true",
+                        help="Parse every message of a write and never drop commands while busy")
+    args = parser.parse_args()
+
+    simulator = PtyFeederSimulator(
+        feeders=args.feeders,
+        baudrate=args.baudrate,
+        response_latency=args.latency,
+        jitter=args.jitter,
+        drop_rate=args.drop_rate,
+        corrupt_rate=args.corrupt_rate,
+        seed=args.seed,
+        firmware_quirks=not args.queueing_firmware,
+    )
+    with simulator:
+        print(f"Serving {args.feeders} simulated feeders on {simulator.port}")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            print("\nStopping simulator")
+
+
+if __name__ == "__main__":
+    main()
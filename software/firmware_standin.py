@@ -0,0 +1,89 @@
+"""
+Python stand-in for the message handling in firmware/src/main.zig.
+
+Mirrors handleMessage(): commands update per-address servo/LED state and are
+acked by echoing the command back. It lets the host stack be exercised
+without a feeder attached, including messages (like rotate_servo_batch) that
+the firmware does not implement yet.
+"""
+from software.framer import MessageFramer
+
+# Header address used for frames meant for every feeder on the bus
+BROADCAST_ADDRESS = 255
+
+
+class FeederStandIn:
+    """
+    Feeder firmware behaviour for a range of hardware addresses.
+
+    Args:
+        addresses (iterable of int): Hardware addresses that respond.
+    """
+
+    def __init__(self, addresses=range(BROADCAST_ADDRESS)):
+        self.addresses = set(addresses)
+        self.servo_angles = {}  # hardware_address -> last commanded angle
+        self.leds = {}  # (hardware_address, led_index) -> (green, red, blue)
+        self.move_counts = {}  # hardware_address -> number of moves
+        self._framer = MessageFramer()
+
+    def handle(self, message, frame):
+        """
+        Apply one decoded message.
+
+        Args:
+            message: The decoded codec message.
+            frame (bytes-like): The raw frame, echoed back as the ack.
+
+        Returns:
+            bytes: The ack to send back, or None if nothing answers.
+        """
+        name = message.codec.name
+        address = message.hardware_address
+
+        if name == "rotate_servo_batch":
+            moved = False
+            for move_address, angle in message.moves:
+                if move_address in self.addresses:
+                    self._move(move_address, angle)
+                    moved = True
+            return bytes(frame) if moved else None
+
+        if address not in self.addresses:
+            return None
+
+        if name == "rotate_servo":
+            self._move(address, message.angle)
+        elif name == "set_led_in_array":
+            self.leds[(address, message.led_index)] = (message.green, message.red, message.blue)
+        elif name == "reset_usb_boot":
+            # The rp2040 drops off the bus without answering
+            return None
+        return bytes(frame)
+
+    def feed(self, data):
+        """
+        Split raw bytes received from the host into messages.
+
+        Returns:
+            list of tuple: (decoded message, frame) for every complete message.
+        """
+        return [(message_codec.decode(frame), frame) for message_codec, frame in self._framer.feed(data)]
+
+    def handle_bytes(self, data):
+        """
+        Feed raw bytes received from the host.
+
+        Returns:
+            bytes: The concatenated acks for every complete message.
+        """
+        acks = []
+        for message, frame in self.feed(data):
+            ack = self.handle(message, frame)
+            if ack is not None:
+                acks.append(ack)
+        return b"".join(acks)
+
+    def _move(self, address, angle):
+        self.servo_angles[address] = angle
+        self.move_counts[address] = self.move_counts.get(address, 0) + 1
@@ -0,0 +1,128 @@
+"""
+Incremental framer for the feeder protocol.
+
+Serial reads return whatever bytes happen to be waiting, which may be several
+back-to-back replies or only part of one. MessageFramer accepts those chunks,
+uses the message lengths from messages.json (via software/codec.py) to split
+them into complete messages, and keeps any partial tail for the next chunk.
+
+    framer = MessageFramer()
+    while True:
+        for message_codec, frame in framer.feed(ser.read(ser.in_waiting or 1)):
+            handle(message_codec.decode(frame))
+
+With crc=True every frame is followed by a Modbus CRC16 (see software/crc16.py).
+Frames whose CRC doesn't match are counted in crc_errors and skipped one byte
+at a time until the stream lines up again; yielded frames never include the
+CRC bytes.
+"""
+import software.codec as codec
+from software.crc16 import CRC_SIZE, crc16
+
+
+class MessageFramer:
+    """
+    Split a byte stream into complete messages.
+
+    Frames are yielded as memoryview slices into the internal buffer, so no
+    bytes are copied per message. A frame is only valid until the next call to
+    feed(); copy it with bytes(frame) if it has to be kept.
+
+    Unknown message ids cannot be sized, so the framer drops one byte at a time
+    until it finds a known id again (counted in dropped_bytes).
+    """
+
+    def __init__(self, codecs=None, crc=False):
+        self.codecs = codecs if codecs is not None else codec.CODECS
+        self.crc = crc
+        # Lookup table indexed by message id byte, None for unknown ids
+        self._table = [self.codecs.get(i) for i in range(256)]
+        self._buffer = bytearray()
+        self.dropped_bytes = 0
+        self.frame_count = 0
+        self.crc_errors = 0
+
+    @property
+    def pending(self) -> int:
+        """Number of buffered bytes that do not form a complete message yet."""
+        return len(self._buffer)
+
+    def reset(self):
+        """Discard any partially received message."""
+        self._buffer = bytearray()
+
+    def feed(self, chunk):
+        """
+        Add a chunk of received bytes and iterate over every complete message.
+
+        The chunk is buffered immediately; the returned iterator should be
+        exhausted before the next call so the consumed bytes are released.
+
+        Args:
+            chunk (bytes-like): Bytes as returned by ser.read().
+
+        Returns:
+            iterator: (MessageCodec, memoryview) for each complete message.
+        """
+        self._buffer += chunk
+        return self._frames()
+
+    def _frames(self):
+        buffer = self._buffer
+        table = self._table
+        end = len(buffer)
+        offset = 0
+        trailer = CRC_SIZE if self.crc else 0
+
+        view = memoryview(buffer)
+        try:
+            while offset < end:
+                message_codec = table[buffer[offset]]
+                if message_codec is None:
+                    self.dropped_bytes += 1
+                    offset += 1
+                    continue
+                frame_end = offset + message_codec.size
+                if frame_end + trailer > end:
+                    break
+                if message_codec.entry_struct is not None:
+                    frame_end = offset + message_codec.frame_size(buffer, offset)
+                    if frame_end + trailer > end:
+                        break
+                if trailer and crc16(view[offset:frame_end]) != (buffer[frame_end] << 8 | buffer[frame_end + 1]):
+                    self.crc_errors += 1
+                    self.dropped_bytes += 1
+                    offset += 1
+                    continue
+                self.frame_count += 1
+                yield message_codec, view[offset:frame_end]
+                offset = frame_end + trailer
+        finally:
+            view.release()
+            self._consume(offset)
+
+    def messages(self, chunk):
+        """Add a chunk and return the decoded messages as a list."""
+        return [message_codec.decode(frame) for message_codec, frame in self.feed(chunk)]
+
+    def _consume(self, count):
+        if count == 0:
+            return
+        try:
+            del self._buffer[:count]
+        except BufferError:
+            # A caller is still holding a frame view; leave that buffer alone
+            # and continue with a copy of the unread tail.
+            self._buffer = bytearray(self._buffer[count:])
+
+
+def read_messages(buff, crc=False):
+    """
+    Decode every complete message in a buffer.
+
+    Returns:
+        tuple: (list of messages, number of trailing bytes that were incomplete)
+    """
+    framer = MessageFramer(crc=crc)
+    messages = framer.messages(buff)
+    return messages, framer.pending
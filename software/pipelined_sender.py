@@ -0,0 +1,253 @@
+"""
+Pipelined command sender for the feeder protocol.
+
+write_message() in the test scripts writes one command and then blocks on a
+4 byte ack before the next command can leave, so every servo move costs a full
+USB round trip. PipelinedSender instead keeps up to `window` commands in
+flight: commands are written back-to-back, a reader thread matches the echoed
+acks to their requests and records latency, and commands that are not acked
+within `ack_timeout` are failed with a TimeoutError.
+
+The current firmware parses only the first message of each USB read and
+drops commands that arrive while it is still busy with the previous one
+(ready_time in main.zig), so against a real feeder the window must stay at
+its default of 1: the sender then still saves the Python-side turnaround but
+never has two commands on the wire. Larger windows are for firmware that
+queues commands, and for the simulator (SimulatedSerial(firmware_quirks=False)).
+
+    with PipelinedSender(ser, window=16) as sender:
+        for address in range(512):
+            sender.send(codec.rotate_servo(address, 500))
+        sender.flush()
+        print(sender.stats.summary())
+"""
+import collections
+import threading
+import time
+from concurrent.futures import Future
+
+from software.framer import MessageFramer
+
+# How long the reader thread blocks in ser.read() before checking for timeouts
+READ_POLL_INTERVAL = 0.01
+
+# Latencies kept for the summary percentiles
+LATENCY_HISTORY = 10000
+
+
+class PendingCommand:
+    """A command that has been written and is waiting for its ack."""
+
+    __slots__ = ("message", "key", "sent_at", "deadline", "future")
+
+    def __init__(self, message, key, sent_at, deadline):
+        self.message = message
+        self.key = key
+        self.sent_at = sent_at
+        self.deadline = deadline
+        self.future = Future()
+
+    def result(self, timeout=None):
+        """Block until the ack arrives and return the decoded ack message."""
+        return self.future.result(timeout)
+
+
+class SenderStats:
+    """Per-command latency and timeout bookkeeping."""
+
+    def __init__(self, history=LATENCY_HISTORY):
+        # Most recent latencies only, so a long run doesn't grow without bound
+        self.latencies = collections.deque(maxlen=history)
+        self.sent = 0
+        self.acked = 0
+        self.timeouts = 0
+        self.unmatched_acks = 0
+
+    def summary(self):
+        """
+        Summarize the latencies recorded so far.
+
+        Returns:
+            dict: Counts plus mean/p50/p99/max latency in milliseconds over
+            the most recent LATENCY_HISTORY acks.
+        """
+        result = {
+            "sent": self.sent,
+            "acked": self.acked,
+            "timeouts": self.timeouts,
+            "unmatched_acks": self.unmatched_acks,
+        }
+        if self.latencies:
+            ordered = sorted(self.latencies)
+            result.update({
+                "mean_ms": 1000 * sum(ordered) / len(ordered),
+                "p50_ms": 1000 * ordered[len(ordered) // 2],
+                "p99_ms": 1000 * ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))],
+                "max_ms": 1000 * ordered[-1],
+            })
+        return result
+
+
+class PipelinedSender:
+    """
+    Send commands without waiting for each ack before writing the next one.
+
+    The firmware acks a command by echoing it back, so acks are matched to
+    requests by (message_id, hardware_address) in FIFO order.
+
+    Args:
+        ser (serial.Serial): Open serial port. Its read timeout is lowered so
+            the reader thread can check for expired commands.
+        window (int): Maximum number of commands in flight. Keep 1 for the
+            current firmware, which drops commands sent while it is busy.
+        ack_timeout (float): Seconds to wait for an ack before failing a command.
+    """
+
+    def __init__(self, ser, window=1, ack_timeout=2.0):
+        if window < 1:
+            raise ValueError("window must be at least 1")
+        self.ser = ser
+        self.window = window
+        self.ack_timeout = ack_timeout
+        self.stats = SenderStats()
+
+        self._framer = MessageFramer()
+        self._slots = threading.Semaphore(window)
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._pending = collections.OrderedDict()  # sequence -> PendingCommand
+        self._by_key = collections.defaultdict(collections.deque)
+        self._sequence = 0
+        self._running = False
+        self._reader = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._pending)
+
+    def start(self):
+        """Start the ack reader thread."""
+        if self._running:
+            return
+        self.ser.timeout = READ_POLL_INTERVAL
+        self._running = True
+        self._reader = threading.Thread(target=self._read_loop, name="ack-reader", daemon=True)
+        self._reader.start()
+
+    def close(self):
+        """Stop the reader thread and fail anything still waiting for an ack."""
+        self._running = False
+        if self._reader is not None:
+            self._reader.join()
+            self._reader = None
+        with self._lock:
+            for command in self._pending.values():
+                self._fail(command, ConnectionError("Sender closed before ack"))
+                self._slots.release()
+            self._pending.clear()
+            self._by_key.clear()
+            self._idle.notify_all()
+
+    def send(self, message, timeout=None):
+        """
+        Write a command as soon as a window slot is free.
+
+        Args:
+            message: A codec message (anything with serialize(), message_id and
+                hardware_address).
+            timeout (float): Seconds to wait for a free slot, None to wait forever.
+
+        Returns:
+            PendingCommand: Resolves to the ack message, or raises TimeoutError.
+        """
+        if not self._running:
+            raise RuntimeError("Sender is not started")
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError("No free slot in the command window")
+
+        try:
+            data = message.serialize()
+        except BaseException:
+            self._slots.release()
+            raise
+        key = (message.message_id, message.hardware_address)
+        with self._lock:
+            now = time.perf_counter()
+            command = PendingCommand(message, key, now, now + self.ack_timeout)
+            self._sequence += 1
+            self._pending[self._sequence] = command
+            self._by_key[key].append(self._sequence)
+            self.stats.sent += 1
+        self.ser.write(data)
+        return command
+
+    def send_many(self, messages):
+        """Send several commands back-to-back and return their PendingCommands."""
+        return [self.send(message) for message in messages]
+
+    def flush(self, timeout=None) -> bool:
+        """
+        Wait until every command in flight has been acked or has timed out.
+
+        Returns:
+            bool: False if timeout expired with commands still in flight.
+        """
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._pending, timeout)
+
+    def _read_loop(self):
+        while self._running:
+            data = self.ser.read(self.ser.in_waiting or 1)
+            now = time.perf_counter()
+            if data:
+                with self._lock:
+                    for message_codec, frame in self._framer.feed(data):
+                        self._ack(message_codec, frame, now)
+            self._expire(now)
+
+    def _ack(self, message_codec, frame, now):
+        # Header layout is message_id, hardware_address
+        sequences = self._by_key.get((frame[0], frame[1]))
+        if not sequences:
+            self.stats.unmatched_acks += 1
+            return
+        command = self._pending.pop(sequences.popleft())
+        if not sequences:
+            del self._by_key[command.key]
+
+        self.stats.acked += 1
+        self.stats.latencies.append(now - command.sent_at)
+        command.future.set_result(message_codec.decode(frame))
+        self._release()
+
+    def _expire(self, now):
+        with self._lock:
+            # Commands are ordered by send time, so only the head can expire first
+            while self._pending:
+                sequence, command = next(iter(self._pending.items()))
+                if command.deadline > now:
+                    break
+                del self._pending[sequence]
+                sequences = self._by_key[command.key]
+                sequences.remove(sequence)
+                if not sequences:
+                    del self._by_key[command.key]
+                self.stats.timeouts += 1
+                self._fail(command, TimeoutError(f"No ack for {command.message!r}"))
+                self._release()
+
+    def _fail(self, command, error):
+        if not command.future.done():
+            command.future.set_exception(error)
+
+    def _release(self):
+        self._slots.release()
+        if not self._pending:
+            self._idle.notify_all()
@@ -0,0 +1,147 @@
+"""
+Compare detector backends on recorded frames.
+
+Runs every selected backend over a directory of frames and reports per-backend
+latency, detection rate and agreement with a reference backend (the first one
+listed), so a cheap detector can be validated against the heavy model before
+it is trusted for thousands of cycles:
+
+    python -m software.tests.compare_detectors measured_images \\
+        --backends grounding_dino contour --roi 475 300 200 200 --tolerance 3
+"""
+import argparse
+import csv
+import glob
+import math
+import os
+import statistics
+import time
+
+import cv2
+
+from software.tests.detectors import DETECTORS, get_detector
+
+IMAGE_PATTERNS = ("*.png", "*.jpg", "*.jpeg", "*.bmp")
+
+
+def load_frame_paths(directory):
+    paths = []
+    for pattern in IMAGE_PATTERNS:
+        paths.extend(glob.glob(os.path.join(directory, pattern)))
+    return sorted(paths)
+
+
+def compare_detectors(frame_paths, backends, roi=None, tolerance=3.0):
+    """
+    Run each backend on each frame.
+
+    Args:
+        frame_paths (list of str): Image files to process.
+        backends (list of str): Backend names; the first is the reference.
+        roi (dict): Optional region of interest passed to every backend.
+        tolerance (float): Max distance in pixels to count as agreeing.
+
+    Returns:
+        rows (list of dict): One row per frame and backend.
+        summary (dict): backend -> latency/detection/agreement statistics.
+    """
+    detectors = {name: get_detector(name) for name in backends}
+    reference = backends[0]
+    rows = []
+    latencies = {name: [] for name in backends}
+    found = {name: 0 for name in backends}
+    distances = {name: [] for name in backends[1:]}
+
+    for path in frame_paths:
+        frame = cv2.imread(path)
+        if frame is None:
+            print(f"Could not read {path}, skipping")
+            continue
+
+        positions = {}
+        for name, detector in detectors.items():
+            start = time.perf_counter()
+            position, confidence = detector.locate(frame, roi)
+            elapsed = time.perf_counter() - start
+            latencies[name].append(elapsed)
+            positions[name] = position
+            if position is not None:
+                found[name] += 1
+            rows.append({
+                "frame": os.path.basename(path),
+                "backend": name,
+                "x": None if position is None else position[0],
+                "y": None if position is None else position[1],
+                "confidence": confidence,
+                "latency_ms": 1000 * elapsed,
+            })
+
+        reference_position = positions[reference]
+        for name in backends[1:]:
+            if reference_position is not None and positions[name] is not None:
+                distances[name].append(math.dist(reference_position, positions[name]))
+
+    frames = len(latencies[reference])
+    summary = {}
+    for name in backends:
+        times = sorted(latencies[name])
+        entry = {
+            "frames": frames,
+            "detection_rate": found[name] / frames if frames else 0.0,
+            "mean_ms": 1000 * statistics.fmean(times) if times else None,
+            "p95_ms": 1000 * times[int(0.95 * (len(times) - 1))] if times else None,
+        }
+        if name in distances:
+            d = distances[name]
+            entry["compared"] = len(d)
+            entry["agreement"] = sum(x <= tolerance for x in d) / len(d) if d else None
+            entry["mean_distance_px"] = statistics.fmean(d) if d else None
+        summary[name] = entry
+    return rows, summary
+
+
+def print_summary(summary, reference, tolerance):
+    print(f"\n{'backend':<16} {'found':>7} {'mean ms':>9} {'p95 ms':>9} {'agree':>7} {'mean px':>8}")
+    for name, s in summary.items():
+        mean = f"{s['mean_ms']:.2f}" if s["mean_ms"] is not None else "-"
+        p95 = f"{s['p95_ms']:.2f}" if s["p95_ms"] is not None else "-"
+        agreement = "ref" if name == reference else (
+            f"{s['agreement']:.0%}" if s.get("agreement") is not None else "-"
+        )
+        distance = f"{s['mean_distance_px']:.2f}" if s.get("mean_distance_px") is not None else "-"
+        print(f"{name:<16} {s['detection_rate']:>7.0%} {mean:>9} {p95:>9} {agreement:>7} {distance:>8}")
+    print(f"(agreement: within {tolerance} px of {reference})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare detector backends on recorded frames")
+    parser.add_argument("frames", help="Directory of recorded frames")
+    parser.add_argument("--backends", nargs="+", choices=sorted(DETECTORS),
+                        default=["hough", "contour"], help="First backend is the reference")
+    parser.add_argument("--roi", nargs=4, type=int, metavar=("X", "Y", "W", "H"))
+    parser.add_argument("--tolerance", type=float, default=3.0)
+    parser.add_argument("--csv", help="Write per-frame results to this CSV file")
+    args = parser.parse_args()
+
+    roi = None
+    if args.roi:
+        roi = dict(zip(("x_start", "y_start", "width", "height"), args.roi))
+
+    frame_paths = load_frame_paths(args.frames)
+    if not frame_paths:
+        print(f"No frames found in {args.frames}")
+        return
+
+    rows, summary = compare_detectors(frame_paths, args.backends, roi, args.tolerance)
+    print_summary(summary, args.backends[0], args.tolerance)
+
+    if args.csv:
+        with open(args.csv, mode="w", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"Saved per-frame results to {args.csv}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Detector backends shared by the feeder test scripts.
+
+Every backend implements the same protocol:
+
+    detector.locate(frame, roi) -> ((x, y), confidence)
+
+where frame is a BGR numpy image, roi is None or a dict with
+x_start/y_start/width/height (the same layout as the linearity runner's roi),
+and (x, y) is in full-frame pixels. (None, 0.0) means nothing was found.
+
+Backends:
+    hough           HoughCircles sprocket hole finder used by the linearity test
+    contour         Threshold + contour rectangle finder, cheap enough for every cycle
+    grounding_dino  Zero-shot transformer rectangle finder used by the positioning test
+
+Pick one by name with get_detector(); compare them on recorded frames with
+software/tests/compare_detectors.py.
+"""
+import abc
+
+import numpy as np
+
+# HoughCircles settings tuned for the 1.4 mm sprocket hole at 72 px diameter
+HOUGH_CIRCLE_PARAMS = {
+    "dp": 1,
+    "minDist": 20,
+    "param1": 25,
+    "param2": 20,
+    "minRadius": 36,
+    "maxRadius": 38,
+}
+
+
+def crop_roi(frame, roi):
+    """Return (cropped frame, x offset, y offset) for an optional roi dict."""
+    if not roi or roi.get("x_start") is None:
+        return frame, 0, 0
+    x0, y0 = roi["x_start"], roi["y_start"]
+    return frame[y0:y0 + roi["height"], x0:x0 + roi["width"]], x0, y0
+
+
+class Detector(abc.ABC):
+    """Base class for detector backends."""
+
+    name = None
+
+    @abc.abstractmethod
+    def locate(self, frame, roi=None):
+        """Return ((x, y), confidence) in full-frame pixels, or (None, 0.0)."""
+
+    def locate_batch(self, frames, roi=None):
+        """Locate in several frames; backends that can batch override this."""
+        return [self.locate(frame, roi) for frame in frames]
+
+
+class HoughCircleDetector(Detector):
+    """Closest HoughCircles hit to the ROI center; confidence is 1.0 on a hit."""
+
+    name = "hough"
+
+    def __init__(self, median_blur=5, **hough_params):
+        self.median_blur = median_blur
+        self.hough_params = dict(HOUGH_CIRCLE_PARAMS, **hough_params)
+
+    def locate(self, frame, roi=None):
+        import cv2
+        cropped, x0, y0 = crop_roi(frame, roi)
+        gray = cv2.cvtColor(cropped, cv2.COLOR_BGR2GRAY)
+        gray_blurred = cv2.medianBlur(gray, self.median_blur)
+        circles = cv2.HoughCircles(gray_blurred, cv2.HOUGH_GRADIENT, **self.hough_params)
+        if circles is None:
+            return None, 0.0
+
+        circles = circles[0]
+        center_x = cropped.shape[1] / 2
+        center_y = cropped.shape[0] / 2
+        distances = (circles[:, 0] - center_x) ** 2 + (circles[:, 1] - center_y) ** 2
+        x, y, _ = circles[np.argmin(distances)]
+        return (x0 + float(x), y0 + float(y)), 1.0
+
+
+class ContourRectangleDetector(Detector):
+    """
+    Leftmost rectangle-shaped blob within a size range.
+
+    The crop is blurred and Otsu-thresholded, external contours are filtered
+    by bounding box size, and the leftmost survivor wins. Confidence is the
+    contour's rectangularity (contour area / min-area-rect area).
+    """
+
+    name = "contour"
+
+    def __init__(self, min_width=20, max_width=100, min_height=20, max_height=100,
+                 dark_on_light=True, min_rectangularity=0.6):
+        """
+        Args:
+            min_width, max_width, min_height, max_height (int): Size limits in pixels.
+            dark_on_light (bool): True when the component is darker than the tape.
+            min_rectangularity (float): Minimum area ratio to count as a rectangle.
+        """
+        self.min_width = min_width
+        self.max_width = max_width
+        self.min_height = min_height
+        self.max_height = max_height
+        self.dark_on_light = dark_on_light
+        self.min_rectangularity = min_rectangularity
+
+    def locate(self, frame, roi=None):
+        import cv2
+        cropped, x0, y0 = crop_roi(frame, roi)
+        gray = cv2.GaussianBlur(cv2.cvtColor(cropped, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+        mode = cv2.THRESH_BINARY_INV if self.dark_on_light else cv2.THRESH_BINARY
+        _, mask = cv2.threshold(gray, 0, 255, mode | cv2.THRESH_OTSU)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        best = None
+        for contour in contours:
+            # Axis-aligned size limits, like the Grounding DINO box filter
+            x, y, w, h = cv2.boundingRect(contour)
+            if not (self.min_width <= w <= self.max_width and self.min_height <= h <= self.max_height):
+                continue
+            _, (rect_w, rect_h), _ = cv2.minAreaRect(contour)
+            rect_area = rect_w * rect_h
+            rectangularity = cv2.contourArea(contour) / rect_area if rect_area else 0.0
+            if rectangularity < self.min_rectangularity:
+                continue
+            cx = x + w / 2
+            if best is None or cx < best[0]:
+                best = (cx, y + h / 2, rectangularity)
+
+        if best is None:
+            return None, 0.0
+        cx, cy, rectangularity = best
+        return (x0 + cx, y0 + cy), float(rectangularity)
+
+
+class GroundingDinoDetector(Detector):
+    """Grounding DINO via GroundingDinoEngine; confidence is the box score."""
+
+    name = "grounding_dino"
+
+    def __init__(self, text="rectangle.", engine=None, **detect_kwargs):
+        self.text = text
+        self.detect_kwargs = {
+            "box_threshold": 0.2,
+            "text_threshold": 0.2,
+            "min_width": 20,
+            "max_width": 100,
+            "min_height": 20,
+            "max_height": 100,
+        }
+        self.detect_kwargs.update(detect_kwargs)
+        self._engine = engine
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            from software.tests.servo_precision_positioning.grounding_dino_engine import GroundingDinoEngine
+
+            self._engine = GroundingDinoEngine(text=self.text)
+        return self._engine
+
+    def locate(self, frame, roi=None):
+        return self.locate_batch([frame], roi)[0]
+
+    def locate_batch(self, frames, roi=None):
+        import cv2
+        from PIL import Image
+
+        if not frames:
+            return []
+        crops = []
+        for frame in frames:
+            cropped, x0, y0 = crop_roi(frame, roi)
+            crops.append(Image.fromarray(cv2.cvtColor(cropped, cv2.COLOR_BGR2RGB)))
+
+        results = self.engine.detect(crops, **self.detect_kwargs)
+        return [
+            ((x0 + r["x"], y0 + r["y"]), r.get("score", 1.0)) if r else (None, 0.0)
+            for r in results
+        ]
+
+
+DETECTORS = {
+    HoughCircleDetector.name: HoughCircleDetector,
+    ContourRectangleDetector.name: ContourRectangleDetector,
+    GroundingDinoDetector.name: GroundingDinoDetector,
+}
+
+
+def get_detector(name, **kwargs):
+    """
+    Create a detector backend by name.
+
+    Args:
+        name (str): One of DETECTORS.
+        **kwargs: Passed to the backend constructor.
+    """
+    if name not in DETECTORS:
+        raise ValueError(f"Unknown detector {name!r}, choose from {sorted(DETECTORS)}")
+    return DETECTORS[name](**kwargs)
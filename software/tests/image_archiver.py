@@ -0,0 +1,231 @@
+import csv
+import os
+import queue
+import threading
+import time
+
+
+SAMPLE = "sample"
+OUTLIER = "outlier"
+FAILURE = "failure"
+
+
+class ArchivePolicy:
+    """
+    Decide which frames are worth writing to disk.
+
+    Args:
+        every (int): Archive every Nth sample (1 = all, 0 = none).
+        outliers (bool): Archive frames submitted as outliers (e.g. new min/max).
+        failures (bool): Archive frames where detection failed.
+        max_rate (float): Upper bound on archived frames per second; None for no limit.
+    """
+
+    def __init__(self, every=1, outliers=True, failures=True, max_rate=None):
+        self.every = every
+        self.outliers = outliers
+        self.failures = failures
+        self.max_rate = max_rate
+        self._samples = 0
+        self._last_accepted = None
+
+    def accept(self, kind):
+        if kind == SAMPLE:
+            self._samples += 1
+            wanted = self.every > 0 and self._samples % self.every == 0
+        elif kind == OUTLIER:
+            wanted = self.outliers
+        elif kind == FAILURE:
+            wanted = self.failures
+        else:
+            raise ValueError(f"Unknown frame kind {kind!r}")
+        if not wanted:
+            return False
+
+        if self.max_rate:
+            now = time.monotonic()
+            if self._last_accepted is not None and now - self._last_accepted < 1.0 / self.max_rate:
+                return False
+            self._last_accepted = now
+        return True
+
+
+class ImageArchiver:
+    """
+    Write measurement frames to disk on a background thread.
+
+    submit() checks the policy, copies the frame (or just its ROI) and queues
+    it; encoding and disk I/O happen on the writer thread. When the bounded
+    queue is full the frame is dropped rather than stalling the measurement
+    loop.
+
+    With a manifest file set, every written frame also gets a CSV row with its
+    file name, kind, submit time and the metadata passed to submit(), so
+    archived frames can be re-analysed offline (software/tests/reanalyze_frames.py).
+
+    Usage:
+        with ImageArchiver("measured_images", ArchivePolicy(every=10)) as archiver:
+            archiver.submit(frame, "current_view.png")
+            archiver.submit(frame, f"failure_{i}.png", kind=FAILURE)
+    """
+
+    def __init__(self, directory=".", policy=None, max_queue=32, roi_only=False,
+                 jpeg_quality=90, png_compression=1, manifest=None, metadata_fields=()):
+        """
+        Args:
+            directory (str): Directory relative filenames are written to.
+            policy (ArchivePolicy): Which frames to keep; defaults to all of them.
+            max_queue (int): Frames waiting to be written before new ones are dropped.
+            roi_only (bool): Store only the roi passed to submit() instead of the full frame.
+            jpeg_quality (int): cv2 JPEG quality (0-100).
+            png_compression (int): cv2 PNG compression level (0-9); low is faster.
+            manifest (str): Optional CSV file, relative to directory, listing written frames.
+            metadata_fields (tuple of str): Metadata columns of the manifest.
+        """
+        self.directory = directory
+        self.policy = policy or ArchivePolicy()
+        self.roi_only = roi_only
+        self.jpeg_quality = jpeg_quality
+        self.png_compression = png_compression
+        self.manifest = manifest
+        self.metadata_fields = tuple(metadata_fields)
+
+        self.submitted = 0
+        self.written = 0
+        self.skipped = 0
+        self.dropped = 0
+        self.failed = 0
+
+        self._queue = queue.Queue(max_queue)
+        self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def start(self):
+        if self._thread is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._thread = threading.Thread(target=self._writer, name="image-archiver", daemon=True)
+            self._thread.start()
+        return self
+
+    def submit(self, image, filename, kind=SAMPLE, roi=None, annotate=None, metadata=None):
+        """
+        Queue a frame for writing if the policy wants it.
+
+        Args:
+            image: BGR numpy array (written with cv2) or PIL image.
+            filename (str): File name; relative names go in the archive directory.
+            kind (str): SAMPLE, OUTLIER or FAILURE.
+            roi (dict): Region with x_start/y_start/width/height, stored alone when roi_only is set.
+            annotate (callable): Called with the copied image on the writer thread
+                before it is saved, e.g. to draw the detected position.
+            metadata (dict): Manifest values, e.g. {"index": 500}.
+
+        Returns:
+            bool: True if the frame was queued.
+        """
+        self.submitted += 1
+        if not self.policy.accept(kind):
+            self.skipped += 1
+            return False
+
+        offset = (0, 0)
+        # A reset ROI (x_start None) means a full-frame search; keep the whole image
+        crop = self.roi_only and roi and roi.get("x_start") is not None
+        if hasattr(image, "save"):
+            # PIL image
+            if crop:
+                image = image.crop((roi["x_start"], roi["y_start"],
+                                    roi["x_start"] + roi["width"], roi["y_start"] + roi["height"]))
+                offset = (roi["x_start"], roi["y_start"])
+            else:
+                image = image.copy()
+        else:
+            if crop:
+                image = image[roi["y_start"]:roi["y_start"] + roi["height"],
+                              roi["x_start"]:roi["x_start"] + roi["width"]]
+                offset = (roi["x_start"], roi["y_start"])
+            # The caller may reuse the buffer (e.g. the camera ring buffer)
+            image = image.copy()
+
+        try:
+            row = None
+            if self.manifest is not None:
+                row = {"filename": filename, "kind": kind, "timestamp": time.time(),
+                       "x_offset": offset[0], "y_offset": offset[1]}
+                row.update(metadata or {})
+            self._queue.put_nowait((image, os.path.join(self.directory, filename), annotate, row))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def close(self, timeout=10.0):
+        """Write what is queued and stop the writer thread."""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+        print(f"Image archive: {self.written} written, {self.skipped} skipped by policy, "
+              f"{self.dropped} dropped, {self.failed} failed")
+
+    def _writer(self):
+        manifest_file = None
+        manifest_writer = None
+        if self.manifest is not None:
+            path = os.path.join(self.directory, self.manifest)
+            is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+            manifest_file = open(path, "a", newline="")
+            manifest_writer = csv.DictWriter(
+                manifest_file,
+                fieldnames=["filename", "kind", "timestamp", "x_offset", "y_offset", *self.metadata_fields],
+                extrasaction="ignore",
+            )
+            if is_new:
+                manifest_writer.writeheader()
+
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    return
+                image, path, annotate, row = item
+                try:
+                    if annotate is not None:
+                        image = annotate(image) or image
+                    self._write(image, path)
+                    self.written += 1
+                except Exception as e:
+                    print(f"Could not archive {path}: {e}")
+                    self.failed += 1
+                    continue
+                if manifest_writer is not None:
+                    manifest_writer.writerow(row)
+                    manifest_file.flush()
+        finally:
+            if manifest_file is not None:
+                manifest_file.close()
+
+    def _write(self, image, path):
+        import cv2
+        extension = os.path.splitext(path)[1].lower()
+        if hasattr(image, "save"):
+            if extension in (".jpg", ".jpeg"):
+                image.save(path, quality=self.jpeg_quality)
+            else:
+                image.save(path)
+            return
+
+        if extension in (".jpg", ".jpeg"):
+            params = [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality]
+        elif extension == ".png":
+            params = [cv2.IMWRITE_PNG_COMPRESSION, self.png_compression]
+        else:
+            params = []
+        if not cv2.imwrite(path, image, params):
+            raise OSError("cv2.imwrite failed")
@@ -0,0 +1,160 @@
+"""
+Append-only binary measurement log.
+
+Lifespan runs produce millions of samples; reopening a CSV for every row and
+re-reading the whole file for analysis gets slower the longer a test runs.
+MeasurementLog stores fixed-width numpy records instead:
+
+    file = header | record | record | ...
+    header = b"FLOG" | u16 version | u32 schema length | JSON schema
+
+Rows are buffered in a preallocated record array and written in blocks,
+flushed every flush_every rows or flush_interval seconds (and fsynced when
+requested). Because every record has the same size, a crash can at worst
+leave one torn record at the end, which readers ignore and which is cut off
+when the log is reopened for appending. read_measurements() memory-maps the
+file, so analysis does not have to parse or copy it.
+
+    log = MeasurementLog("data.mlog", [("angle", "i4"), ("x", "f8"), ("y", "f8"), ("index", "i4")])
+    log.append({"angle": 35, "x": 101.2, "y": 98.7, "index": 0})
+    log.close()
+
+    records = read_measurements("data.mlog")
+    records["x"].mean()
+"""
+import json
+import os
+import struct
+import time
+
+import numpy as np
+
+MAGIC = b"FLOG"
+VERSION = 1
+_PREAMBLE = struct.Struct("<4sHI")
+
+
+def _encode_header(dtype):
+    schema = json.dumps([(name, dtype.fields[name][0].str) for name in dtype.names]).encode()
+    return _PREAMBLE.pack(MAGIC, VERSION, len(schema)) + schema
+
+
+def read_header(file):
+    """
+    Read the header from an open binary file.
+
+    Returns:
+        tuple: (numpy.dtype of the records, header size in bytes)
+    """
+    preamble = file.read(_PREAMBLE.size)
+    if len(preamble) < _PREAMBLE.size:
+        raise ValueError("File is too short to be a measurement log")
+    magic, version, schema_length = _PREAMBLE.unpack(preamble)
+    if magic != MAGIC:
+        raise ValueError("Not a measurement log")
+    if version != VERSION:
+        raise ValueError(f"Unsupported measurement log version {version}")
+    schema = json.loads(file.read(schema_length))
+    return np.dtype([(name, dtype) for name, dtype in schema]), _PREAMBLE.size + schema_length
+
+
+class MeasurementLog:
+    """Buffered, crash-safe appender for fixed-width measurement records."""
+
+    def __init__(self, filename, fields, flush_every=1024, flush_interval=1.0, fsync=False, truncate=False):
+        """
+        Args:
+            filename (str): Log file path.
+            fields (list of tuple): (name, numpy dtype string) per column.
+            flush_every (int): Rows buffered before they are written.
+            flush_interval (float): Seconds after which buffered rows are written anyway.
+            fsync (bool): fsync after every flush so rows survive a power loss.
+            truncate (bool): Start a new log even if the file exists.
+        """
+        self.filename = filename
+        self.dtype = np.dtype(fields)
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+
+        self._buffer = np.zeros(flush_every, dtype=self.dtype)
+        self._buffered = 0
+        self._last_flush = time.monotonic()
+        self.rows_written = 0
+
+        if truncate or not os.path.exists(filename) or os.path.getsize(filename) == 0:
+            with open(filename, "wb") as file:
+                file.write(_encode_header(self.dtype))
+        else:
+            self._recover()
+        self._file = open(filename, "ab")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def append(self, row):
+        """Append one row given as a dict of column name -> value."""
+        self.append_values(*(row[name] for name in self.dtype.names))
+
+    def append_values(self, *values):
+        """Append one row given as values in column order."""
+        self._buffer[self._buffered] = values
+        self._buffered += 1
+        if self._buffered == self.flush_every or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Write buffered rows to disk."""
+        if self._buffered:
+            self._file.write(self._buffer[:self._buffered].tobytes())
+            self.rows_written += self._buffered
+            self._buffered = 0
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.flush()
+        self._file.close()
+
+    def _recover(self):
+        """Check the schema of an existing log and drop a torn trailing record."""
+        with open(self.filename, "r+b") as file:
+            dtype, header_size = read_header(file)
+            if dtype != self.dtype:
+                raise ValueError(f"{self.filename} has columns {dtype}, expected {self.dtype}")
+            size = os.path.getsize(self.filename)
+            records, torn = divmod(size - header_size, dtype.itemsize)
+            if torn:
+                print(f"Dropping {torn} bytes of a partially written record from {self.filename}")
+                file.truncate(header_size + records * dtype.itemsize)
+
+
+def read_measurements(filename):
+    """
+    Memory-map a measurement log as a numpy record array.
+
+    Rows still buffered by a running writer are not visible, and a torn
+    trailing record is ignored.
+
+    Returns:
+        numpy.memmap: Structured array with one field per column.
+    """
+    with open(filename, "rb") as file:
+        dtype, header_size = read_header(file)
+    count = (os.path.getsize(filename) - header_size) // dtype.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(filename, dtype=dtype, mode="r", offset=header_size, shape=(count,))
+
+
+def is_measurement_log(filename):
+    """True if filename starts with the measurement log magic bytes."""
+    with open(filename, "rb") as file:
+        return file.read(len(MAGIC)) == MAGIC
@@ -0,0 +1,439 @@
+"""
+Re-run detection on archived measurement frames with a process pool.
+
+Tuning HoughCircles or Grounding DINO thresholds used to mean another run on
+the hardware. This replays frames archived by the linearity runner
+(--archive-frames) instead, so a parameter sweep takes minutes:
+
+    python -m software.tests.reanalyze_frames measured_images/frames \\
+        --detector hough --param param2=15,20,25 --param minRadius=35,36
+
+Every combination of --param values is one parameter set. Frames and their
+servo index are listed in the archive manifest (frames.csv, written by
+ImageArchiver(manifest=...)); directories without one can give the index in
+the file names with --index-pattern.
+
+Frames are decoded once: each worker reads a chunk of files into its own
+shared-memory block and returns only the block layout. Each parameter set is
+then run chunk by chunk on the workers, which attach to the blocks by name,
+so no pixels are pickled and a sweep costs one decode plus one detection
+pass per parameter set. Workers keep their detectors between chunks, so a
+heavy model is loaded once per process.
+
+Results are written in acquisition order with the runner's columns
+(x_position_mm, index), so analyze_and_plot_data() reads them like a live
+run; an output ending in .mlog is written as a measurement log.
+"""
+import argparse
+import ast
+import csv
+import glob
+import itertools
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from software.tests.detectors import DETECTORS, get_detector
+
+MANIFEST_FILENAME = "frames.csv"
+IMAGE_PATTERNS = ("*.png", "*.jpg", "*.jpeg", "*.bmp")
+# frame_000123_500.png -> index 500
+DEFAULT_INDEX_PATTERN = r"_(?P<index>\d+)\.\w+$"
+
+CIRCLE_DIAMETER_PIXELS = 72  # Diameter in pixels
+CIRCLE_DIAMETER_MM = 1.4      # Actual diameter in millimeters
+PIXEL_TO_MM_SCALE = CIRCLE_DIAMETER_MM / CIRCLE_DIAMETER_PIXELS  # mm per pixel
+
+# Index range used for the steps-per-mm fit, as in the linearity runner
+CALIBRATION_INDEX_RANGE = (250, 750)
+
+OUTPUT_FIELDS = ["x_position_mm", "index", "y_position_mm", "confidence", "filename"]
+MEASUREMENT_FIELDS = [("x_position_mm", "<f8"), ("index", "<i4")]
+
+
+def load_frames(directory, manifest=MANIFEST_FILENAME, index_pattern=None, kinds=None):
+    """
+    List archived frames with their servo index, in acquisition order.
+
+    Args:
+        directory (str): Archive directory.
+        manifest (str): Manifest file in directory; used when it exists.
+        index_pattern (str): Regex with an "index" group matched against file
+            names when there is no manifest.
+        kinds (set of str): Manifest frame kinds to keep; None keeps all.
+
+    Returns:
+        list of dict: path, filename, index, x_offset and y_offset per frame.
+    """
+    manifest_path = os.path.join(directory, manifest)
+    frames = []
+    if os.path.exists(manifest_path):
+        with open(manifest_path, newline="") as file:
+            for row in csv.DictReader(file):
+                if kinds is not None and row.get("kind") not in kinds:
+                    continue
+                if not row.get("index"):
+                    continue
+                frames.append({
+                    "path": os.path.join(directory, row["filename"]),
+                    "filename": row["filename"],
+                    "index": int(row["index"]),
+                    "x_offset": int(row.get("x_offset") or 0),
+                    "y_offset": int(row.get("y_offset") or 0),
+                })
+        return frames
+
+    pattern = re.compile(index_pattern or DEFAULT_INDEX_PATTERN)
+    paths = []
+    for image_pattern in IMAGE_PATTERNS:
+        paths.extend(glob.glob(os.path.join(directory, image_pattern)))
+    for path in sorted(paths):
+        match = pattern.search(os.path.basename(path))
+        if match is None:
+            continue
+        frames.append({
+            "path": path,
+            "filename": os.path.basename(path),
+            "index": int(match.group("index")),
+            "x_offset": 0,
+            "y_offset": 0,
+        })
+    return frames
+
+
+def parameter_sets(params):
+    """
+    Expand {"param2": [15, 20], "minRadius": [36]} into every combination.
+
+    Returns:
+        list of dict: One keyword dict per combination; [{}] without params.
+    """
+    names = sorted(params)
+    return [dict(zip(names, values)) for values in itertools.product(*(params[name] for name in names))]
+
+
+def _parse_value(text):
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        return text
+
+
+def _parse_param(spec):
+    name, _, values = spec.partition("=")
+    if not name or not values:
+        raise argparse.ArgumentTypeError(f"Expected NAME=VALUE[,VALUE...], got {spec!r}")
+    return name, [_parse_value(value) for value in values.split(",")]
+
+
+def _untrack(block):
+    """
+    Stop this worker's resource tracker from removing block when the worker exits.
+
+    Blocks belong to the parent process, which unlinks them in FrameReanalyzer.close().
+    """
+    resource_tracker.unregister(block._name, "shared_memory")
+
+
+def _load_chunk(paths):
+    """
+    Decode frames into a new shared-memory block (runs in a worker).
+
+    Returns:
+        (block name, layout): layout has (byte offset, shape) per frame, or
+        None for frames that could not be read.
+    """
+    import cv2
+    images = [cv2.imread(path) for path in paths]
+    layout = []
+    offset = 0
+    for image in images:
+        if image is None:
+            layout.append(None)
+            continue
+        layout.append((offset, image.shape))
+        offset += image.nbytes
+
+    block = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    _untrack(block)
+    try:
+        for image, entry in zip(images, layout):
+            if entry is not None:
+                view = np.ndarray(entry[1], dtype=np.uint8, buffer=block.buf, offset=entry[0])
+                view[...] = image
+                del view
+    finally:
+        block.close()
+    return block.name, layout
+
+
+# Detectors created in this worker, by (name, parameters)
+_detectors = {}
+
+
+def _worker_detector(name, params):
+    key = (name, tuple(sorted(params.items())))
+    if key not in _detectors:
+        _detectors[key] = get_detector(name, **params)
+    return _detectors[key]
+
+
+def _local_roi(roi, x_offset, y_offset):
+    """Translate a full-frame roi into the coordinates of a frame stored from (x_offset, y_offset)."""
+    if roi is None:
+        return None
+    x_start = max(0, roi["x_start"] - x_offset)
+    y_start = max(0, roi["y_start"] - y_offset)
+    return {
+        "x_start": x_start,
+        "y_start": y_start,
+        "width": roi["x_start"] + roi["width"] - x_offset - x_start,
+        "height": roi["y_start"] + roi["height"] - y_offset - y_start,
+    }
+
+
+def _detect_chunk(block_name, layout, offsets, detector_name, params, roi):
+    """
+    Run one detector on the frames of a shared-memory block (runs in a worker).
+
+    Returns:
+        list: ((x, y), confidence) in full-frame pixels per frame, (None, 0.0)
+        where nothing was found or the frame could not be read.
+    """
+    detector = _worker_detector(detector_name, params)
+    block = shared_memory.SharedMemory(name=block_name)
+    _untrack(block)
+    try:
+        frames = [
+            None if entry is None else
+            np.ndarray(entry[1], dtype=np.uint8, buffer=block.buf, offset=entry[0])
+            for entry in layout
+        ]
+        readable = [i for i, frame in enumerate(frames) if frame is not None]
+        if roi is None:
+            found = detector.locate_batch([frames[i] for i in readable])
+        else:
+            found = [detector.locate(frames[i], _local_roi(roi, *offsets[i])) for i in readable]
+
+        results = [(None, 0.0)] * len(frames)
+        for i, (position, confidence) in zip(readable, found):
+            if position is not None:
+                x_offset, y_offset = offsets[i]
+                position = (position[0] + x_offset, position[1] + y_offset)
+            results[i] = (position, confidence)
+        # The views must go before the block can be closed
+        del frames
+    finally:
+        block.close()
+    return results
+
+
+class FrameReanalyzer:
+    """
+    Decode archived frames into shared memory once and run detectors over them.
+
+    Usage:
+        with FrameReanalyzer(frames, processes=8) as reanalyzer:
+            for params in parameter_sets({"param2": [15, 20, 25]}):
+                results = reanalyzer.detect("hough", params)
+    """
+
+    def __init__(self, frames, processes=None, chunk_size=32):
+        """
+        Args:
+            frames (list of dict): Frames from load_frames().
+            processes (int): Worker processes; defaults to the number of CPUs.
+            chunk_size (int): Frames per shared-memory block and per task.
+        """
+        self.frames = frames
+        self.chunk_size = chunk_size
+        self.decode_seconds = None
+        self._executor = ProcessPoolExecutor(max_workers=processes)
+        self._blocks = []
+
+    def __enter__(self):
+        return self.load()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def load(self):
+        """Decode every frame into the workers' shared-memory blocks."""
+        start = time.perf_counter()
+        chunks = [
+            [frame["path"] for frame in self.frames[i:i + self.chunk_size]]
+            for i in range(0, len(self.frames), self.chunk_size)
+        ]
+        futures = [self._executor.submit(_load_chunk, paths) for paths in chunks]
+        error = None
+        for future in futures:
+            # Collect every block that was made, even after a failure, so close() removes it
+            try:
+                self._blocks.append(future.result())
+            except Exception as e:
+                error = error or e
+        if error is not None:
+            raise error
+        self.decode_seconds = time.perf_counter() - start
+        return self
+
+    @property
+    def unreadable(self):
+        """Number of frames that could not be decoded."""
+        return sum(entry is None for _, layout in self._blocks for entry in layout)
+
+    def detect(self, detector_name, params=None, roi=None):
+        """
+        Locate the target in every frame.
+
+        Args:
+            detector_name (str): One of detectors.DETECTORS.
+            params (dict): Detector constructor keywords.
+            roi (dict): Optional full-frame region of interest.
+
+        Returns:
+            list: ((x, y), confidence) in full-frame pixels, aligned with frames.
+        """
+        params = params or {}
+        futures = []
+        for chunk, (block_name, layout) in enumerate(self._blocks):
+            start = chunk * self.chunk_size
+            offsets = [(frame["x_offset"], frame["y_offset"])
+                       for frame in self.frames[start:start + len(layout)]]
+            futures.append(self._executor.submit(
+                _detect_chunk, block_name, layout, offsets, detector_name, params, roi
+            ))
+        results = []
+        for future in futures:
+            results.extend(future.result())
+        return results
+
+    def close(self):
+        self._executor.shutdown()
+        for block_name, _ in self._blocks:
+            try:
+                block = shared_memory.SharedMemory(name=block_name)
+            except FileNotFoundError:
+                continue
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+
+def to_rows(frames, results, mm_per_pixel=PIXEL_TO_MM_SCALE):
+    """Rows in the linearity runner's schema for every frame with a detection."""
+    rows = []
+    for frame, (position, confidence) in zip(frames, results):
+        if position is None:
+            continue
+        rows.append({
+            "x_position_mm": position[0] * mm_per_pixel,
+            "index": frame["index"],
+            "y_position_mm": position[1] * mm_per_pixel,
+            "confidence": confidence,
+            "filename": frame["filename"],
+        })
+    return rows
+
+
+def write_rows(rows, output):
+    """Write rows as CSV, or as a measurement log when output ends in .mlog."""
+    if output.endswith(".mlog"):
+        from software.tests.measurement_log import MeasurementLog
+
+        log = MeasurementLog(output, MEASUREMENT_FIELDS, truncate=True)
+        for row in rows:
+            log.append_values(row["x_position_mm"], row["index"])
+        log.close()
+        return
+
+    with open(output, mode="w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=OUTPUT_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def output_path(output, params, sweep):
+    """Output file for one parameter set; a sweep tags each file with its parameters."""
+    if not sweep:
+        return output
+    base, extension = os.path.splitext(output)
+    tag = "_".join(f"{name}-{value}" for name, value in sorted(params.items()))
+    return f"{base}_{tag}{extension}"
+
+
+def summarize(frames, rows):
+    """Detection rate and steps-per-mm fit of one parameter set."""
+    from software.tests.servo_position_linearity.linear_calibrator import LinearCalibrator
+
+    calibrator = LinearCalibrator(robust=True)
+    for row in rows:
+        if CALIBRATION_INDEX_RANGE[0] <= row["index"] <= CALIBRATION_INDEX_RANGE[1]:
+            calibrator.update(row["index"], row["x_position_mm"])
+    return {
+        "detection_rate": len(rows) / len(frames) if frames else 0.0,
+        "steps_per_mm": calibrator.steps_per_mm if calibrator.ready else None,
+        "r_squared": calibrator.r_squared if calibrator.ready else None,
+        "residual_um": 1000 * calibrator.residual_std if calibrator.ready else None,
+    }
+
+
+def print_summary(summaries):
+    print(f"\n{'parameters':<40} {'found':>7} {'steps/mm':>9} {'R^2':>9} {'resid um':>9} {'seconds':>8}")
+    for params, s, seconds in summaries:
+        label = ", ".join(f"{name}={value}" for name, value in sorted(params.items())) or "(defaults)"
+        steps = f"{s['steps_per_mm']:.2f}" if s["steps_per_mm"] is not None else "-"
+        r_squared = f"{s['r_squared']:.6f}" if s["r_squared"] is not None else "-"
+        residual = f"{s['residual_um']:.2f}" if s["residual_um"] is not None else "-"
+        print(f"{label[:40]:<40} {s['detection_rate']:>7.0%} {steps:>9} {r_squared:>9} {residual:>9} {seconds:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-run detection on archived measurement frames")
+    parser.add_argument("frames", help="Directory of archived frames")
+    parser.add_argument("--detector", choices=sorted(DETECTORS), default="hough")
+    parser.add_argument("--param", action="append", type=_parse_param, default=[], metavar="NAME=V1[,V2...]",
+                        help="Detector parameter values; every combination is run")
+    parser.add_argument("--roi", nargs=4, type=int, metavar=("X", "Y", "W", "H"),
+                        help="Full-frame region of interest")
+    parser.add_argument("--manifest", default=MANIFEST_FILENAME)
+    parser.add_argument("--index-pattern", help="Regex with an 'index' group, used when there is no manifest")
+    parser.add_argument("--kinds", nargs="+", help="Manifest frame kinds to use (default: all)")
+    parser.add_argument("--processes", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=32, help="Frames per task")
+    parser.add_argument("--mm-per-pixel", type=float, default=PIXEL_TO_MM_SCALE)
+    parser.add_argument("--output", default="reanalysis.csv", help="CSV, or .mlog for a measurement log")
+    args = parser.parse_args()
+
+    roi = None
+    if args.roi:
+        roi = dict(zip(("x_start", "y_start", "width", "height"), args.roi))
+
+    frames = load_frames(args.frames, args.manifest, args.index_pattern, set(args.kinds) if args.kinds else None)
+    if not frames:
+        print(f"No frames with an index found in {args.frames}")
+        return
+
+    param_sets = parameter_sets(dict(args.param))
+    summaries = []
+    with FrameReanalyzer(frames, args.processes, args.chunk_size) as reanalyzer:
+        print(f"Decoded {len(frames)} frames in {reanalyzer.decode_seconds:.1f} s"
+              + (f" ({reanalyzer.unreadable} unreadable)" if reanalyzer.unreadable else ""))
+        for params in param_sets:
+            start = time.perf_counter()
+            results = reanalyzer.detect(args.detector, params, roi)
+            rows = to_rows(frames, results, args.mm_per_pixel)
+            path = output_path(args.output, params, len(param_sets) > 1)
+            write_rows(rows, path)
+            summaries.append((params, summarize(frames, rows), time.perf_counter() - start))
+            print(f"Wrote {len(rows)} detections to {path}")
+
+    print_summary(summaries)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Render plots in a background process so acquisition never waits on matplotlib.
+
+The test loops used to build and savefig figures inline, stalling servo
+commands for as long as a figure took to render. ReportWorker runs the
+rendering in a separate process on the Agg backend instead:
+
+    worker = ReportWorker({"stats": "software.tests.servo_position_linearity.linearity_reports:AggregatedStatsReport"})
+    worker.start()
+    worker.submit("stats", {"snapshot": stats.snapshot(200, 850), "attempt_count": 3})
+    ...
+    worker.close()
+
+Renderers are named by "module:attribute" so the child process can import
+them itself. A class is instantiated once in the worker and its
+render(**payload) is called for every job, so it can keep its figure and
+artists between reports; a plain function is called with **payload.
+
+submit() never blocks. If rendering falls behind, the worker only renders the
+newest pending job of each kind and counts the rest as coalesced.
+"""
+import importlib
+import multiprocessing
+import queue
+import traceback
+
+_STOP = None
+
+
+def _load(target):
+    module_name, _, attribute = target.partition(":")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def _run(jobs, renderers, rendered, coalesced, failed):
+    import matplotlib
+
+    matplotlib.use("Agg")
+    instances = {}
+
+    while True:
+        pending = {}
+        stop = False
+        job = jobs.get()
+        # Keep only the newest job per kind from everything already queued
+        while True:
+            if job is _STOP:
+                stop = True
+            else:
+                kind, payload = job
+                if kind in pending:
+                    with coalesced.get_lock():
+                        coalesced.value += 1
+                pending[kind] = payload
+            try:
+                job = jobs.get_nowait()
+            except queue.Empty:
+                break
+
+        for kind, payload in pending.items():
+            try:
+                renderer = instances.get(kind)
+                if renderer is None:
+                    renderer = _load(renderers[kind])
+                    if isinstance(renderer, type):
+                        renderer = renderer().render
+                    instances[kind] = renderer
+                renderer(**payload)
+                with rendered.get_lock():
+                    rendered.value += 1
+            except Exception:
+                print(f"Report {kind!r} failed:")
+                traceback.print_exc()
+                with failed.get_lock():
+                    failed.value += 1
+
+        if stop:
+            return
+
+
+class ReportWorker:
+    """
+    Background process that renders reports.
+
+    Args:
+        renderers (dict): kind -> "module:attribute" of a renderer class or function.
+    """
+
+    def __init__(self, renderers):
+        self.renderers = dict(renderers)
+        self.submitted = 0
+
+        # spawn so the worker doesn't inherit camera/serial threads from the test loop
+        self._context = multiprocessing.get_context("spawn")
+        self._jobs = self._context.Queue()
+        self._rendered = self._context.Value("l", 0)
+        self._coalesced = self._context.Value("l", 0)
+        self._failed = self._context.Value("l", 0)
+        self._process = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def rendered(self):
+        return self._rendered.value
+
+    @property
+    def coalesced(self):
+        return self._coalesced.value
+
+    @property
+    def failed(self):
+        return self._failed.value
+
+    def start(self):
+        if self._process is None:
+            self._process = self._context.Process(
+                target=_run,
+                args=(self._jobs, self.renderers, self._rendered, self._coalesced, self._failed),
+                name="report-worker",
+                daemon=True,
+            )
+            self._process.start()
+        return self
+
+    def submit(self, kind, payload):
+        """Queue a report; returns immediately."""
+        if kind not in self.renderers:
+            raise ValueError(f"Unknown report {kind!r}, choose from {sorted(self.renderers)}")
+        if self._process is None:
+            raise RuntimeError("Report worker is not started")
+        self._jobs.put((kind, payload))
+        self.submitted += 1
+
+    def close(self, timeout=30.0):
+        """Render what is still queued (coalesced) and stop the worker."""
+        if self._process is None:
+            return
+        self._jobs.put(_STOP)
+        self._process.join(timeout)
+        if self._process.is_alive():
+            print("Report worker did not finish in time, terminating it")
+            self._process.terminate()
+            self._process.join()
+        self._process = None
+        print(f"Reports: {self.submitted} submitted, {self.rendered} rendered, "
+              f"{self.coalesced} coalesced, {self.failed} failed")
@@ -1,67 +1,93 @@
-import pandas as pd
-import matplotlib.pyplot as plt
-import numpy as np
-from scipy.stats import linregress
-
 def analyze_and_plot_data(
     output_file, 
     min_attempt=350, 
     lower_index=250, 
     upper_index=750, 
-    movement_distance_mm=2
+    movement_distance_mm=2,
+    stats=None,
+    calibrator=None
 ):
     """
-    Analyzes and plots X position data from a CSV file, filtering by a minimum attempt number and index bounds.
+    Analyzes and plots X position data from a CSV file or binary measurement log,
+    filtering by a minimum attempt number and index bounds.
     Additionally, calculates how many angle steps correspond to a specified movement distance in X.
     
     Args:
-        output_file (str): The path to the CSV data file.
+        output_file (str): The path to the CSV data file or measurement log.
         min_attempt (int): The minimum attempt number to include in the analysis.
         lower_index (int): The lower bound for the 'index' (servo angle steps).
         upper_index (int): The upper bound for the 'index' (servo angle steps).
         movement_distance_mm (float): The desired movement distance in millimeters.
+        stats (IndexedStats): Optional streaming statistics collected during the
+            run. When given, output_file is not read and min_attempt is ignored
+            in favour of the min_attempt the statistics were built with.
+        calibrator (LinearCalibrator): Optional per-sample fit collected during
+            the run. When omitted the fit is made over the per-index averages.
     """
+    # Heavy imports are deferred so importing this module is cheap
+    import pandas as pd
+    import matplotlib.pyplot as plt
+    import numpy as np
+    from software.tests.servo_position_linearity.linear_calibrator import LinearCalibrator
+    from software.tests.measurement_log import is_measurement_log, read_measurements
 
     # Constants
     CIRCLE_DIAMETER_PIXELS = 72  # Diameter in pixels
     CIRCLE_DIAMETER_MM = 1.4      # Actual diameter in millimeters
     PIXEL_TO_MM_SCALE = CIRCLE_DIAMETER_MM / CIRCLE_DIAMETER_PIXELS  # ≈0.01944 mm per pixel
 
-    # Read the CSV file
-    df = pd.read_csv(output_file)
-
-    # Ensure the CSV has the expected columns
-    expected_columns = {'x_position_mm', 'index'}
-    if not expected_columns.issubset(df.columns):
-        raise ValueError(f"CSV file must contain columns: {expected_columns}")
-
-    # Convert 'x_position_mm' from pixels to mm if necessary
-    # Assuming 'x_position_mm' is already in mm, otherwise adjust accordingly
-    if 'x_mm' not in df.columns:
-        df['x_mm'] = df['x_position_mm']  # If already in mm
-
-    # Create an 'attempt' column based on the order within each 'index' group
-    df['attempt'] = df.groupby('index').cumcount() + 1
-
-    # Filter data to include only attempts above min_attempt and index within bounds
-    df_filtered = df[
-        (df['attempt'] > min_attempt) &
-        (df['index'] >= lower_index) &
-        (df['index'] <= upper_index)
-    ]
-
-    if df_filtered.empty:
-        print(f"No data available after filtering attempts > {min_attempt} and index between {lower_index} and {upper_index}.")
-        return
-
-    # Group by index and calculate statistics for x in mm, using the filtered data
-    result = df_filtered.groupby("index", as_index=True).agg({
-        "x_mm": ["mean", "std", "min", "max"],
-        "attempt": "count"
-    })
-
-    # Flatten multi-level column names
-    result.columns = ["average_x_mm", "std_x_mm", "min_x_mm", "max_x_mm", "total_attempts"]
+    if stats is not None:
+        # Already aggregated while the test ran
+        snapshot = stats.snapshot(lower_index, upper_index)
+        if not len(snapshot["index"]):
+            print(f"No data available for index between {lower_index} and {upper_index}.")
+            return
+        result = pd.DataFrame({
+            "average_x_mm": snapshot["mean"],
+            "std_x_mm": snapshot["std"],
+            "min_x_mm": snapshot["min"],
+            "max_x_mm": snapshot["max"],
+            "total_attempts": snapshot["count"],
+        }, index=pd.Index(snapshot["index"], name="index"))
+    else:
+        # Read the data; measurement logs are memory-mapped instead of parsed
+        if is_measurement_log(output_file):
+            df = pd.DataFrame(read_measurements(output_file))
+        else:
+            df = pd.read_csv(output_file)
+
+        # Ensure the CSV has the expected columns
+        expected_columns = {'x_position_mm', 'index'}
+        if not expected_columns.issubset(df.columns):
+            raise ValueError(f"CSV file must contain columns: {expected_columns}")
+
+        # Convert 'x_position_mm' from pixels to mm if necessary
+        # Assuming 'x_position_mm' is already in mm, otherwise adjust accordingly
+        if 'x_mm' not in df.columns:
+            df['x_mm'] = df['x_position_mm']  # If already in mm
+
+        # Create an 'attempt' column based on the order within each 'index' group
+        df['attempt'] = df.groupby('index').cumcount() + 1
+
+        # Filter data to include only attempts above min_attempt and index within bounds
+        df_filtered = df[
+            (df['attempt'] > min_attempt) &
+            (df['index'] >= lower_index) &
+            (df['index'] <= upper_index)
+        ]
+
+        if df_filtered.empty:
+            print(f"No data available after filtering attempts > {min_attempt} and index between {lower_index} and {upper_index}.")
+            return
+
+        # Group by index and calculate statistics for x in mm, using the filtered data
+        result = df_filtered.groupby("index", as_index=True).agg({
+            "x_mm": ["mean", "std", "min", "max"],
+            "attempt": "count"
+        })
+
+        # Flatten multi-level column names
+        result.columns = ["average_x_mm", "std_x_mm", "min_x_mm", "max_x_mm", "total_attempts"]
 
     # Print the result to verify
     print("Statistical Summary:")
@@ -72,12 +98,16 @@ def analyze_and_plot_data(
     regression_data = result.reset_index()
 
     # Perform linear regression: x_mm vs index
-    slope, intercept, r_value, p_value, std_err = linregress(regression_data['index'], regression_data['average_x_mm'])
+    if calibrator is None:
+        calibrator = LinearCalibrator()
+        calibrator.update_many(regression_data['index'], regression_data['average_x_mm'])
+    slope = calibrator.slope
+    intercept = calibrator.intercept
 
     print("\nLinear Regression Results:")
     print(f"Slope (dx/dindex): {slope:.6f} mm per step")
     print(f"Intercept: {intercept:.6f} mm")
-    print(f"R-squared: {r_value**2:.6f}")
+    print(f"R-squared: {calibrator.r_squared:.6f}")
 
     if slope == 0:
         print("Slope is zero, cannot compute steps for movement.")
@@ -90,6 +120,8 @@ def analyze_and_plot_data(
 
         print(f"\nCalculated Steps for {movement_distance_mm} mm Movement:")
         print(f"Steps per mm: {steps_per_mm:.2f} steps/mm")
+        low, high = calibrator.steps_per_mm_interval()
+        print(f"Steps per mm 95% CI: {low:.2f} - {high:.2f} steps/mm")
         print(f"Steps for {movement_distance_mm} mm: {steps_for_distance:.2f} steps")
 
     # --- Plotting ---
@@ -133,6 +165,8 @@ def analyze_and_plot_data(
     # Save the plot with descriptive filename
     plot_filename = f'x_position_analysis_attempt_{min_attempt}_index_{lower_index}_{upper_index}.png'
     plt.savefig(plot_filename)
+    # Free the figure; in the report worker they would otherwise accumulate
+    plt.close()
     print(f"\nSaved plot to {plot_filename}")
     # plt.show()
 
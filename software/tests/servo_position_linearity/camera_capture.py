@@ -0,0 +1,167 @@
+import threading
+import time
+
+import numpy as np
+
+
+class CameraCapture:
+    """
+    Keep a camera open and grab frames on a background thread.
+
+    Frames are written into a fixed-size, preallocated ring buffer together
+    with the time each grab started, so measurement code can ask for "the
+    first frame captured after T" (e.g. after a servo command was acked)
+    instead of paying camera startup and stale driver buffers on every sample.
+
+    Because the thread drains the driver continuously, a frame whose grab
+    started after T was exposed after T.
+
+    Usage:
+        with CameraCapture(0) as camera:
+            write_message(messages.rotate_servo(0, 500), ser)
+            timestamp, frame = camera.read_after(time.perf_counter())
+    """
+
+    def __init__(self, device=0, buffer_size=8, width=None, height=None, retry_delay=0.005):
+        """
+        Args:
+            device (int or str): Device index or path passed to cv2.VideoCapture.
+            buffer_size (int): Number of frames kept in the ring buffer.
+            width (int): Optional capture width to request from the camera.
+            height (int): Optional capture height to request from the camera.
+            retry_delay (float): Seconds to wait after a failed grab before trying again.
+        """
+        self.device = device
+        self.buffer_size = buffer_size
+        self.width = width
+        self.height = height
+        self.retry_delay = retry_delay
+
+        self._camera = None
+        self._frames = None
+        self._scratch = None
+        self._timestamps = np.zeros(buffer_size, dtype=np.float64)
+        self._count = 0  # Total frames captured; slot is count % buffer_size
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+        self.dropped_reads = 0
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+    def start(self):
+        """Open the camera, allocate the ring buffer and start the capture thread."""
+        import cv2
+        self._camera = cv2.VideoCapture(self.device)
+        if not self._camera.isOpened():
+            raise RuntimeError(f"Could not open camera {self.device}")
+        if self.width:
+            self._camera.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+        if self.height:
+            self._camera.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        # Keep the driver-side queue as short as the backend allows
+        self._camera.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+        ret, frame = self._camera.read()
+        if not ret:
+            self._camera.release()
+            raise RuntimeError(f"Could not read from camera {self.device}")
+        self._frames = np.empty((self.buffer_size,) + frame.shape, dtype=frame.dtype)
+        self._scratch = frame
+
+        self._running = True
+        self._thread = threading.Thread(target=self._capture_loop, name="camera-capture", daemon=True)
+        self._thread.start()
+        return self
+
+    def isOpened(self):
+        return self._running
+
+    def release(self):
+        """Stop the capture thread and release the camera."""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._camera is not None:
+            self._camera.release()
+            self._camera = None
+        with self._cond:
+            self._cond.notify_all()
+
+    def read(self):
+        """
+        cv2.VideoCapture compatible read: wait for the next new frame.
+
+        Returns:
+            tuple: (ret, frame) where frame is a copy owned by the caller.
+        """
+        _, frame = self.read_after(time.perf_counter())
+        return frame is not None, frame
+
+    def read_after(self, t, timeout=2.0, out=None):
+        """
+        Return the first frame whose grab started at or after time t.
+
+        Args:
+            t (float): A time.perf_counter() timestamp.
+            timeout (float): Seconds to wait for such a frame.
+            out (numpy.ndarray): Optional array to copy the frame into.
+
+        Returns:
+            tuple: (timestamp, frame), or (None, None) on timeout.
+        """
+        deadline = time.perf_counter() + timeout
+        with self._cond:
+            while True:
+                slot = self._find_after(t)
+                if slot is not None:
+                    frame = self._frames[slot]
+                    if out is None:
+                        out = frame.copy()
+                    else:
+                        np.copyto(out, frame)
+                    return float(self._timestamps[slot]), out
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0 or not self._running:
+                    return None, None
+                self._cond.wait(remaining)
+
+    def latest(self):
+        """Return a copy of the most recent frame and its timestamp."""
+        with self._cond:
+            if self._count == 0:
+                return None, None
+            slot = (self._count - 1) % self.buffer_size
+            return float(self._timestamps[slot]), self._frames[slot].copy()
+
+    def _find_after(self, t):
+        # Oldest frame still in the buffer first
+        first = max(0, self._count - self.buffer_size)
+        for index in range(first, self._count):
+            slot = index % self.buffer_size
+            if self._timestamps[slot] >= t:
+                return slot
+        return None
+
+    def _capture_loop(self):
+        while self._running:
+            started = time.perf_counter()
+            # Grab into the scratch frame without holding the lock, then copy
+            # it into the oldest slot
+            ret, frame = self._camera.read(self._scratch)
+            if not ret:
+                self.dropped_reads += 1
+                # Don't spin while the camera is unplugged or not delivering
+                time.sleep(self.retry_delay)
+                continue
+            with self._cond:
+                slot = self._count % self.buffer_size
+                np.copyto(self._frames[slot], frame)
+                self._timestamps[slot] = started
+                self._count += 1
+                self._cond.notify_all()
@@ -0,0 +1,106 @@
+import numpy as np
+
+
+class FiducialTracker:
+    """
+    Track a sprocket hole with template matching at subpixel precision.
+
+    Once HoughCircles has found the hole, lock() stores a grayscale template
+    around it. track() then finds the template with a normalized
+    cross-correlation over the (small) ROI and refines the peak with a
+    parabola fit in x and y, which is both cheaper than blur + Hough on every
+    frame and not limited to integer centers. When the match score drops below
+    min_score the tracker unlocks and the caller falls back to Hough.
+    """
+
+    def __init__(self, min_score=0.7, padding=4):
+        """
+        Args:
+            min_score (float): Minimum TM_CCOEFF_NORMED score to stay locked.
+            padding (int): Pixels of background kept around the hole in the template.
+        """
+        self.min_score = min_score
+        self.padding = padding
+        self.template = None
+        self.radius = None
+        self.last_score = None
+
+    @property
+    def locked(self):
+        return self.template is not None
+
+    def unlock(self):
+        self.template = None
+
+    def lock(self, gray, center, radius):
+        """
+        Store the template around a detected circle.
+
+        Args:
+            gray (numpy.ndarray): Grayscale image the circle was found in.
+            center (tuple): (x, y) circle center in gray coordinates.
+            radius (float): Circle radius in pixels.
+
+        Returns:
+            bool: False if the circle is too close to the edge to cut a template.
+        """
+        half = int(round(radius)) + self.padding
+        x, y = int(round(center[0])), int(round(center[1]))
+        if x - half < 0 or y - half < 0 or x + half + 1 > gray.shape[1] or y + half + 1 > gray.shape[0]:
+            return False
+        self.template = gray[y - half:y + half + 1, x - half:x + half + 1].copy()
+        self.radius = radius
+        return True
+
+    def track(self, gray):
+        """
+        Locate the locked template in a grayscale image.
+
+        Returns:
+            tuple: (x, y, radius) with subpixel x/y in gray coordinates, or None
+            (and the tracker unlocks) if the match is too weak.
+        """
+        import cv2
+        if self.template is None:
+            return None
+        th, tw = self.template.shape
+        if gray.shape[0] < th or gray.shape[1] < tw:
+            self.unlock()
+            return None
+
+        scores = cv2.matchTemplate(gray, self.template, cv2.TM_CCOEFF_NORMED)
+        _, best, _, (px, py) = cv2.minMaxLoc(scores)
+        self.last_score = best
+        if best < self.min_score:
+            self.unlock()
+            return None
+
+        dx = _parabola_offset(scores[py, px - 1], best, scores[py, px + 1]) if 0 < px < scores.shape[1] - 1 else 0.0
+        dy = _parabola_offset(scores[py - 1, px], best, scores[py + 1, px]) if 0 < py < scores.shape[0] - 1 else 0.0
+        # Template origin -> template center
+        return px + dx + (tw - 1) / 2, py + dy + (th - 1) / 2, self.radius
+
+
+def _parabola_offset(left, center, right):
+    """Subpixel offset of a peak from three neighbouring samples."""
+    denominator = left - 2 * center + right
+    if denominator == 0:
+        return 0.0
+    return float(np.clip(0.5 * (left - right) / denominator, -0.5, 0.5))
+
+
+def closest_circle(circles, center_x, center_y):
+    """
+    Pick the circle closest to a point.
+
+    Args:
+        circles (numpy.ndarray): HoughCircles output, shape (1, N, 3).
+        center_x (float): Point x.
+        center_y (float): Point y.
+
+    Returns:
+        numpy.ndarray: The (x, y, r) row of the closest circle.
+    """
+    circles = circles[0]
+    distances = (circles[:, 0] - center_x) ** 2 + (circles[:, 1] - center_y) ** 2
+    return circles[np.argmin(distances)]
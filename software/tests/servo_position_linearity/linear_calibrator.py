@@ -0,0 +1,183 @@
+"""
+Running least-squares fit of x position against servo index.
+
+analyze_and_plot_data() used to call linregress on the regrouped means after
+every batch. LinearCalibrator updates the fit with each (index, x_mm) sample
+in O(1), so the current steps-per-mm, R² and their confidence intervals are
+always available and a calibration run can stop as soon as they converge:
+
+    calibrator = LinearCalibrator(robust=True)
+    calibrator.update(index, x_mm)
+    if calibrator.converged(rel_tolerance=0.005):
+        print(calibrator.steps_per_mm, calibrator.steps_per_mm_interval())
+
+The fit keeps weighted means and co-moments (a Welford-style update). With a
+forgetting_factor below 1 older samples are down-weighted geometrically, which
+tracks slow drift; the effective sample count is then about 1 / (1 - factor).
+In robust mode a sample more than outlier_sigma prediction standard errors
+from the current line is rejected once min_samples have been accepted. The
+prediction error includes the uncertainty of the line itself, which is large
+far from the mean index early in a run, so valid samples at the ends of the
+range are not thrown away while the slope is still poorly known.
+"""
+import math
+
+
+class LinearCalibrator:
+    """Incremental x_mm = intercept + slope * index fit."""
+
+    def __init__(self, forgetting_factor=1.0, robust=False, outlier_sigma=4.0, min_samples=10):
+        """
+        Args:
+            forgetting_factor (float): Weight kept by the previous samples on each update (0 < factor <= 1).
+            robust (bool): Reject outliers against the current fit.
+            outlier_sigma (float): Residual threshold in prediction standard errors.
+            min_samples (int): Samples accepted before outliers are rejected.
+        """
+        if not 0.0 < forgetting_factor <= 1.0:
+            raise ValueError("forgetting_factor must be in (0, 1]")
+        self.forgetting_factor = forgetting_factor
+        self.robust = robust
+        self.outlier_sigma = outlier_sigma
+        self.min_samples = min_samples
+        self.reset()
+
+    def reset(self):
+        self.samples = 0
+        self.rejected = 0
+        self.weight = 0.0
+        self.mean_index = 0.0
+        self.mean_x = 0.0
+        self.sxx = 0.0
+        self.sxy = 0.0
+        self.syy = 0.0
+
+    def update(self, index, x_mm):
+        """
+        Add one sample.
+
+        Returns:
+            bool: False if the sample was rejected as an outlier.
+        """
+        if self.robust and self.samples >= self.min_samples:
+            sigma = self.prediction_std(index)
+            if sigma > 0 and abs(x_mm - self.predict(index)) > self.outlier_sigma * sigma:
+                self.rejected += 1
+                return False
+
+        factor = self.forgetting_factor
+        self.samples += 1
+        self.weight = factor * self.weight + 1.0
+        d_index = index - self.mean_index
+        d_x = x_mm - self.mean_x
+        self.mean_index += d_index / self.weight
+        self.mean_x += d_x / self.weight
+        self.sxx = factor * self.sxx + d_index * (index - self.mean_index)
+        self.sxy = factor * self.sxy + d_index * (x_mm - self.mean_x)
+        self.syy = factor * self.syy + d_x * (x_mm - self.mean_x)
+        return True
+
+    def update_many(self, indices, x_mm):
+        for index, x in zip(indices, x_mm):
+            self.update(index, x)
+
+    @property
+    def ready(self):
+        """True once the fit has enough spread in index to estimate a slope and its error."""
+        return self.weight > 2.0 and self.sxx > 0.0
+
+    @property
+    def slope(self):
+        """mm per step."""
+        return self.sxy / self.sxx if self.sxx > 0.0 else math.nan
+
+    @property
+    def intercept(self):
+        return self.mean_x - self.slope * self.mean_index
+
+    @property
+    def r_squared(self):
+        if self.sxx <= 0.0 or self.syy <= 0.0:
+            return math.nan
+        return self.sxy * self.sxy / (self.sxx * self.syy)
+
+    @property
+    def residual_std(self):
+        if not self.ready:
+            return math.nan
+        sse = max(self.syy - self.slope * self.sxy, 0.0)
+        return math.sqrt(sse / (self.weight - 2.0))
+
+    @property
+    def slope_std_error(self):
+        return self.residual_std / math.sqrt(self.sxx) if self.ready else math.nan
+
+    @property
+    def steps_per_mm(self):
+        slope = self.slope
+        return 1.0 / slope if slope else math.nan
+
+    def steps_for_distance(self, distance_mm):
+        return distance_mm * self.steps_per_mm
+
+    def predict(self, index):
+        return self.intercept + self.slope * index
+
+    def prediction_std(self, index):
+        """Standard error in mm of a new sample at index: residual noise plus the error of the line there."""
+        if not self.ready:
+            return math.nan
+        leverage = 1.0 + 1.0 / self.weight + (index - self.mean_index) ** 2 / self.sxx
+        return self.residual_std * math.sqrt(leverage)
+
+    def _critical_value(self, confidence):
+        # Imported here so the calibrator stays cheap to import
+        from scipy.stats import t
+
+        return t.ppf(0.5 + confidence / 2.0, self.weight - 2.0)
+
+    def slope_interval(self, confidence=0.95):
+        """(low, high) confidence interval of the slope in mm per step."""
+        if not self.ready:
+            return math.nan, math.nan
+        half_width = self._critical_value(confidence) * self.slope_std_error
+        return self.slope - half_width, self.slope + half_width
+
+    def steps_per_mm_interval(self, confidence=0.95):
+        """(low, high) confidence interval of steps per mm, or NaNs while the slope interval contains 0."""
+        low, high = self.slope_interval(confidence)
+        if not low * high > 0:
+            return math.nan, math.nan
+        return tuple(sorted((1.0 / low, 1.0 / high)))
+
+    def r_squared_interval(self, confidence=0.95):
+        """(low, high) confidence interval of R² from the Fisher z-transform of r."""
+        r = math.copysign(math.sqrt(self.r_squared), self.slope) if self.ready else math.nan
+        if not self.weight > 3.0 or math.isnan(r):
+            return math.nan, math.nan
+        if abs(r) >= 1.0:
+            return 1.0, 1.0
+        from statistics import NormalDist
+
+        z = math.atanh(r)
+        half_width = NormalDist().inv_cdf(0.5 + confidence / 2.0) / math.sqrt(self.weight - 3.0)
+        ends = [math.tanh(z - half_width) ** 2, math.tanh(z + half_width) ** 2]
+        # The interval of r can straddle 0, where r² is smallest
+        low = 0.0 if math.tanh(z - half_width) * math.tanh(z + half_width) < 0 else min(ends)
+        return low, max(ends)
+
+    def converged(self, rel_tolerance=0.01, confidence=0.95):
+        """True once the steps-per-mm interval is within ±rel_tolerance of the estimate."""
+        low, high = self.steps_per_mm_interval(confidence)
+        if math.isnan(low):
+            return False
+        return (high - low) / 2.0 <= rel_tolerance * abs(self.steps_per_mm)
+
+    def summary(self, confidence=0.95):
+        low, high = self.steps_per_mm_interval(confidence)
+        r2_low, r2_high = self.r_squared_interval(confidence)
+        return (
+            f"{self.steps_per_mm:.3f} steps/mm ({confidence:.0%} CI {low:.3f}-{high:.3f}), "
+            f"R² {self.r_squared:.6f} (CI {r2_low:.6f}-{r2_high:.6f}), "
+            f"{self.samples} samples, {self.rejected} rejected"
+        )
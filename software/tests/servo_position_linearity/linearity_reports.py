@@ -0,0 +1,51 @@
+"""
+Report renderers for the linearity test, run by ReportWorker.
+
+Each renderer creates its figure once and updates the line data on later
+calls instead of building a new figure for every sweep.
+"""
+import matplotlib.pyplot as plt
+
+
+class AggregatedStatsReport:
+    """Median and standard deviation of x position vs index, from an IndexedStats snapshot."""
+
+    def __init__(self):
+        self.fig, self.axs = plt.subplots(2, 1, figsize=(12, 10))
+
+        # Plot median x position
+        (self.median_line,) = self.axs[0].plot(
+            [], [], marker='o', linestyle='-', label='Median X Position', color='blue'
+        )
+        self.axs[0].set_xlabel('Index')
+        self.axs[0].set_ylabel('X Position (mm)')
+        self.axs[0].grid(True)
+        self.axs[0].legend()
+
+        # Plot standard deviation of x position
+        (self.std_line,) = self.axs[1].plot([], [], marker='o', linestyle='-', color='green')
+        self.axs[1].set_xlabel('Index')
+        self.axs[1].set_ylabel('Standard Deviation of X Position (mm)')
+        self.axs[1].grid(True)
+
+        self.title = self.fig.suptitle('', fontsize=14)
+        self.fig.tight_layout(rect=[0, 0.03, 1, 0.95])  # Adjust layout to make room for suptitle
+
+    def render(self, snapshot, attempt_count):
+        """
+        Args:
+            snapshot (dict): IndexedStats.snapshot() of the plotted index range.
+            attempt_count (int): The current iteration count for labeling the plot.
+        """
+        self.title.set_text(
+            f'X Position Statistics vs Index (Aggregated Across Attempts) - {attempt_count} Attempts'
+        )
+        self.median_line.set_data(snapshot['index'], snapshot['median'])
+        self.std_line.set_data(snapshot['index'], snapshot['std'])
+        for ax in self.axs:
+            ax.relim()
+            ax.autoscale_view()
+
+        plot_filename = f'aggregated_median_std_dev_vs_index_plot_attempt_{attempt_count}.png'
+        self.fig.savefig(plot_filename)
+        print(f"Saved plot to {plot_filename}")
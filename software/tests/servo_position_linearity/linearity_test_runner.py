@@ -1,14 +1,22 @@
+import argparse
+import math
 import os
 import time
-import math
 import csv
 import serial
-import cv2
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
 
 import software.tests.servo_position_linearity.messages as messages  # Assuming this is a custom module
+from software.tests.servo_position_linearity.camera_capture import CameraCapture
+from software.tests.servo_position_linearity.settle_detector import SettleDetector
+from software.tests.servo_position_linearity.fiducial_locator import FiducialTracker, closest_circle
+from software.tests.servo_position_linearity.streaming_stats import IndexedStats
+from software.tests.servo_position_linearity.linear_calibrator import LinearCalibrator
+from software.tests.servo_position_linearity.roi_predictor import RoiPredictor
+from software.tests.servo_position_linearity.sweep_scheduler import SweepScheduler
+from software.tests.detectors import HOUGH_CIRCLE_PARAMS
+from software.tests.report_worker import ReportWorker
+from software.tests.image_archiver import ArchivePolicy, ImageArchiver, FAILURE
 
 
 # Constants
@@ -16,6 +24,11 @@ IMAGE_SAVE_DIR = "measured_images"
 SINGLE_IMAGE_FILENAME = os.path.join(IMAGE_SAVE_DIR, "current_view.png")
 BLURRED_IMAGE_FILENAME = os.path.join(IMAGE_SAVE_DIR, "blurred_view.png")
 GRAY_IMAGE_FILENAME = os.path.join(IMAGE_SAVE_DIR, "gray_view.png")
+FAILURE_IMAGE_PATTERN = os.path.join(IMAGE_SAVE_DIR, "failure_{timestamp:.3f}.png")
+# Raw frames with their servo index, for software/tests/reanalyze_frames.py
+FRAME_ARCHIVE_DIR = os.path.join(IMAGE_SAVE_DIR, "frames")
+FRAME_FILENAME_PATTERN = "frame_{sequence:06d}_{index}.png"
+FRAME_MANIFEST = "frames.csv"
 
 CSV_FILENAME = "data.csv"
 FIELDNAMES = ["x_position_mm", "index"]  # Store x position in mm and index
@@ -24,6 +37,18 @@ CIRCLE_DIAMETER_PIXELS = 72  # Diameter in pixels
 CIRCLE_DIAMETER_MM = 1.4      # Actual diameter in millimeters (update as needed)
 PIXEL_TO_MM_SCALE = CIRCLE_DIAMETER_MM / CIRCLE_DIAMETER_PIXELS  # mm per pixel
 
+# Plots are rendered off the measurement loop by a ReportWorker
+AGGREGATED_STATS_REPORT = "aggregated_stats"
+REPORT_RENDERERS = {
+    AGGREGATED_STATS_REPORT: "software.tests.servo_position_linearity.linearity_reports:AggregatedStatsReport",
+}
+
+# Index range used for the steps-per-mm fit (the ends of the sweep are not linear)
+CALIBRATION_INDEX_RANGE = (250, 750)
+
+# Servo indices measured, in the order a sweep visits them
+SWEEP_INDICES = range(900, 275, -5)
+
 # Define the Region of Interest (ROI) as a dictionary
 roi = {
     "x_start": None,
@@ -32,6 +57,19 @@ roi = {
     "height": None
 }
 
+# Template tracker used once Hough has locked on to the sprocket hole
+tracker = FiducialTracker()
+
+# Predicts the hole position at the next servo index, so the ROI can stay tight
+roi_predictor = RoiPredictor(radius=CIRCLE_DIAMETER_PIXELS / 2)
+
+# Writes the current view (and frames where detection failed) off the measurement loop
+archiver = ImageArchiver(policy=ArchivePolicy(every=1, outliers=False, failures=True))
+
+# Raw frames before detection draws on them; off unless main() gets archive_frames
+frame_archiver = ImageArchiver(FRAME_ARCHIVE_DIR, ArchivePolicy(every=0, outliers=False, failures=False),
+                               manifest=FRAME_MANIFEST, metadata_fields=("index",))
+
 def ensure_image_save_dir():
     """Ensure that the image save directory exists."""
     os.makedirs(IMAGE_SAVE_DIR, exist_ok=True)
@@ -53,48 +91,67 @@ def detect_and_draw_circle(original_image, cropped_image, roi_x_start, roi_y_sta
         gray_blurred (numpy.ndarray): Blurred grayscale image.
         closest_circle (tuple): Coordinates and radius of the detected circle.
     """
+    import cv2
     gray = cv2.cvtColor(cropped_image, cv2.COLOR_BGR2GRAY)
     gray_blurred = cv2.medianBlur(gray, 5)
 
     # Detect circles using HoughCircles
-    circles = cv2.HoughCircles(
-        gray_blurred,
-        cv2.HOUGH_GRADIENT,
-        dp=1,
-        minDist=20,
-        param1=25,
-        param2=20,
-        minRadius=36,
-        maxRadius=38
-    )
+    circles = cv2.HoughCircles(gray_blurred, cv2.HOUGH_GRADIENT, **HOUGH_CIRCLE_PARAMS)
 
-    closest_circle = None
-    min_distance = float('inf')
     center_x = cropped_image.shape[1] // 2
     center_y = cropped_image.shape[0] // 2
 
     if circles is not None:
-        circles = np.round(circles[0, :]).astype("int")
-        for x, y, r in circles:
-            distance = math.sqrt((x - center_x)**2 + (y - center_y)**2)
-            if distance < min_distance:
-                closest_circle = (x, y, r)
-                min_distance = distance
-
-        if closest_circle:
-            x, y, r = closest_circle
+        x, y, r = np.round(closest_circle(circles, center_x, center_y)).astype("int")
+        original_x = roi_x_start + x
+        original_y = roi_y_start + y
+        cv2.circle(original_image, (original_x, original_y), r, (0, 255, 0), 4)
+        # Convert x position to mm
+        x_position_mm = original_x * PIXEL_TO_MM_SCALE
+        return x_position_mm, original_image, gray, gray_blurred, (x, y, r)
+
+    return None, original_image, gray, gray_blurred, None
+
+def locate_circle(original_image, cropped_image, roi_x_start, roi_y_start):
+    """
+    Locate the sprocket hole, using the subpixel template tracker while it is
+    locked and falling back to detect_and_draw_circle() on loss of lock.
+
+    Returns:
+        The same tuple as detect_and_draw_circle(); the circle center is a float
+        when it came from the tracker.
+    """
+    import cv2
+    gray = cv2.cvtColor(cropped_image, cv2.COLOR_BGR2GRAY)
+
+    if tracker.locked:
+        tracked = tracker.track(gray)
+        if tracked is not None:
+            x, y, r = tracked
             original_x = roi_x_start + x
             original_y = roi_y_start + y
-            cv2.circle(original_image, (original_x, original_y), r, (0, 255, 0), 4)
-            # Convert x position to mm
-            x_position_mm = original_x * PIXEL_TO_MM_SCALE
-            return x_position_mm, original_image, gray, gray_blurred, closest_circle
+            cv2.circle(original_image, (round(original_x), round(original_y)), round(r), (255, 0, 0), 4)
+            return original_x * PIXEL_TO_MM_SCALE, original_image, gray, None, tracked
 
-    return None, original_image, gray, gray_blurred, None
+    x_position_mm, processed_image, gray, gray_blurred, circle = detect_and_draw_circle(
+        original_image, cropped_image, roi_x_start, roi_y_start
+    )
+    if circle is not None:
+        tracker.lock(gray, circle[:2], circle[2])
+    return x_position_mm, processed_image, gray, gray_blurred, circle
 
-def capture_and_process(camera, is_first_iteration, roi):
+def capture_and_process(camera, is_first_iteration, roi, not_before=None, index=None):
     """
     Capture images from the camera, detect circles, and ensure stability of detection.
+
+    Args:
+        camera (CameraCapture): Open camera.
+        is_first_iteration (bool): Search the full frame instead of the ROI
+            (ignored once roi_predictor can predict the position at index).
+        roi (dict): Region of interest, updated in place.
+        not_before (float): Only use frames captured after this time.perf_counter() value.
+        index (int): Servo index. When given, the ROI is placed by roi_predictor
+            and the raw frame is archived with it.
     
     Returns:
         calculated_x_position (float): The stable x position in millimeters.
@@ -106,17 +163,38 @@ def capture_and_process(camera, is_first_iteration, roi):
     calculated_x_position = None
     processed_image_for_save = None
     detected_circle = None
+    last_image = None
 
     while attempts < max_attempts:
-        ret, captured_image = camera.read()
+        if not_before is not None:
+            frame_time, captured_image = camera.read_after(not_before)
+            ret = captured_image is not None
+            if ret:
+                # A retry must look at a later frame than this one
+                not_before = math.nextafter(frame_time, math.inf)
+        else:
+            ret, captured_image = camera.read()
         if not ret:
             print(f"Error reading camera (attempt {attempts + 1})")
             attempts += 1
             continue
 
+        if last_image is None and index is not None:
+            frame_archiver.submit(
+                captured_image,
+                FRAME_FILENAME_PATTERN.format(sequence=frame_archiver.submitted, index=index),
+                metadata={"index": index},
+            )
+
+        last_image = captured_image
         image_height, image_width, _ = captured_image.shape
 
-        if is_first_iteration:
+        predicted_roi = roi_predictor.roi(index, image_width, image_height) if index is not None else None
+        if predicted_roi is not None:
+            # Tight ROI where the servo index model expects the hole
+            roi.update(predicted_roi)
+        elif is_first_iteration or index is not None:
+            tracker.unlock()
             roi["x_start"] = 0
             roi["y_start"] = 0
             roi["width"] = image_width
@@ -132,30 +210,40 @@ def capture_and_process(camera, is_first_iteration, roi):
             roi["x_start"]:roi["x_start"] + roi["width"]
         ]
 
-        x_position1, processed_image1, _, _, detected_circle = detect_and_draw_circle(
+        x_position1, processed_image1, _, _, detected_circle = locate_circle(
             captured_image, cropped_image, roi["x_start"], roi["y_start"]
         )
 
         if detected_circle is not None:
             _, _, cr = detected_circle
-
-            # Update ROI to be centered around the detected circle
-            new_roi_width = int(2 * cr * 2)  # 2 times the diameter
-            new_roi_height = int(2 * cr * 2)
             cx_absolute = roi["x_start"] + detected_circle[0]
             cy_absolute = roi["y_start"] + detected_circle[1]
 
-            roi["x_start"] = max(0, int(cx_absolute - new_roi_width / 2))
-            roi["y_start"] = max(0, int(cy_absolute - new_roi_height / 2))
-            roi["width"] = min(new_roi_width, image_width - roi["x_start"])
-            roi["height"] = min(new_roi_height, image_height - roi["y_start"])
+            if index is None:
+                # Update ROI to be centered around the detected circle
+                new_roi_width = int(2 * cr * 2)  # 2 times the diameter
+                new_roi_height = int(2 * cr * 2)
+
+                roi["x_start"] = max(0, int(cx_absolute - new_roi_width / 2))
+                roi["y_start"] = max(0, int(cy_absolute - new_roi_height / 2))
+                roi["width"] = min(new_roi_width, image_width - roi["x_start"])
+                roi["height"] = min(new_roi_height, image_height - roi["y_start"])
+        elif index is not None:
+            # Search wider around the prediction on the next attempt
+            roi_predictor.miss()
 
         if x_position1 is None:
             attempts += 1
             continue
 
         # Capture the second image for stability check
-        ret2, captured_image2 = camera.read()
+        if not_before is not None:
+            frame_time, captured_image2 = camera.read_after(not_before)
+            ret2 = captured_image2 is not None
+            if ret2:
+                not_before = math.nextafter(frame_time, math.inf)
+        else:
+            ret2, captured_image2 = camera.read()
         if not ret2:
             print("Error reading camera (stability check)")
             return None, None, None
@@ -164,7 +252,7 @@ def capture_and_process(camera, is_first_iteration, roi):
             roi["y_start"]:roi["y_start"] + roi["height"],
             roi["x_start"]:roi["x_start"] + roi["width"]
         ]
-        x_position2, _, _, _, _ = detect_and_draw_circle(
+        x_position2, _, _, _, _ = locate_circle(
             captured_image2, cropped_image2, roi["x_start"], roi["y_start"]
         )
 
@@ -175,88 +263,60 @@ def capture_and_process(camera, is_first_iteration, roi):
         if abs(x_position1 - x_position2) < 10 * PIXEL_TO_MM_SCALE:  # Adjust threshold based on scale
             calculated_x_position = x_position1
             processed_image_for_save = processed_image1
+            if index is not None:
+                roi_predictor.update(index, cx_absolute, cy_absolute)
             break
         else:
             print(f"X positions not consistent ({x_position1:.2f} mm vs {x_position2:.2f} mm), retrying...")
             attempts += 1
 
     if calculated_x_position is not None and processed_image_for_save is not None:
-        cv2.imwrite(SINGLE_IMAGE_FILENAME, processed_image_for_save)
-        print(f"Saved current view image to {SINGLE_IMAGE_FILENAME}")
+        archiver.submit(processed_image_for_save, SINGLE_IMAGE_FILENAME, roi=roi)
+    elif last_image is not None:
+        archiver.submit(last_image, FAILURE_IMAGE_PATTERN.format(timestamp=time.time()), kind=FAILURE, roi=roi)
 
     return calculated_x_position, processed_image_for_save, detected_circle
 
-def plot_aggregated_x_position_stats(data, attempt_count):
+def plot_aggregated_x_position_stats(stats, attempt_count, report_worker):
     """
-    Plot the median and standard deviation of x positions against the index.
+    Queue a plot of the median and standard deviation of x positions against the index.
+
+    The plot is rendered by the report worker process, so this returns immediately.
     
     Args:
-        data (list of dict): Collected data with x_position_mm and index.
+        stats (IndexedStats): Streaming x position statistics per index.
         attempt_count (int): The current iteration count for labeling the plot.
+        report_worker (ReportWorker): Started worker with the AGGREGATED_STATS_REPORT renderer.
     """
-    if not data:
+    if not len(stats):
         print("No data to plot.")
         return
 
-    df = pd.DataFrame(data)
-
-    # Filter data within the index range [200, 850]
-    filtered_df = df[(df['index'] >= 200) & (df['index'] <= 850)]
+    # Only the index range [200, 850] is plotted
+    snapshot = stats.snapshot(lower_index=200, upper_index=850)
 
-    if filtered_df.empty:
+    if not len(snapshot["index"]):
         print("No data to plot within the index range [200, 850].")
         return
 
-    median_x = filtered_df.groupby('index')['x_position_mm'].median().reset_index()
-    median_x = median_x.rename(columns={'x_position_mm': 'median_x_position_mm'})
+    report_worker.submit(AGGREGATED_STATS_REPORT, {"snapshot": snapshot, "attempt_count": attempt_count})
 
-    std_devs = filtered_df.groupby('index')['x_position_mm'].std().reset_index()
-    std_devs = std_devs.rename(columns={'x_position_mm': 'x_position_std_mm'})
-
-    if median_x.empty or std_devs.empty:
-        print("No median or standard deviation to plot within the index range [200, 850].")
-        return
-
-    fig, axs = plt.subplots(2, 1, figsize=(12, 10))
-    fig.suptitle(
-        f'X Position Statistics vs Index (Aggregated Across Attempts) - {attempt_count} Attempts',
-        fontsize=14
-    )
+def main(stop_tolerance=None, archive_frames=0, adaptive=False, round_size=40, target_se=None):
+    """
+    Main function to execute the measurement and plotting process.
 
-    # Plot median x position
-    axs[0].plot(
-        median_x['index'],
-        median_x['median_x_position_mm'],
-        marker='o',
-        linestyle='-',
-        label='Median X Position',
-        color='blue'
-    )
-    axs[0].set_xlabel('Index')
-    axs[0].set_ylabel('X Position (mm)')
-    axs[0].grid(True)
-    axs[0].legend()
-
-    # Plot standard deviation of x position
-    axs[1].plot(
-        std_devs['index'],
-        std_devs['x_position_std_mm'],
-        marker='o',
-        linestyle='-',
-        color='green'
-    )
-    axs[1].set_xlabel('Index')
-    axs[1].set_ylabel('Standard Deviation of X Position (mm)')
-    axs[1].grid(True)
-
-    plt.tight_layout(rect=[0, 0.03, 1, 0.95])  # Adjust layout to make room for suptitle
-    plot_filename = f'aggregated_median_std_dev_vs_index_plot_attempt_{attempt_count}.png'
-    plt.savefig(plot_filename)
-    print(f"Saved plot to {plot_filename}")
-    plt.close()
-
-def main():
-    """Main function to execute the measurement and plotting process."""
+    Args:
+        stop_tolerance (float): Stop after the sweep in which the steps-per-mm
+            95% confidence interval is within this relative tolerance. Runs
+            until interrupted when None.
+        archive_frames (int): Archive every Nth raw frame with its servo index
+            for offline re-analysis; 0 to archive none.
+        adaptive (bool): Let a SweepScheduler pick round_size indices per sweep
+            instead of visiting all of SWEEP_INDICES.
+        round_size (int): Indices per adaptive sweep.
+        target_se (float): Adaptive runs also stop once every index's mean has
+            at most this standard error in mm.
+    """
     ensure_image_save_dir()
 
     # Open serial port
@@ -273,10 +333,11 @@ def main():
         print(f"Error opening serial port: {e}")
         return
 
-    # Open camera
-    camera = cv2.VideoCapture(0)
-    if not camera.isOpened():
-        print("Error: Could not open camera.")
+    # Open camera and keep it capturing in the background
+    try:
+        camera = CameraCapture(0).start()
+    except RuntimeError as e:
+        print(f"Error: {e}")
         ser.close()
         return
 
@@ -284,28 +345,47 @@ def main():
     with open(CSV_FILENAME, mode="w", newline="") as csv_file:
         csv_writer = csv.DictWriter(csv_file, fieldnames=FIELDNAMES)
         csv_writer.writeheader()
-        result_list = []
+        x_position_stats = IndexedStats()
+        calibrator = LinearCalibrator(robust=True)
+        report_worker = ReportWorker(REPORT_RENDERERS).start()
+        archiver.start()
+        if archive_frames:
+            frame_archiver.policy = ArchivePolicy(every=archive_frames, outliers=False, failures=False)
+            frame_archiver.start()
         iteration_count = 0
+        settle_detector = SettleDetector()
+        scheduler = None
+        if adaptive:
+            scheduler = SweepScheduler(
+                SWEEP_INDICES, x_position_stats, calibrator, round_size=round_size,
+                fit_range=CALIBRATION_INDEX_RANGE, rel_tolerance=stop_tolerance, target_se=target_se,
+            )
 
         try:
             while True:
                 print("Starting new outer loop iteration")
-                write_message(messages.rotate_servo(0, 900), ser)
+                sweep = scheduler.next_sweep() if scheduler is not None else SWEEP_INDICES
+                write_message(messages.rotate_servo(0, SWEEP_INDICES[0]), ser)
                 is_first_iteration = True  # Reset for the new outer loop
                 print("Outer loop: is_first_iteration set to True")
 
-                # Reset ROI to trigger full image on first capture
+                # Reset ROI; the first capture searches the full frame unless roi_predictor can place it
                 roi["x_start"] = None
                 roi["y_start"] = None
                 roi["width"] = None
                 roi["height"] = None
 
-                for i in range(900, 275, -5):
+                for i in sweep:
                     write_message(messages.rotate_servo(0, i), ser)
-                    time.sleep(0.2)
+                    acked_at = time.perf_counter()
+
+                    # Wait until the tape stops moving instead of a fixed sleep
+                    _, _, settled_at = settle_detector.wait_for_settle(
+                        camera, acked_at, roi=None if is_first_iteration else roi, index=i
+                    )
 
                     detected_x_mm, processed_image, detected_circle = capture_and_process(
-                        camera, is_first_iteration, roi
+                        camera, is_first_iteration, roi, not_before=settled_at, index=i
                     )
                     print(
                         f"Main loop: After capture_and_process, detected_x_mm = {detected_x_mm}, "
@@ -313,6 +393,8 @@ def main():
                         f"ROI = ({roi['x_start']}, {roi['y_start']}, {roi['width']}, {roi['height']}), "
                         f"Circle: {detected_circle}"
                     )
+                    if scheduler is not None:
+                        scheduler.record_attempt(i, detected_x_mm is not None)
 
                     if detected_x_mm is not None:
                         row = {
@@ -320,16 +402,34 @@ def main():
                             "index": i
                         }
                         csv_writer.writerow(row)
-                        result_list.append(row)
+                        x_position_stats.update(i, detected_x_mm)
+                        if CALIBRATION_INDEX_RANGE[0] <= i <= CALIBRATION_INDEX_RANGE[1]:
+                            calibrator.update(i, detected_x_mm)
 
                         is_first_iteration = False  # After the first successful detection
                     else:
                         print(f"Failed to detect stable circle for servo position {i}")
 
                 iteration_count += 1
-                plot_aggregated_x_position_stats(result_list, iteration_count)
+                settle_detector.print_summary()
+                roi_predictor.print_summary()
+                plot_aggregated_x_position_stats(x_position_stats, iteration_count, report_worker)
+
+                if calibrator.ready:
+                    print(f"Calibration: {calibrator.summary()}")
+                if scheduler is not None:
+                    print(f"Scheduler: {scheduler.summary()}")
+                    if scheduler.done():
+                        print("Confidence targets reached, stopping")
+                        break
+                elif stop_tolerance is not None and calibrator.converged(stop_tolerance):
+                    print(f"Steps per mm converged to within {stop_tolerance:.2%}, stopping")
+                    break
         finally:
             # Release resources
+            report_worker.close()
+            archiver.close()
+            frame_archiver.close()
             if camera.isOpened():
                 camera.release()
             if ser.is_open:
@@ -337,4 +437,16 @@ def main():
             print("Camera and Serial port closed, CSV file saved.")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Servo position linearity test")
+    parser.add_argument("--stop-tolerance", type=float, default=None,
+                        help="Stop once the steps-per-mm 95%% CI is within this relative tolerance (e.g. 0.005)")
+    parser.add_argument("--archive-frames", type=int, default=0, metavar="N",
+                        help=f"Archive every Nth raw frame to {FRAME_ARCHIVE_DIR} for reanalyze_frames")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Measure the indices that improve the calibration most instead of every index")
+    parser.add_argument("--round-size", type=int, default=40, help="Indices per adaptive sweep")
+    parser.add_argument("--target-se", type=float, default=None,
+                        help="With --adaptive, also stop once every index's mean has this standard error in mm")
+    args = parser.parse_args()
+    main(stop_tolerance=args.stop_tolerance, archive_frames=args.archive_frames,
+         adaptive=args.adaptive, round_size=args.round_size, target_se=args.target_se)
@@ -1,15 +1,19 @@
 import struct
 
+from software.crc16 import append_crc, strip_crc
+
 class empty_msg:
     def __init__(self, hardware_address, message_id = 0):
         # Init all of the fields
         self.message_id = message_id
         self.hardware_address = hardware_address
     
-    def serialize(self) -> bytes:
+    def serialize(self, crc: bool = False) -> bytes:
         # Pack integers into a binary format
         # '<' indicates little-endian, 'B' is for unsigned char (1 byte)
-        return struct.pack('BB', self.message_id, self.hardware_address, )
+        data = struct.pack('BB', self.message_id, self.hardware_address, )
+        # Optionally follow the message with a Modbus CRC16, high byte first
+        return append_crc(data) if crc else data
 
 
     @classmethod
@@ -25,10 +29,12 @@ class error_msg:
         self.hardware_address = hardware_address
         self.error_id = error_id
     
-    def serialize(self) -> bytes:
+    def serialize(self, crc: bool = False) -> bytes:
         # Pack integers into a binary format
         # '<' indicates little-endian, 'B' is for unsigned char (1 byte)
-        return struct.pack('BBB', self.message_id, self.hardware_address, self.error_id, )
+        data = struct.pack('BBB', self.message_id, self.hardware_address, self.error_id, )
+        # Optionally follow the message with a Modbus CRC16, high byte first
+        return append_crc(data) if crc else data
 
 
     @classmethod
@@ -44,10 +50,12 @@ class rotate_servo:
         self.hardware_address = hardware_address
         self.angle = angle
     
-    def serialize(self) -> bytes:
+    def serialize(self, crc: bool = False) -> bytes:
         # Pack integers into a binary format
         # '<' indicates little-endian, 'B' is for unsigned char (1 byte)
-        return struct.pack('<BBH', self.message_id, self.hardware_address, self.angle, )
+        data = struct.pack('<BBH', self.message_id, self.hardware_address, self.angle, )
+        # Optionally follow the message with a Modbus CRC16, high byte first
+        return append_crc(data) if crc else data
 
 
     @classmethod
@@ -63,10 +71,12 @@ class set_led_level:
         self.hardware_address = hardware_address
         self.level = level
     
-    def serialize(self) -> bytes:
+    def serialize(self, crc: bool = False) -> bytes:
         # Pack integers into a binary format
         # '<' indicates little-endian, 'B' is for unsigned char (1 byte)
-        return struct.pack('BBB', self.message_id, self.hardware_address, self.level, )
+        data = struct.pack('BBB', self.message_id, self.hardware_address, self.level, )
+        # Optionally follow the message with a Modbus CRC16, high byte first
+        return append_crc(data) if crc else data
 
 
     @classmethod
@@ -81,10 +91,12 @@ class usb_bootloader:
         self.message_id = message_id
         self.hardware_address = hardware_address
     
-    def serialize(self) -> bytes:
+    def serialize(self, crc: bool = False) -> bytes:
         # Pack integers into a binary format
         # '<' indicates little-endian, 'B' is for unsigned char (1 byte)
-        return struct.pack('BB', self.message_id, self.hardware_address, )
+        data = struct.pack('BB', self.message_id, self.hardware_address, )
+        # Optionally follow the message with a Modbus CRC16, high byte first
+        return append_crc(data) if crc else data
 
 
     @classmethod
@@ -94,7 +106,11 @@ class usb_bootloader:
         return cls(hardware_address, message_id)
 
 
-def readMessage(buff: bytes):
+def readMessage(buff: bytes, crc: bool = False):
+    # With crc set, the last two bytes are a Modbus CRC16 that must match
+    if crc:
+        buff = strip_crc(buff)
+
     messages = {
         0: empty_msg,
         1: error_msg,
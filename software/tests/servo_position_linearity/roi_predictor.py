@@ -0,0 +1,170 @@
+import math
+
+
+class RoiPredictor:
+    """
+    Predict where the sprocket hole will be at the next servo index and size the ROI to match.
+
+    The hole's x position is modelled as a function of the commanded index
+    with a constant-velocity Kalman filter over index: the state is the x
+    position and the pixels moved per index step, so a step of d indices
+    predicts x + slope * d with an uncertainty that grows with d (a jump back
+    to the start of the sweep gets a wider ROI than a 5 index step). The ROI
+    is the hole plus padding, widened by sigma standard deviations of the
+    prediction in x. y barely moves and follows an exponential average.
+
+    After a miss the search window grows by `growth` per attempt; after
+    max_misses misses in a row roi() returns None and the caller searches the
+    full frame, which also re-seeds the filter on the next hit.
+    """
+
+    def __init__(self, radius=37, padding=8, sigma=3.0, measurement_std=0.5,
+                 slope_std=1.0, process_std=0.002, growth=2.0, max_misses=3,
+                 innovation_gate=6.0, y_smoothing=0.3, initial_slope=0.0):
+        """
+        Args:
+            radius (float): Sprocket hole radius in pixels.
+            padding (int): Pixels kept around the hole on every side.
+            sigma (float): Standard deviations of the x prediction covered by the ROI.
+            measurement_std (float): Detection noise in pixels.
+            slope_std (float): Initial uncertainty of the pixels-per-index slope.
+            process_std (float): Drift of the slope per index step (the curve's nonlinearity).
+            growth (float): Search window growth factor per consecutive miss.
+            max_misses (int): Misses in a row before falling back to the full frame.
+            innovation_gate (float): A detection further than this many standard
+                deviations from the prediction re-seeds the filter.
+            y_smoothing (float): Weight of a new y measurement.
+            initial_slope (float): Prior pixels per index, e.g. from an earlier calibration.
+        """
+        self.radius = radius
+        self.padding = padding
+        self.sigma = sigma
+        self.measurement_var = measurement_std ** 2
+        self.slope_var = slope_std ** 2
+        self.process_var = process_std ** 2
+        self.growth = growth
+        self.max_misses = max_misses
+        self.innovation_gate = innovation_gate
+        self.y_smoothing = y_smoothing
+        self.initial_slope = initial_slope
+
+        self.hits = 0
+        self.misses_total = 0
+        self.full_frame_searches = 0
+        self.reseeds = 0
+        self._roi_pixels = 0
+        self._rois = 0
+        self.reset()
+
+    def reset(self):
+        """Forget the hole position; the next roi() is a full-frame search."""
+        self.index = None
+        self.x = None
+        self.y = None
+        self.slope = self.initial_slope
+        # Covariance of (x, slope)
+        self.p = [[0.0, 0.0], [0.0, self.slope_var]]
+        self.misses = 0
+
+    @property
+    def ready(self):
+        return self.index is not None
+
+    def predict(self, index):
+        """
+        Predict the hole center at index without changing the filter.
+
+        Returns:
+            tuple: (x, y, x standard deviation) in full-frame pixels, or None
+            before the first detection.
+        """
+        if not self.ready:
+            return None
+        x, _, p = self._propagate(index)
+        return x, self.y, math.sqrt(p[0][0])
+
+    def roi(self, index, image_width, image_height):
+        """
+        ROI to search at index, widened for consecutive misses.
+
+        Returns:
+            dict: x_start/y_start/width/height inside the image, or None for a
+            full-frame search.
+        """
+        if not self.ready or self.misses >= self.max_misses:
+            self.full_frame_searches += 1
+            return None
+
+        x, y, x_std = self.predict(index)
+        scale = self.growth ** self.misses
+        half_width = (self.radius + self.padding + self.sigma * x_std) * scale
+        half_height = (self.radius + self.padding) * scale
+        x_start = max(0, int(x - half_width))
+        y_start = max(0, int(y - half_height))
+        x_end = min(image_width, int(math.ceil(x + half_width)) + 1)
+        y_end = min(image_height, int(math.ceil(y + half_height)) + 1)
+        if x_end - x_start < 2 * self.radius or y_end - y_start < 2 * self.radius:
+            # The prediction left the image; look everywhere
+            self.full_frame_searches += 1
+            return None
+
+        self._rois += 1
+        self._roi_pixels += (x_end - x_start) * (y_end - y_start)
+        return {"x_start": x_start, "y_start": y_start, "width": x_end - x_start, "height": y_end - y_start}
+
+    def update(self, index, x, y):
+        """Correct the filter with a detection at index (full-frame pixels)."""
+        self.hits += 1
+        self.misses = 0
+        if not self.ready:
+            self.index, self.x, self.y = index, x, y
+            self.p = [[self.measurement_var, 0.0], [0.0, self.slope_var]]
+            return
+
+        predicted_x, slope, p = self._propagate(index)
+        innovation = x - predicted_x
+        s = p[0][0] + self.measurement_var
+        if innovation * innovation > self.innovation_gate ** 2 * s:
+            # Found somewhere the model did not expect (e.g. after a full-frame search)
+            self.reseeds += 1
+            self.index, self.x, self.y = index, x, y
+            self.p = [[self.measurement_var, 0.0], [0.0, max(p[1][1], self.slope_var)]]
+            return
+
+        k0 = p[0][0] / s
+        k1 = p[1][0] / s
+        self.x = predicted_x + k0 * innovation
+        self.slope = slope + k1 * innovation
+        self.p = [
+            [(1 - k0) * p[0][0], (1 - k0) * p[0][1]],
+            [p[1][0] - k1 * p[0][0], p[1][1] - k1 * p[0][1]],
+        ]
+        self.y += self.y_smoothing * (y - self.y)
+        self.index = index
+
+    def miss(self):
+        """Record a failed detection in the predicted ROI."""
+        self.misses += 1
+        self.misses_total += 1
+
+    def _propagate(self, index):
+        d = index - self.index
+        p = self.p
+        # x' = x + d * slope, with white noise on the slope's rate of change
+        q = self.process_var
+        q00 = q * abs(d) ** 3 / 3
+        q01 = q * d * abs(d) / 2
+        q11 = q * abs(d)
+        p00 = p[0][0] + d * (p[1][0] + p[0][1]) + d * d * p[1][1] + q00
+        p01 = p[0][1] + d * p[1][1] + q01
+        p10 = p[1][0] + d * p[1][1] + q01
+        p11 = p[1][1] + q11
+        return self.x + d * self.slope, self.slope, [[p00, p01], [p10, p11]]
+
+    def print_summary(self):
+        mean_area = self._roi_pixels / self._rois if self._rois else 0.0
+        print(
+            f"ROI predictor: {self.hits} hits, {self.misses_total} misses, "
+            f"{self.full_frame_searches} full-frame searches, {self.reseeds} re-seeds, "
+            f"mean ROI {mean_area:.0f} px, slope {self.slope:.3f} px/index"
+        )
@@ -0,0 +1,129 @@
+import time
+
+
+class SettleDetector:
+    """
+    Detect when the tape has stopped moving after a servo command.
+
+    Consecutive frames from a CameraCapture are compared (mean absolute
+    grayscale difference inside the ROI). The tape is declared settled once
+    the difference stays below motion_threshold for stable_pairs consecutive
+    frame pairs. If that does not happen within timeout seconds the last frame
+    is used anyway, like the fixed sleep it replaces.
+
+    The firmware acks about 350 us after the command, before the tape has
+    started to move, so still frames only count once motion has been seen or
+    min_delay seconds have passed since the ack (a small step may never show
+    visible motion). Without an ROI the difference is taken per block_size
+    block and the largest block is used, so a moving hole is not averaged
+    away by the still rest of the frame.
+
+    Settle times are recorded per servo index so slow positions stand out.
+    """
+
+    def __init__(self, motion_threshold=1.5, stable_pairs=2, timeout=0.5, min_delay=0.1, block_size=64):
+        """
+        Args:
+            motion_threshold (float): Mean absolute gray level difference below
+                which two frames count as "not moving".
+            stable_pairs (int): Number of consecutive still frame pairs required.
+            timeout (float): Seconds to wait before giving up and using the last frame.
+            min_delay (float): Seconds after the ack before still frames count
+                without any motion having been seen.
+            block_size (int): Block size in pixels for full-frame comparisons.
+        """
+        self.motion_threshold = motion_threshold
+        self.stable_pairs = stable_pairs
+        self.timeout = timeout
+        self.min_delay = min_delay
+        self.block_size = block_size
+        self.stats = {}  # index -> {"count", "total_s", "max_s", "timeouts"}
+
+    def wait_for_settle(self, camera, since, roi=None, index=None):
+        """
+        Watch frames captured after `since` until motion stops.
+
+        Args:
+            camera (CameraCapture): Open camera.
+            since (float): time.perf_counter() value of the servo command ack.
+            roi (dict): Optional region of interest with x_start/y_start/width/height.
+            index (int): Servo index the statistics are recorded under.
+
+        Returns:
+            settled (bool): False if the timeout expired first.
+            settle_time (float): Seconds from `since` to the first still frame.
+            timestamp (float): Capture time of that frame; measure from frames after it.
+        """
+        import cv2
+        deadline = since + self.timeout
+        previous = None
+        still_pairs = 0
+        moved = False
+        timestamp = since
+
+        while True:
+            # Allow one frame interval past the deadline so the timeout path still gets a frame
+            wait = max(0.0, deadline - time.perf_counter()) + 0.1
+            frame_time, frame = camera.read_after(timestamp + 1e-6, timeout=wait)
+            if frame is None:
+                break
+            timestamp = frame_time
+
+            gray = cv2.cvtColor(self._crop(frame, roi), cv2.COLOR_BGR2GRAY)
+            if previous is not None:
+                motion = self._motion(gray, previous, full_frame=not roi or roi.get("x_start") is None)
+                if motion >= self.motion_threshold:
+                    moved = True
+                    still_pairs = 0
+                elif moved or timestamp >= since + self.min_delay:
+                    still_pairs += 1
+                if still_pairs >= self.stable_pairs:
+                    settle_time = timestamp - since
+                    self._record(index, settle_time, settled=True)
+                    return True, settle_time, timestamp
+            previous = gray
+
+            if timestamp >= deadline:
+                break
+
+        settle_time = timestamp - since
+        self._record(index, settle_time, settled=False)
+        return False, settle_time, timestamp
+
+    def print_summary(self):
+        """Print settle time statistics per servo index."""
+        if not self.stats:
+            print("No settle statistics recorded.")
+            return
+        print("Settle time per index (mean / max ms, timeouts):")
+        for index in sorted(self.stats):
+            s = self.stats[index]
+            mean_ms = 1000 * s["total_s"] / s["count"]
+            print(f"  {index:>5}: {mean_ms:7.1f} / {1000 * s['max_s']:7.1f} ms, {s['timeouts']} timeouts")
+
+    def _record(self, index, settle_time, settled):
+        s = self.stats.setdefault(index, {"count": 0, "total_s": 0.0, "max_s": 0.0, "timeouts": 0})
+        s["count"] += 1
+        s["total_s"] += settle_time
+        s["max_s"] = max(s["max_s"], settle_time)
+        if not settled:
+            s["timeouts"] += 1
+
+    def _motion(self, gray, previous, full_frame):
+        import cv2
+        difference = cv2.absdiff(gray, previous)
+        if not full_frame:
+            return cv2.mean(difference)[0]
+        # Mean per block, then the most active block
+        height, width = difference.shape[:2]
+        blocks = (max(1, width // self.block_size), max(1, height // self.block_size))
+        return float(cv2.resize(difference, blocks, interpolation=cv2.INTER_AREA).max())
+
+    @staticmethod
+    def _crop(frame, roi):
+        if not roi or roi.get("x_start") is None:
+            return frame
+        return frame[
+            roi["y_start"]:roi["y_start"] + roi["height"],
+            roi["x_start"]:roi["x_start"] + roi["width"]
+        ]
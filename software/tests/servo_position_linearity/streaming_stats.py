@@ -0,0 +1,188 @@
+"""
+Streaming per-index statistics for the linearity sweeps.
+
+The runner used to rebuild a DataFrame from every sample and redo the
+groupby median/std after each outer sweep, so each plot got slower the longer
+a test ran. IndexedStats keeps O(1) state per servo index instead:
+
+    count / mean / variance   Welford's online algorithm
+    min / max                 running extremes
+    quantiles                 P² estimators (Jain & Chlamtac), exact below 5 samples
+
+    stats = IndexedStats(quantiles=(0.5,))
+    stats.update(index=700, value=12.31)
+    snapshot = stats.snapshot(lower_index=200, upper_index=850)
+    snapshot["median"], snapshot["std"]
+"""
+import math
+
+import numpy as np
+
+
+class P2Quantile:
+    """Constant-memory estimate of a single quantile with the P² algorithm."""
+
+    __slots__ = ("p", "heights", "positions", "desired", "increments")
+
+    def __init__(self, p):
+        if not 0.0 < p < 1.0:
+            raise ValueError("Quantile must be between 0 and 1")
+        self.p = p
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1.0, 1.0 + 2.0 * p, 1.0 + 4.0 * p, 3.0 + 2.0 * p, 5.0]
+        self.increments = (0.0, p / 2.0, p, (1.0 + p) / 2.0, 1.0)
+
+    def update(self, x):
+        heights = self.heights
+        if len(heights) < 5:
+            heights.append(x)
+            heights.sort()
+            return
+
+        # Find the cell x falls in, stretching the end markers if needed
+        if x < heights[0]:
+            heights[0] = x
+            k = 0
+        elif x >= heights[4]:
+            heights[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= heights[k + 1]:
+                k += 1
+
+        positions = self.positions
+        for i in range(k + 1, 5):
+            positions[i] += 1
+        desired = self.desired
+        for i in range(5):
+            desired[i] += self.increments[i]
+
+        # Move the middle markers towards their desired positions
+        for i in range(1, 4):
+            d = desired[i] - positions[i]
+            if (d >= 1 and positions[i + 1] - positions[i] > 1) or (d <= -1 and positions[i - 1] - positions[i] < -1):
+                step = 1 if d > 0 else -1
+                candidate = self._parabolic(i, step)
+                if not heights[i - 1] < candidate < heights[i + 1]:
+                    candidate = heights[i] + step * (heights[i + step] - heights[i]) / (positions[i + step] - positions[i])
+                heights[i] = candidate
+                positions[i] += step
+
+    def _parabolic(self, i, step):
+        q, n = self.heights, self.positions
+        return q[i] + step / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + step) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - step) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def value(self):
+        heights = self.heights
+        if not heights:
+            return math.nan
+        if len(heights) < 5:
+            # Exact quantile of the few samples seen so far, like numpy's linear method
+            rank = self.p * (len(heights) - 1)
+            low = int(rank)
+            high = min(low + 1, len(heights) - 1)
+            return heights[low] + (rank - low) * (heights[high] - heights[low])
+        return heights[2]
+
+
+class RunningStats:
+    """Count, mean, variance, extremes and quantiles of one stream."""
+
+    __slots__ = ("count", "mean", "m2", "min", "max", "quantiles")
+
+    def __init__(self, quantiles=(0.5,)):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.quantiles = {p: P2Quantile(p) for p in quantiles}
+
+    def update(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+        for estimator in self.quantiles.values():
+            estimator.update(x)
+
+    @property
+    def variance(self):
+        """Sample variance (ddof=1, matching pandas' std)."""
+        return self.m2 / (self.count - 1) if self.count > 1 else math.nan
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance) if self.count > 1 else math.nan
+
+    def quantile(self, p):
+        return self.quantiles[p].value()
+
+
+class IndexedStats:
+    """RunningStats per servo index, with an attempt counter per index."""
+
+    def __init__(self, quantiles=(0.5,), min_attempt=0):
+        """
+        Args:
+            quantiles (tuple of float): Quantiles to estimate; 0.5 is reported as "median".
+            min_attempt (int): Samples up to this attempt number per index are
+                counted but not aggregated (same as analyze_and_plot_data's filter).
+        """
+        self.quantiles = tuple(quantiles)
+        self.min_attempt = min_attempt
+        self.attempts = {}
+        self.stats = {}
+
+    def __len__(self):
+        return len(self.stats)
+
+    def update(self, index, value):
+        attempt = self.attempts.get(index, 0) + 1
+        self.attempts[index] = attempt
+        if attempt <= self.min_attempt:
+            return
+        stats = self.stats.get(index)
+        if stats is None:
+            stats = self.stats[index] = RunningStats(self.quantiles)
+        stats.update(value)
+
+    def update_many(self, indices, values):
+        for index, value in zip(indices, values):
+            self.update(index, value)
+
+    def snapshot(self, lower_index=None, upper_index=None):
+        """
+        Export the current statistics for plotting.
+
+        Returns:
+            dict of numpy arrays sorted by index: index, count, mean, std, min,
+            max, plus "median" and "q<p>" columns for the tracked quantiles.
+            Every array is empty when no index is in range.
+        """
+        indices = sorted(
+            index for index in self.stats
+            if (lower_index is None or index >= lower_index) and (upper_index is None or index <= upper_index)
+        )
+        rows = [self.stats[index] for index in indices]
+        snapshot = {
+            "index": np.array(indices),
+            "count": np.array([s.count for s in rows], dtype=int),
+            "mean": np.array([s.mean for s in rows], dtype=float),
+            "std": np.array([s.std for s in rows], dtype=float),
+            "min": np.array([s.min for s in rows], dtype=float),
+            "max": np.array([s.max for s in rows], dtype=float),
+        }
+        for p in self.quantiles:
+            name = "median" if p == 0.5 else f"q{p:g}"
+            snapshot[name] = np.array([s.quantile(p) for s in rows], dtype=float)
+        return snapshot
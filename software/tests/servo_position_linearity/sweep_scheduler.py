@@ -0,0 +1,196 @@
+"""
+Choose which servo indices to measure in the next sweep.
+
+The linearity runner used to visit every index of range(900, 275, -5) once per
+sweep, forever. SweepScheduler instead picks the round_size indices whose
+next sample is worth most, and says when the calibration is good enough:
+
+    scheduler = SweepScheduler(SWEEP_INDICES, stats, calibrator, rel_tolerance=0.005)
+    while not scheduler.done():
+        for index in scheduler.next_sweep():
+            ...measure, then stats.update(index, x_mm) and calibrator.update(index, x_mm)
+
+The priority of an index is the expected gain of one more sample there,
+from the current per-index variance and the regression residuals:
+
+- towards rel_tolerance (the steps-per-mm confidence interval), the fraction
+  of the slope variance the sample removes. Indices far from the middle of
+  the fit range add leverage; noisy ones, and ones whose mean sits off the
+  line where the curve is nonlinear, add residual variance and gain less.
+- towards target_se (standard error of every index's mean), the fraction of
+  the remaining squared error the sample removes, so noisy indices get more
+  samples and converged ones none.
+
+Indices in the fit range with fewer than min_samples samples, and indices
+outside it with none, always come first, so the whole range stays covered
+and nonlinear stretches still show up in the plots without paying
+min_samples measurements for indices the fit never uses.
+
+The runner reports every attempt with record_attempt(), including failed
+detections. An index whose detection fails max_failures times in a row is
+dropped from the schedule and from the stopping rule, so a hole the camera
+can't see at one position doesn't hold every round and keep the run going
+forever.
+
+A sweep visits its indices in the direction of the full sweep, so every
+sample is approached from the same side as before.
+"""
+import math
+
+
+class SweepScheduler:
+    """Allocate measurements to servo indices and decide when to stop."""
+
+    def __init__(self, indices, stats, calibrator, round_size=40, min_samples=2, fit_range=None,
+                 prior_std=0.01, rel_tolerance=None, target_se=None, max_failures=5):
+        """
+        Args:
+            indices (sequence of int): Every index that can be measured, in sweep order.
+            stats (IndexedStats): Per-index statistics the runner updates.
+            calibrator (LinearCalibrator): Fit the runner updates.
+            round_size (int): Indices visited per sweep.
+            min_samples (int): Samples every index in the fit range gets before
+                priorities apply; indices outside it get one.
+            fit_range (tuple): (lower, upper) indices of the calibration fit; residual
+                and leverage terms are only used inside it. None uses all indices.
+            prior_std (float): Standard deviation in mm assumed for indices without a variance yet.
+            rel_tolerance (float): Stop once the steps-per-mm 95% CI is within this relative tolerance.
+            target_se (float): Stop once every index's mean has at most this standard error in mm.
+            max_failures (int): Failed detections in a row before an index is dropped.
+        """
+        self.indices = list(indices)
+        self.stats = stats
+        self.calibrator = calibrator
+        self.round_size = min(round_size, len(self.indices))
+        self.min_samples = min_samples
+        self.fit_range = fit_range or (min(self.indices), max(self.indices))
+        self.prior_var = prior_std ** 2
+        self.rel_tolerance = rel_tolerance
+        self.target_se = target_se
+        self.max_failures = max_failures
+        self.descending = len(self.indices) > 1 and self.indices[0] > self.indices[-1]
+
+        self.rounds = 0
+        self.visits = 0
+        self.failures = {}  # index -> failed detections in a row
+        self.dropped = set()
+
+    def record_attempt(self, index, detected):
+        """Record whether the measurement at index produced a sample."""
+        if detected:
+            self.failures.pop(index, None)
+            return
+        self.failures[index] = self.failures.get(index, 0) + 1
+        if self.failures[index] >= self.max_failures and index not in self.dropped:
+            self.dropped.add(index)
+            print(f"Scheduler: dropping index {index} after {self.failures[index]} failed detections in a row")
+
+    @property
+    def active_indices(self):
+        """Indices still scheduled, in sweep order."""
+        return [index for index in self.indices if index not in self.dropped]
+
+    def _count(self, index):
+        stats = self.stats.stats.get(index)
+        return stats.count if stats is not None else 0
+
+    def _pooled_variance(self):
+        variances = [s.variance for s in self.stats.stats.values() if s.count > 1]
+        return sum(variances) / len(variances) if variances else self.prior_var
+
+    def _in_fit_range(self, index):
+        return self.fit_range[0] <= index <= self.fit_range[1]
+
+    def _required(self, index):
+        return self.min_samples if self._in_fit_range(index) else 1
+
+    def priorities(self):
+        """
+        Expected gain of one more sample at every index; math.inf below the required samples.
+
+        Returns:
+            dict: index -> priority.
+        """
+        pooled = self._pooled_variance()
+        calibrate = (self.rel_tolerance is not None and self.calibrator.ready
+                     and self.calibrator.weight > 3.0 and self.calibrator.residual_std > 0.0
+                     and not self.calibrator.converged(self.rel_tolerance))
+        if calibrate:
+            fit_variance = self.calibrator.residual_std ** 2
+        priorities = {}
+        for index in self.active_indices:
+            count = self._count(index)
+            if count < self._required(index):
+                priorities[index] = math.inf
+                continue
+            stats = self.stats.stats[index]
+            variance = stats.variance if count > 1 else pooled
+
+            priority = 0.0
+            if calibrate and self._in_fit_range(index):
+                # Fraction of the slope variance (residual variance / Sxx) one sample removes:
+                # leverage is the relative growth of Sxx, noise the relative growth of the
+                # residual variance from a noisy or off-line sample
+                residual = stats.mean - self.calibrator.predict(index)
+                leverage = (index - self.calibrator.mean_index) ** 2 / self.calibrator.sxx
+                noise = ((variance + residual * residual - fit_variance)
+                         / ((self.calibrator.weight - 2.0) * fit_variance))
+                priority += max(0.0, leverage - noise)
+            if self.target_se is not None and self.standard_error(index) > self.target_se:
+                # Fraction of the target squared standard error one sample removes
+                priority += variance / (count * (count + 1)) / self.target_se ** 2
+            elif self.rel_tolerance is None and self.target_se is None:
+                # No targets: spread samples by variance
+                priority += variance / (count * (count + 1)) / pooled
+            priorities[index] = priority
+        return priorities
+
+    def next_sweep(self):
+        """
+        Indices to measure in the next sweep, in sweep order.
+
+        Returns:
+            list of int: Up to round_size indices.
+        """
+        priorities = self.priorities()
+        # Unsampled indices tie at inf; take them in sweep order so coverage builds up evenly
+        order = {index: position for position, index in enumerate(self.indices)}
+        ranked = sorted(priorities, key=lambda index: (-priorities[index], order[index]))[:self.round_size]
+        # Don't spend servo cycles on indices that would not help
+        selected = [index for index in ranked if priorities[index] > 0] or ranked
+        self.rounds += 1
+        self.visits += len(selected)
+        return sorted(selected, reverse=self.descending)
+
+    def standard_error(self, index):
+        """Standard error in mm of the mean at index (math.inf below two samples)."""
+        count = self._count(index)
+        if count < 2:
+            return math.inf
+        return self.stats.stats[index].std / math.sqrt(count)
+
+    def max_standard_error(self):
+        return max((self.standard_error(index) for index in self.active_indices), default=math.inf)
+
+    def done(self):
+        """True once every configured confidence target is met (never without targets) or nothing is left to measure."""
+        if self.rel_tolerance is None and self.target_se is None:
+            return False
+        if not self.active_indices:
+            # Every index was dropped; more sweeps can't measure anything
+            return True
+        if any(self._count(index) < self._required(index) for index in self.active_indices):
+            return False
+        if self.rel_tolerance is not None and not self.calibrator.converged(self.rel_tolerance):
+            return False
+        if self.target_se is not None and self.max_standard_error() > self.target_se:
+            return False
+        return True
+
+    def summary(self):
+        return (
+            f"{self.rounds} sweeps, {self.visits} measurements "
+            f"({self.visits / max(len(self.indices), 1):.1f} full-sweep equivalents), "
+            f"max standard error {1000 * self.max_standard_error():.2f} um, "
+            f"{len(self.dropped)} indices dropped"
+        )
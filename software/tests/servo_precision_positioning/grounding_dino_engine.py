@@ -0,0 +1,176 @@
+import os
+
+import torch
+from transformers import AutoProcessor, AutoModelForZeroShotObjectDetection
+
+QUANTIZED_MODEL_FILENAME = "quantized_model.pt"
+
+
+class GroundingDinoEngine:
+    """
+    CPU-friendly batched inference for the Grounding DINO rectangle detector.
+
+    - The constant prompt is tokenized once and reused for every batch.
+    - detect() runs a whole list of crops through the model in one forward
+      pass; callers collect a cycle's crops and pass them together.
+    - Inference runs under torch.inference_mode with a fixed thread count.
+    - Box size filtering and leftmost-center selection are tensor ops.
+
+    The model is loaded on the first detection (or an explicit load()), not
+    when the engine is created. With cache_dir set, the processor and model
+    are kept in a local directory after the first download; with quantize set
+    the Linear layers are dynamically quantized to int8 for CPU inference and
+    the quantized model is what gets cached.
+    """
+
+    def __init__(self, model_id="IDEA-Research/grounding-dino-tiny", text="rectangle.",
+                 num_threads=None, device=None, cache_dir=None, quantize=False):
+        """
+        Args:
+            model_id (str): Hugging Face model id.
+            text (str): Detection prompt, tokenized once.
+            num_threads (int): torch intra-op threads; defaults to the CPU count.
+            device (str): "cuda" or "cpu"; defaults to cuda when available.
+            cache_dir (str): Optional local checkpoint cache directory.
+            quantize (bool): Use an int8 dynamically quantized model (CPU only).
+        """
+        self.model_id = model_id
+        self.text = text
+        self.num_threads = num_threads
+        self.device = device
+        self.cache_dir = cache_dir
+        self.quantize = quantize
+
+        self.processor = None
+        self.model = None
+        self._text_inputs = None
+
+    @property
+    def loaded(self):
+        return self.model is not None
+
+    def load(self):
+        """Load the processor and model (from the local cache when available)."""
+        if self.loaded:
+            return self
+
+        self.device = self.device or ("cuda" if torch.cuda.is_available() else "cpu")
+        if self.quantize and self.device != "cpu":
+            raise ValueError("Quantized inference is only supported on the CPU")
+        if self.device == "cpu":
+            torch.set_num_threads(self.num_threads or os.cpu_count() or 1)
+
+        cache_path = self._cache_path()
+        if cache_path is not None and os.path.isdir(cache_path):
+            self.processor = AutoProcessor.from_pretrained(cache_path)
+            if self.quantize:
+                self.model = torch.load(os.path.join(cache_path, QUANTIZED_MODEL_FILENAME), weights_only=False)
+            else:
+                self.model = AutoModelForZeroShotObjectDetection.from_pretrained(cache_path)
+        else:
+            self.processor = AutoProcessor.from_pretrained(self.model_id)
+            self.model = AutoModelForZeroShotObjectDetection.from_pretrained(self.model_id)
+            if self.quantize:
+                self.model = torch.ao.quantization.quantize_dynamic(
+                    self.model, {torch.nn.Linear}, dtype=torch.qint8
+                )
+            if cache_path is not None:
+                self._save(cache_path)
+
+        self.model = self.model.to(self.device)
+        self.model.eval()
+
+        # Tokenize the constant prompt once
+        self._text_inputs = self.processor.tokenizer([self.text], return_tensors="pt")
+        return self
+
+    def _cache_path(self):
+        if self.cache_dir is None:
+            return None
+        name = self.model_id.replace("/", "--") + ("-int8" if self.quantize else "")
+        return os.path.join(self.cache_dir, name)
+
+    def _save(self, cache_path):
+        os.makedirs(cache_path, exist_ok=True)
+        self.processor.save_pretrained(cache_path)
+        if self.quantize:
+            # Quantized modules can't round-trip through save_pretrained
+            torch.save(self.model, os.path.join(cache_path, QUANTIZED_MODEL_FILENAME))
+        else:
+            self.model.save_pretrained(cache_path)
+
+    def detect(self, images, box_threshold=0.2, text_threshold=0.2,
+               min_width=None, max_width=None, min_height=None, max_height=None):
+        """
+        Run the detector on a batch of PIL crops.
+
+        Returns:
+            list: For each image, {"x": ..., "y": ..., "score": ...} of the leftmost
+            box center that passes the size filter, or None.
+        """
+        if not images:
+            return []
+        self.load()
+
+        image_inputs = self.processor.image_processor(images, return_tensors="pt")
+        batch = len(images)
+        inputs = {name: value.to(self.device) for name, value in image_inputs.items()}
+        for name, value in self._text_inputs.items():
+            inputs[name] = value.expand(batch, -1).to(self.device)
+
+        with torch.inference_mode():
+            outputs = self.model(**inputs)
+
+        raw_results = self.processor.post_process_grounded_object_detection(
+            outputs,
+            inputs["input_ids"],
+            box_threshold=box_threshold,
+            text_threshold=text_threshold,
+            target_sizes=[(image.size[1], image.size[0]) for image in images]
+        )
+
+        return [
+            select_leftmost_center(result.get("boxes"), min_width, max_width, min_height, max_height,
+                                   scores=result.get("scores"))
+            for result in raw_results
+        ]
+
+
+def select_leftmost_center(boxes, min_width=None, max_width=None, min_height=None, max_height=None,
+                           scores=None):
+    """
+    Filter boxes by size and return the center of the leftmost one.
+
+    Args:
+        boxes (torch.Tensor): (N, 4) boxes as x_min, y_min, x_max, y_max.
+        scores (torch.Tensor): Optional (N,) box scores.
+
+    Returns:
+        dict: {"x": ..., "y": ...} (plus "score" when scores are given) or None
+        if no box passes the filter.
+    """
+    if boxes is None or boxes.numel() == 0:
+        return None
+
+    widths = boxes[:, 2] - boxes[:, 0]
+    heights = boxes[:, 3] - boxes[:, 1]
+    keep = torch.ones(boxes.shape[0], dtype=torch.bool, device=boxes.device)
+    if min_width is not None:
+        keep &= widths >= min_width
+    if max_width is not None:
+        keep &= widths <= max_width
+    if min_height is not None:
+        keep &= heights >= min_height
+    if max_height is not None:
+        keep &= heights <= max_height
+    if not bool(keep.any()):
+        return None
+
+    centers = (boxes[:, :2] + boxes[:, 2:]) / 2.0
+    center_x = centers[:, 0].masked_fill(~keep, float("inf"))
+    leftmost = int(torch.argmin(center_x))
+    x, y = centers[leftmost].tolist()
+    result = {"x": x, "y": y}
+    if scores is not None and scores.numel() == boxes.shape[0]:
+        result["score"] = float(scores[leftmost])
+    return result
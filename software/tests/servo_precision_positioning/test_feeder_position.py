@@ -1,33 +1,76 @@
-import torch
 from PIL import Image, ImageDraw
-from transformers import AutoProcessor, AutoModelForZeroShotObjectDetection
+import argparse
+import copy
+import os
 import serial
 import time
-import cv2
 import software.tests.servo_position_linearity.messages as messages
-import csv
-from process import analyze_and_plot_data
+from software.tests.servo_position_linearity.camera_capture import CameraCapture
+from software.tests.detectors import DETECTORS, get_detector
+from software.tests.measurement_log import MeasurementLog
+from software.tests.report_worker import ReportWorker
+from software.tests.image_archiver import ArchivePolicy, ImageArchiver, OUTLIER, FAILURE
+from software.tests.servo_position_linearity.streaming_stats import IndexedStats
+from software.tests.servo_position_linearity.linear_calibrator import LinearCalibrator
 
 result_list = []
 
 # Initialize the model and processor
 model_id = "IDEA-Research/grounding-dino-tiny"
-device = "cuda" if torch.cuda.is_available() else "cpu"
+detection_text = "rectangle."
 
-processor = AutoProcessor.from_pretrained(model_id)
-model = AutoModelForZeroShotObjectDetection.from_pretrained(model_id).to(device)
+# Local checkpoint cache so later runs don't download/convert the model again
+MODEL_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "feeder_models")
 
-# Clear the CSV file and write the header once at the beginning
-def initialize_csv(filename):
-    with open(filename, mode="w", newline="") as file:
-        writer = csv.DictWriter(file, fieldnames=["angle", "x", "y", "index"])
-        writer.writeheader()
+# Created on first use so torch/transformers are only imported when the
+# Grounding DINO detector is actually needed
+engine = None
 
-# Function to append a row to the CSV file
-def append_to_csv(filename, row):
-    with open(filename, mode="a", newline="") as file:
-        writer = csv.DictWriter(file, fieldnames=row.keys())
-        writer.writerow(row)
+def get_engine(quantize=False):
+    """Return the shared Grounding DINO engine, importing torch/transformers on first use."""
+    global engine
+    if engine is None:
+        from software.tests.servo_precision_positioning.grounding_dino_engine import GroundingDinoEngine
+
+        engine = GroundingDinoEngine(model_id, text=detection_text,
+                                     cache_dir=MODEL_CACHE_DIR, quantize=quantize)
+    return engine
+
+# Region cropped around the component, matching crop_by_center(pil_image, 575, 400, 200, 200)
+COMPONENT_ROI = {"x_start": 475, "y_start": 300, "width": 200, "height": 200}
+
+# Detector backend for this run, chosen with --detector
+detector = None
+
+# Writes crops and annotated images on a background thread, set up in main
+archiver = None
+
+# Captures waiting to be run through the detector as one batch
+pending_detections = []
+
+MEASUREMENT_LOG_FILENAME = "data.mlog"
+MEASUREMENT_FIELDS = [("angle", "<i4"), ("x", "<f8"), ("y", "<f8"), ("index", "<i4")]
+
+# Analysis plots are rendered in a worker process, which imports the analysis stack itself
+ANALYSIS_REPORT = "analysis"
+REPORT_RENDERERS = {
+    ANALYSIS_REPORT: "software.tests.servo_position_linearity.analyze_linearity_data:analyze_and_plot_data",
+}
+
+# Open measurement logs by filename
+measurement_logs = {}
+
+# Updated with every detection, so the report worker doesn't re-read the log
+position_stats = IndexedStats()
+position_calibrator = LinearCalibrator()
+
+# Start a new measurement log, replacing any previous run
+def initialize_log(filename):
+    measurement_logs[filename] = MeasurementLog(filename, MEASUREMENT_FIELDS, truncate=True)
+
+# Buffered append of a row to the measurement log
+def append_to_log(filename, row):
+    measurement_logs[filename].append(row)
 
 def crop_by_center(image, center_x, center_y, crop_width, crop_height, output_path=None):
     # Calculate half dimensions
@@ -43,13 +86,13 @@ def crop_by_center(image, center_x, center_y, crop_width, crop_height, output_pa
     # Crop the image
     cropped_image = image.crop((left, upper, right, lower))
 
-    #if output_path is not None:
-    cropped_image.save("crop.jpg")
+    # Encoded and written by the archiver thread
+    archiver.submit(cropped_image, output_path or "crop.jpg")
     
     return cropped_image
 
-def draw_dot_on_image(pil_image, x, y, output_path, dot_radius=3, dot_color="red"):
-    """Draws a dot (circle) at the given (x, y) coordinates on a PIL Image."""
+def draw_dot_on_image(pil_image, x, y, output_path=None, dot_radius=3, dot_color="red"):
+    """Draws a dot (circle) at the given (x, y) coordinates on a PIL Image, saving it if output_path is given."""
     draw = ImageDraw.Draw(pil_image)
 
     # Calculate the bounding box of the dot circle
@@ -61,88 +104,25 @@ def draw_dot_on_image(pil_image, x, y, output_path, dot_radius=3, dot_color="red
     # Draw an ellipse (circle)
     draw.ellipse((left, upper, right, lower), fill=dot_color)
     
-    pil_image.save(output_path)
+    if output_path is not None:
+        pil_image.save(output_path)
     return pil_image
 
 def get_detection_results(pil_image, text, box_threshold=0.2, text_threshold=0.2,
                           min_width=None, max_width=None, 
                           min_height=None, max_height=None):
-    inputs = processor(images=pil_image, text=text, return_tensors="pt").to(device)
-    with torch.no_grad():
-        outputs = model(**inputs)
-
-    width, height = pil_image.size
-    raw_results = processor.post_process_grounded_object_detection(
-        outputs,
-        inputs.input_ids,
+    if text != get_engine().text:
+        raise ValueError(f"The detection engine was set up for {get_engine().text!r}, not {text!r}")
+
+    return get_engine().detect(
+        [pil_image],
         box_threshold=box_threshold,
         text_threshold=text_threshold,
-        target_sizes=[(height, width)]
-    )
-
-    if not raw_results:
-      return None
-
-    boxes = raw_results[0].get('boxes')
-    if boxes is None or (isinstance(boxes, torch.Tensor) and boxes.numel() == 0) or (isinstance(boxes, list) and len(boxes) == 0):
-        return None
-
-    # Check and convert if needed
-    def to_list(x):
-        if torch.is_tensor(x):
-            return x.cpu().tolist()
-        return x
-
-    boxes = to_list(boxes)
-    scores = to_list(raw_results[0].get('scores', []))
-    labels = to_list(raw_results[0].get('labels', []))
-
-    filtered_boxes = []
-    filtered_scores = []
-    filtered_labels = []
-    filtered_centers = []
-
-    for box, score, label in zip(boxes, scores, labels):
-        x_min, y_min, x_max, y_max = box
-        box_w = x_max - x_min
-        box_h = y_max - y_min
-
-        # Apply width/height constraints
-        if min_width is not None and box_w < min_width:
-            continue
-        if max_width is not None and box_w > max_width:
-            continue
-        if min_height is not None and box_h < min_height:
-            continue
-        if max_height is not None and box_h > max_height:
-            continue
-
-        # Compute center coordinates
-        center_x = (x_min + x_max) / 2.0
-        center_y = (y_min + y_max) / 2.0
-
-        filtered_boxes.append(box)
-        filtered_scores.append(score)
-        filtered_labels.append(label)
-        filtered_centers.append((center_x, center_y))
-
-    if not filtered_centers:
-        return None  # No valid detections
-
-    # Find the bounding box with the smallest x-coordinate
-    if filtered_centers:
-        min_x_center = float('inf')
-        min_x_center_index = -1
-
-        for index, center in enumerate(filtered_centers):
-            if center[0] < min_x_center:
-                min_x_center = center[0]
-                min_x_center_index = index
-            
-        if min_x_center_index != -1:
-            return {"x": filtered_centers[min_x_center_index][0], "y": filtered_centers[min_x_center_index][1]}
-
-    return None
+        min_width=min_width,
+        max_width=max_width,
+        min_height=min_height,
+        max_height=max_height
+    )[0]
 
 
 def writeMessage(message, ser):
@@ -151,13 +131,12 @@ def writeMessage(message, ser):
     _ = ser.read(4)
 
 def capture_and_save(camera, filename, angle, index, ser, min_x_values, max_x_values):
-    # Capture the image
-    camera = cv2.VideoCapture(0)
-    #time.sleep(0.2)
-    ret, captured_image = camera.read()
-    camera.release() # Release camera when done with this loop
+    import cv2
 
-    if not ret:
+    # Capture the first frame taken after the servo command was acked
+    _, captured_image = camera.read_after(time.perf_counter())
+
+    if captured_image is None:
         print("error reading camera")
         return  # Exit this function if the image is not read
 
@@ -168,24 +147,35 @@ def capture_and_save(camera, filename, angle, index, ser, min_x_values, max_x_va
     # Crop image
     component_crop = crop_by_center(pil_image, 575, 400, 200, 200)
 
-    detection_text = "rectangle."
-
-    # Get the coordinates of the rectangle
-    detection_results = get_detection_results(
-        component_crop, 
-        detection_text, 
-        box_threshold=0.2, 
-        text_threshold=0.2,
-        min_width=20, 
-        max_width=100, 
-        min_height=20, 
-        max_height=100
+    # Queue the frame; it is detected together with the other captures of this
+    # cycle when flush_detections() runs
+    pending_detections.append(
+        (captured_image, component_crop, filename, angle, index, min_x_values, max_x_values)
     )
-    
+
+def flush_detections():
+    """Run every queued capture through the detector and record the results."""
+    queued = pending_detections[:]
+    pending_detections.clear()
+    if not queued:
+        return
+
+    results = detector.locate_batch([item[0] for item in queued], COMPONENT_ROI)
+    for (_, component_crop, *args), (position, _) in zip(queued, results):
+        detection_results = None
+        if position is not None:
+            # Record positions relative to the crop, as before
+            detection_results = {
+                "x": position[0] - COMPONENT_ROI["x_start"],
+                "y": position[1] - COMPONENT_ROI["y_start"],
+            }
+        record_detection(detection_results, component_crop, *args)
+
+def record_detection(detection_results, component_crop, filename, angle, index, min_x_values, max_x_values):
     x = None
     y = None
     
-    save_image = False
+    archive_image = False
 
     # Handle the result from get_detection_results
     if detection_results:
@@ -199,36 +189,68 @@ def capture_and_save(camera, filename, angle, index, ser, min_x_values, max_x_va
               "y": y,
               "index": index
           }
-         append_to_csv(filename, row)  # Save immediately to CSV
+         append_to_log(filename, row)  # Buffered, flushed in blocks
+         position_stats.update(index, x)
+         position_calibrator.update(index, x)
          result_list.append(row)  # Optional: Keep in-memory list if needed
          output_img_path = ''
 
          # Check for new min/max x and save image if needed
          if index not in min_x_values or x < min_x_values[index]:
               min_x_values[index] = x
-              save_image = True
+              archive_image = True
               output_img_path = f"img_{index}_{angle}_min.jpg"
               print(f"New min x found for index {index}: {x}")
 
          if index not in max_x_values or x > max_x_values[index]:
               max_x_values[index] = x
-              save_image = True
+              archive_image = True
               output_img_path = f"img_{index}_{angle}_max.jpg"
               print(f"New max x found for index {index}: {x}")
 
-         # Turn off saving an image for now
-         save_image = False
-         if save_image:
-             # Draw the dot on a *copy* of the cropped image, not the function!
-             draw_dot_on_image(component_crop.copy(), x, y, output_img_path)
+         if archive_image:
+             # The archiver draws the dot on its own copy of the crop; saving
+             # new min/max images is controlled by --archive-outliers
+             archiver.submit(component_crop, output_img_path, kind=OUTLIER,
+                             annotate=lambda image: draw_dot_on_image(image, x, y))
 
     else:
          print(f"No rectangle detected at angle {angle}")
+         archiver.submit(component_crop, f"img_{index}_{angle}_failed_{time.time():.3f}.jpg", kind=FAILURE)
 
 # Example usage
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Feeder positioning lifespan test")
+    parser.add_argument("--detector", choices=sorted(DETECTORS), default="grounding_dino",
+                        help="Backend used to locate the component rectangle")
+    parser.add_argument("--quantize", action="store_true",
+                        help="Use an int8 quantized Grounding DINO model on the CPU")
+    parser.add_argument("--archive-every", type=int, default=1,
+                        help="Save the component crop every N captures (0 disables)")
+    parser.add_argument("--archive-outliers", action="store_true",
+                        help="Save annotated crops of new min/max positions")
+    parser.add_argument("--archive-failures", action="store_true",
+                        help="Save crops where no rectangle was detected")
+    parser.add_argument("--archive-max-rate", type=float, default=None,
+                        help="Save at most this many images per second")
+    args = parser.parse_args()
+
+    archiver = ImageArchiver(policy=ArchivePolicy(
+        every=args.archive_every,
+        outliers=args.archive_outliers,
+        failures=args.archive_failures,
+        max_rate=args.archive_max_rate,
+    )).start()
+
+    if args.detector == "grounding_dino":
+        # Warm-start the model before the feeder starts moving
+        detector = get_detector(args.detector, text=detection_text,
+                                engine=get_engine(args.quantize).load())
+    else:
+        detector = get_detector(args.detector)
 
-    initialize_csv("data.csv")
+    initialize_log(MEASUREMENT_LOG_FILENAME)
+    report_worker = ReportWorker(REPORT_RENDERERS).start()
     # Connect to the feeder
     ser = serial.Serial(
         port='/dev/ttyACM0',  # Replace with your serial porQt
@@ -238,7 +260,7 @@ if __name__ == "__main__":
         bytesize=serial.EIGHTBITS,
         timeout=5
     )
-    camera = None
+    camera = CameraCapture(0).start()
 
     # Open the connection if it's not already open
     if not ser.is_open:
@@ -256,25 +278,43 @@ if __name__ == "__main__":
     FINAL_ANGLE = 170
     writeMessage(messages.rotate_servo(0, FINAL_ANGLE, 10), ser)
     #exit()
-    while count < 500:
+    try:
+        while count < 500:
 
-        # Write itermediate positon
-        writeMessage(messages.rotate_servo(0, END_ANGLE + 43, SPEED), ser) # 43.6539312 degrees
-        capture_and_save(camera, "data.csv", END_ANGLE, 0, ser, min_x_values, max_x_values)
+            # Write itermediate positon
+            writeMessage(messages.rotate_servo(0, END_ANGLE + 43, SPEED), ser) # 43.6539312 degrees
+            capture_and_save(camera, MEASUREMENT_LOG_FILENAME, END_ANGLE, 0, ser, min_x_values, max_x_values)
 
-        # Write its position
-        writeMessage(messages.rotate_servo(0, END_ANGLE, SPEED), ser)
-        capture_and_save(camera, "data.csv", END_ANGLE, 1, ser, min_x_values, max_x_values)
+            # Write its position
+            writeMessage(messages.rotate_servo(0, END_ANGLE, SPEED), ser)
+            capture_and_save(camera, MEASUREMENT_LOG_FILENAME, END_ANGLE, 1, ser, min_x_values, max_x_values)
         
 
-        writeMessage(messages.rotate_servo(0, FINAL_ANGLE, SPEED), ser)
-
-        if index == 0:
-            index = 1
-        else:
-            index = 0
-
-        count += 1
-
-        if count % 10 == 0:
-            analyze_and_plot_data("data.csv", 0)
\ No newline at end of file
+            writeMessage(messages.rotate_servo(0, FINAL_ANGLE, SPEED), ser)
+
+            # Run both captures of this cycle through the detector in one batch
+            flush_detections()
+
+            if index == 0:
+                index = 1
+            else:
+                index = 0
+
+            count += 1
+
+            if count % 10 == 0:
+                # Rendered by the report worker so the feeder keeps cycling meanwhile
+                measurement_logs[MEASUREMENT_LOG_FILENAME].flush()
+                # Captures are at index 0 and 1. The job carries copies of the statistics so far;
+                # the queue pickles them on its own thread while detections keep updating them
+                report_worker.submit(ANALYSIS_REPORT, {
+                    "output_file": MEASUREMENT_LOG_FILENAME, "min_attempt": 0, "lower_index": 0, "upper_index": 1,
+                    "stats": copy.deepcopy(position_stats), "calibrator": copy.copy(position_calibrator),
+                })
+    finally:
+        # Write any rows still buffered, and free the camera even if the run was interrupted
+        camera.release()
+        ser.close()
+        measurement_logs[MEASUREMENT_LOG_FILENAME].close()
+        report_worker.close()
+        archiver.close()
@@ -1,42 +1,308 @@
-import serial
-import signal
+"""
+Capture, decode and replay serial traffic.
+
+The old logger busy-polled ser.in_waiting and printed UTF-8 text, pegging a
+core. This one blocks in ser.read() with a timeout, so it is idle while the
+line is idle, and writes the raw bytes with monotonic timestamps to rotating
+binary log files that can be decoded or replayed later:
+
+    python -m software.uart_logging capture --port /dev/ttyACM0 --prefix bus --decode frames
+    python -m software.uart_logging dump bus.*.ulog --decode frames
+    python -m software.uart_logging replay bus.*.ulog --speed 10 --port /dev/pts/5
+
+Log file layout (little endian):
+
+    header = b"ULOG" | u16 version | f64 wall clock at open | f64 monotonic clock at open
+    record = f64 monotonic timestamp | u32 length | length bytes
+
+Decoding modes: "text" prints the bytes as UTF-8 (the firmware's UART debug
+log), "frames" splits them into protocol messages with MessageFramer.
+"""
+import argparse
+import glob
+import os
+import re
+import struct
 import sys
+import time
 
-def signal_handler(sig, frame):
-    print("\nCtrl+C detected. Closing serial connection...")
-    if ser and ser.is_open:
-        ser.close()
-    sys.exit(0)
+MAGIC = b"ULOG"
+VERSION = 1
+_HEADER = struct.Struct("<4sHdd")
+_RECORD = struct.Struct("<dI")
 
-if __name__ == "__main__":
-    # Set up signal handler for Ctrl+C
-    signal.signal(signal.SIGINT, signal_handler)
+# Blocking read timeout; bounds how long shutdown takes, not CPU use
+READ_TIMEOUT = 0.5
+READ_SIZE = 4096
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_BACKUP_COUNT = 10
+
+# prefix.NNNN.ulog
+_LOG_NAME = re.compile(r"(.*)\.(\d+)\.ulog")
+
+
+class RotatingCaptureLog:
+    """
+    Append timestamped chunks to prefix.NNNN.ulog files.
+
+    A new file is started once the current one exceeds max_bytes; only the
+    newest backup_count files are kept. The file being written is always
+    kept, so a backup_count of 0 or 1 leaves just that one.
+    """
+
+    def __init__(self, prefix, max_bytes=DEFAULT_MAX_BYTES, backup_count=DEFAULT_BACKUP_COUNT):
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.bytes_logged = 0
+
+        existing = log_files(prefix)
+        self._sequence = _sequence(existing[-1]) + 1 if existing else 0
+        self._file = None
+        self._size = 0
+        self._open_next()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def filename(self):
+        return self._file.name
+
+    def write(self, timestamp, data):
+        if self._size >= self.max_bytes:
+            self._open_next()
+        record = _RECORD.pack(timestamp, len(data)) + data
+        self._file.write(record)
+        self._size += len(record)
+        self.bytes_logged += len(data)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None and not self._file.closed:
+            self._file.close()
+
+    def _open_next(self):
+        self.close()
+        filename = f"{self.prefix}.{self._sequence:04d}.ulog"
+        self._sequence += 1
+        self._file = open(filename, "wb")
+        self._file.write(_HEADER.pack(MAGIC, VERSION, time.time(), time.monotonic()))
+        self._size = _HEADER.size
+
+        keep = max(self.backup_count, 1)
+        for old in log_files(self.prefix)[:-keep]:
+            os.remove(old)
+
+
+def _sequence(filename):
+    return int(_LOG_NAME.fullmatch(filename).group(2))
+
+
+def _log_order(filename):
+    """Sort key: prefix.NNNN.ulog files by prefix and sequence, other names by name."""
+    match = _LOG_NAME.fullmatch(filename)
+    if match is None:
+        return filename, -1
+    return match.group(1), int(match.group(2))
+
+
+def log_files(prefix):
+    """Capture files written with prefix, oldest first."""
+    return sorted(glob.glob(f"{glob.escape(prefix)}.[0-9][0-9][0-9][0-9].ulog"), key=_sequence)
+
+
+def read_log(filenames):
+    """
+    Yield (monotonic timestamp, wall clock time, bytes) for every record.
+
+    A record cut short by a crash at the end of a file is ignored.
+    """
+    for filename in filenames:
+        with open(filename, "rb") as file:
+            magic, version, wall_start, monotonic_start = _HEADER.unpack(file.read(_HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{filename} is not a capture log")
+            if version != VERSION:
+                raise ValueError(f"{filename} has unsupported version {version}")
+            while True:
+                header = file.read(_RECORD.size)
+                if len(header) < _RECORD.size:
+                    break
+                timestamp, length = _RECORD.unpack(header)
+                data = file.read(length)
+                if len(data) < length:
+                    break
+                yield timestamp, wall_start + (timestamp - monotonic_start), data
 
-    ser = None  # Define `ser` outside the try block for access in the signal handler
-    
+
+class Decoder:
+    """Turn captured chunks into printable lines."""
+
+    def __init__(self, mode="text"):
+        self.mode = mode
+        self._framer = None
+        if mode == "frames":
+            from software.framer import MessageFramer
+
+            self._framer = MessageFramer()
+
+    def decode(self, data):
+        if self.mode == "text":
+            return [data.decode("utf-8", errors="ignore")]
+        if self.mode == "hex":
+            return [data.hex(" ") + "\n"]
+        if self.mode == "frames":
+            dropped = self._framer.dropped_bytes
+            lines = [f"{message!r}\n" for message in self._framer.messages(data)]
+            if self._framer.dropped_bytes != dropped:
+                lines.append(f"<{self._framer.dropped_bytes - dropped} unframed bytes>\n")
+            return lines
+        return []
+
+
+def capture(ser, log=None, decoder=None, out=sys.stdout):
+    """
+    Log everything read from ser until interrupted.
+
+    Args:
+        ser (serial.Serial): Open port; its timeout is set to READ_TIMEOUT.
+        log (RotatingCaptureLog): Where raw chunks are written, or None.
+        decoder (Decoder): Optional live decoding printed to out.
+    """
+    ser.timeout = READ_TIMEOUT
+    last_flush = time.monotonic()
     try:
-        # Connect to the serial port
+        while True:
+            # Blocks until data arrives or the timeout passes
+            data = ser.read(ser.in_waiting or 1)
+            now = time.monotonic()
+            if data:
+                if ser.in_waiting:
+                    data += ser.read(min(ser.in_waiting, READ_SIZE))
+                if log is not None:
+                    log.write(now, data)
+                if decoder is not None:
+                    out.write("".join(decoder.decode(data)))
+                    out.flush()
+            if log is not None and now - last_flush >= 1.0:
+                log.flush()
+                last_flush = now
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if log is not None:
+            log.close()
+
+
+def replay(filenames, speed=1.0, sink=None, decoder=None, out=sys.stdout):
+    """
+    Play a capture back with its original timing.
+
+    Args:
+        filenames (list of str): Capture files, oldest first.
+        speed (float): Playback speed factor; 0 plays as fast as possible.
+        sink: Optional object with write(bytes), e.g. a serial port.
+        decoder (Decoder): Optional decoding printed to out.
+    """
+    start = None
+    first_timestamp = None
+    for timestamp, _, data in read_log(filenames):
+        if speed > 0:
+            if start is None:
+                start, first_timestamp = time.monotonic(), timestamp
+            delay = (timestamp - first_timestamp) / speed - (time.monotonic() - start)
+            if delay > 0:
+                time.sleep(delay)
+        if sink is not None:
+            sink.write(data)
+        if decoder is not None:
+            out.write("".join(decoder.decode(data)))
+            out.flush()
+
+
+def _expand(patterns):
+    filenames = []
+    for pattern in patterns:
+        filenames.extend(glob.glob(pattern) or [pattern])
+    return sorted(set(filenames), key=_log_order)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Capture, decode and replay serial traffic")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    capture_parser = commands.add_parser("capture", help="Log a serial port")
+    capture_parser.add_argument("--port", default="/dev/ttyACM0")
+    capture_parser.add_argument("--baudrate", type=int, default=115200)
+    capture_parser.add_argument("--prefix", default="uart", help="Log file prefix; empty to only print")
+    capture_parser.add_argument("--max-bytes", type=int, default=DEFAULT_MAX_BYTES)
+    capture_parser.add_argument("--backups", type=int, default=DEFAULT_BACKUP_COUNT)
+    capture_parser.add_argument("--decode", choices=["none", "text", "hex", "frames"], default="text")
+
+    dump_parser = commands.add_parser("dump", help="Decode capture files")
+    dump_parser.add_argument("files", nargs="+")
+    dump_parser.add_argument("--decode", choices=["text", "hex", "frames"], default="frames")
+    dump_parser.add_argument("--timestamps", action="store_true", help="Prefix each chunk with its wall clock time")
+
+    replay_parser = commands.add_parser("replay", help="Play capture files back")
+    replay_parser.add_argument("files", nargs="+")
+    replay_parser.add_argument("--speed", type=float, default=1.0, help="0 for as fast as possible")
+    replay_parser.add_argument("--port", help="Write the bytes to this serial port")
+    replay_parser.add_argument("--baudrate", type=int, default=115200)
+    replay_parser.add_argument("--decode", choices=["none", "text", "hex", "frames"], default="none")
+
+    args = parser.parse_args()
+    decoder = None if getattr(args, "decode", "none") == "none" else Decoder(args.decode)
+
+    if args.command == "capture":
+        import serial
+
         ser = serial.Serial(
-            port='/dev/ttyACM0',  # Replace with your serial port
-            baudrate=115200,
+            port=args.port,
+            baudrate=args.baudrate,
             parity=serial.PARITY_NONE,
             stopbits=serial.STOPBITS_ONE,
             bytesize=serial.EIGHTBITS,
-            timeout=2  # Adjust timeout as needed
+            timeout=READ_TIMEOUT,
         )
-        print("Connected to serial port. Reading data...")
+        log = RotatingCaptureLog(args.prefix, args.max_bytes, args.backups) if args.prefix else None
+        print(f"Connected to {args.port}" + (f", logging to {log.filename}" if log else ""), file=sys.stderr)
+        try:
+            capture(ser, log, decoder)
+        finally:
+            ser.close()
+            if log is not None:
+                print(f"\nLogged {log.bytes_logged} bytes", file=sys.stderr)
 
-        # Continuously read data from the serial port
-        while True:
-            if ser.in_waiting > 0:  # Check if data is available
-                data = ser.read(ser.in_waiting).decode('utf-8', errors='ignore')  # Decode as UTF-8, ignoring errors
-                print(data, end='')  # Print the data without adding extra newlines
+    elif args.command == "dump":
+        for _, wall_time, data in read_log(_expand(args.files)):
+            lines = decoder.decode(data)
+            if args.timestamps:
+                stamp = time.strftime("%H:%M:%S", time.localtime(wall_time)) + f".{int(wall_time % 1 * 1000):03d}"
+                lines = [f"{stamp} {line}" for line in lines]
+            sys.stdout.write("".join(lines))
 
-    except Exception as e:
-        print(f"Error: {e}")
+    elif args.command == "replay":
+        sink = None
+        if args.port:
+            import serial
 
-    finally:
-        # Ensure the serial connection is closed
-        if ser and ser.is_open:
-            print("Closing serial connection...")
-            ser.close()
+            sink = serial.Serial(port=args.port, baudrate=args.baudrate)
+        try:
+            replay(_expand(args.files), args.speed, sink, decoder)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if sink is not None:
+                sink.close()
+
+
+if __name__ == "__main__":
+    main()